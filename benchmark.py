@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+热点函数微基准测试
+使用固定随机种子生成的 git log 输出和用户表（默认 10000 个提交、2000 个用户），
+测量解析、作者匹配、日期解析和报告渲染的吞吐量，并与保存的基线比较，
+吞吐量下降超过阈值或缺少基线时以非零状态退出
+
+用法:
+    python3 benchmark.py                     # 与基线比较（没有基线时报错退出）
+    python3 benchmark.py --update-baseline   # 保存或重新保存基线
+    python3 benchmark.py parse_log render_report --threshold 0.3
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+from datetime import datetime, timedelta, timezone
+
+from git_operations import GitOperations
+from repo_scanner import UserMatcher, aggregate_commits
+from report_generator import ReportGenerator
+from time_utils import parse_datetime
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+
+def make_users(count, rng):
+    """生成 Gitea 用户表 {login: {'email', 'full_name'}}"""
+    users = {}
+    for i in range(count):
+        login = f"user{i:04d}{rng.choice('abcdefghij')}"
+        users[login] = {
+            'email': f"{login}@example.com",
+            'full_name': f"User {i}"
+        }
+    return users
+
+
+def make_log_lines(commit_count, users, aliases, rng):
+    """生成 git log --numstat 格式的输出行
+    
+    作者分布：60% 用户名一致，20% 只有邮箱一致，10% 别名，10% 外部提交者
+    """
+    logins = list(users)
+    alias_names = list(aliases)
+    start = datetime(2026, 1, 1, tzinfo=timezone(timedelta(hours=8)))
+    lines = []
+    
+    for i in range(commit_count):
+        kind = rng.random()
+        login = rng.choice(logins)
+        if kind < 0.6:
+            name, email = login, users[login]['email']
+        elif kind < 0.8:
+            name, email = f"Dev {login.upper()}", users[login]['email']
+        elif kind < 0.9:
+            name, email = rng.choice(alias_names), f"alias{i}@mail.example.com"
+        else:
+            name, email = f"outsider{i}", f"outsider{i}@other.example.com"
+        
+        commit_date = (start + timedelta(minutes=7 * i)).isoformat()
+        lines.append(f"AUTHOR:{i:040x} {name}<{email}> {commit_date}")
+        for j in range(rng.randint(1, 8)):
+            lines.append(f"{rng.randint(0, 200)}\t{rng.randint(0, 80)}\tsrc/module{j}/file{rng.randint(0, 50)}.py")
+        lines.append("")
+    
+    return lines
+
+
+def make_report_stats(users, repo_count, rng):
+    """生成报告渲染所需的聚合结果"""
+    logins = list(users)
+    repo_stats = []
+    for i in range(repo_count):
+        contributors = rng.sample(logins, rng.randint(1, 12))
+        contributor_stats = {}
+        for login in contributors:
+            additions, deletions = rng.randint(0, 5000), rng.randint(0, 2000)
+            contributor_stats[login] = {
+                'commits': rng.randint(1, 40),
+                'additions': additions,
+                'deletions': deletions,
+                'total_lines': additions + deletions
+            }
+        repo_stats.append({
+            'name': f"org{i % 20}/repo{i}",
+            'description': '',
+            'commits': sum(c['commits'] for c in contributor_stats.values()),
+            'additions': sum(c['additions'] for c in contributor_stats.values()),
+            'deletions': sum(c['deletions'] for c in contributor_stats.values()),
+            'total_lines': sum(c['total_lines'] for c in contributor_stats.values()),
+            'contributors': contributors,
+            'contributors_count': len(contributors),
+            'contributor_stats': contributor_stats
+        })
+    
+    user_stats = {}
+    for repo in repo_stats:
+        for login, cell in repo['contributor_stats'].items():
+            entry = user_stats.setdefault(login, {
+                'commits': 0, 'repos': [], 'additions': 0, 'deletions': 0, 'total_lines': 0,
+                'first_commit': None, 'last_commit': None, 'active_days': 0, 'repos_count': 0
+            })
+            entry['commits'] += cell['commits']
+            entry['additions'] += cell['additions']
+            entry['deletions'] += cell['deletions']
+            entry['total_lines'] += cell['total_lines']
+            entry['repos'].append(repo['name'])
+            entry['repos_count'] += 1
+            entry['active_days'] = min(30, entry['active_days'] + rng.randint(1, 5))
+    
+    return {
+        'user_stats': user_stats,
+        'repo_stats': repo_stats,
+        'total_repos': len(repo_stats),
+        'total_commits': sum(r['commits'] for r in repo_stats),
+        'total_additions': sum(r['additions'] for r in repo_stats),
+        'total_deletions': sum(r['deletions'] for r in repo_stats),
+        'total_lines': sum(r['total_lines'] for r in repo_stats)
+    }
+
+
+def build_benchmarks(commit_count, user_count, seed=20260101):
+    """准备固定输入，返回 {名称: (函数, 每次调用处理的条目数, 条目单位)}"""
+    rng = random.Random(seed)
+    users = make_users(user_count, rng)
+    aliases = {f"alias{i}": login for i, login in enumerate(rng.sample(list(users), 50))}
+    lines = make_log_lines(commit_count, users, aliases, rng)
+    commits = GitOperations.parse_log_lines(lines)
+    dates = [commit['commit']['committer']['date'] for commit in commits]
+    report_stats = make_report_stats(users, 300, rng)
+    report_generator = ReportGenerator(users, 'https://git.example.com', top_users=20)
+    
+    def match_authors():
+        # 与 collect_all_stats 相同：每个仓库新建匹配器后逐提交匹配、聚合
+        return aggregate_commits(commits, UserMatcher(users, aliases))
+    
+    return {
+        'parse_log': (lambda: GitOperations.parse_log_lines(lines), len(commits), 'commits'),
+        'match_authors': (match_authors, len(commits), 'commits'),
+        'parse_datetime': (lambda: [parse_datetime(date) for date in dates], len(dates), 'dates'),
+        'render_report': (lambda: report_generator.generate_text_report(report_stats), 1, 'reports')
+    }
+
+
+def measure(func, repeat):
+    """执行 repeat 次取最快一次的耗时（秒），减少机器抖动的影响"""
+    func()
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def load_baseline(path):
+    """读取基线文件，不存在时返回 None"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(path, results, args):
+    """保存基线（记录机器和输入规模，便于判断基线是否可比）"""
+    baseline = {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.node(),
+            'commits': args.commits,
+            'users': args.users
+        },
+        'results': results
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2)
+    print(f"基线已保存到: {path}")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='热点函数微基准测试')
+    parser.add_argument('names', nargs='*', help='只运行指定的基准（默认全部）')
+    parser.add_argument('--commits', type=int, default=10000, help='提交数（默认 10000）')
+    parser.add_argument('--users', type=int, default=2000, help='用户数（默认 2000）')
+    parser.add_argument('--repeat', type=int, default=5, help='每个基准重复次数，取最快一次（默认 5）')
+    parser.add_argument('--threshold', type=float, default=0.25, help='吞吐量比基线下降超过该比例时失败（默认 0.25）')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='基线文件路径')
+    parser.add_argument('--update-baseline', action='store_true', help='用本次结果覆盖基线')
+    args = parser.parse_args()
+    
+    print(f"准备输入: {args.commits} 个提交, {args.users} 个用户")
+    benchmarks = build_benchmarks(args.commits, args.users)
+    unknown = [name for name in args.names if name not in benchmarks]
+    if unknown:
+        print(f"错误: 未知的基准 {', '.join(unknown)}，可选: {', '.join(benchmarks)}")
+        sys.exit(2)
+    
+    results = {}
+    for name, (func, items, unit) in benchmarks.items():
+        if args.names and name not in args.names:
+            continue
+        seconds = measure(func, args.repeat)
+        results[name] = {
+            'seconds': round(seconds, 6),
+            'items_per_sec': round(items / seconds, 1),
+            'unit': unit
+        }
+    
+    baseline = load_baseline(args.baseline)
+    if args.update_baseline:
+        for name, result in results.items():
+            print(f"  {name:16s} {result['seconds'] * 1000:10.2f} ms  {result['items_per_sec']:12,.1f} {result['unit']}/s")
+        if baseline is not None:
+            results = dict(baseline['results'], **results)
+        save_baseline(args.baseline, results, args)
+        return
+    
+    if baseline is None:
+        print(f"错误: 基线文件 {args.baseline} 不存在，请先在本机运行 --update-baseline 生成基线")
+        sys.exit(2)
+    
+    meta = baseline.get('meta', {})
+    if meta.get('commits') != args.commits or meta.get('users') != args.users:
+        print(f"警告: 基线输入规模为 {meta.get('commits')} 个提交 / {meta.get('users')} 个用户，与本次不同，结果不可比")
+    if meta.get('machine') != platform.node():
+        print(f"警告: 基线在 {meta.get('machine')} 上生成，与本机不同，结果仅供参考")
+    
+    regressions = []
+    missing = []
+    print(f"| 基准 | 耗时(ms) | 吞吐量 | 基线吞吐量 | 变化 |")
+    print(f"|------|----------|--------|------------|------|")
+    for name, result in results.items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print(f"| {name} | {result['seconds'] * 1000:.2f} | {result['items_per_sec']:,.1f} {result['unit']}/s | - | 无基线 ❌ |")
+            missing.append(name)
+            continue
+        change = result['items_per_sec'] / base['items_per_sec'] - 1
+        flag = ''
+        if change < -args.threshold:
+            flag = ' ❌'
+            regressions.append(name)
+        print(f"| {name} | {result['seconds'] * 1000:.2f} | {result['items_per_sec']:,.1f} {result['unit']}/s | "
+              f"{base['items_per_sec']:,.1f} | {change:+.1%}{flag} |")
+    
+    if regressions:
+        print(f"\n性能回退超过 {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    if missing:
+        print(f"\n基线中缺少: {', '.join(missing)}，请运行 --update-baseline 补充")
+        sys.exit(2)
+    print(f"\n全部基准在阈值 {args.threshold:.0%} 以内")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+提交明细导出模块
+负责在收集过程中逐条写出每个提交的明细（gzip 压缩的 NDJSON）
+"""
+
+import os
+import gzip
+import json
+
+
+class CommitExporter:
+    """提交明细流式导出类"""
+    
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self.temp_file = f"{output_file}.tmp"
+        self.count = 0
+        self.fp = gzip.open(self.temp_file, 'wt', encoding='utf-8')
+    
+    def write(self, sha, repo, user, timestamp, additions, deletions, committed=None):
+        """写出一条提交明细，timestamp 为作者时间，committed 为提交时间（统计窗口按提交时间选择提交）"""
+        record = {
+            'sha': sha,
+            'repo': repo,
+            'user': user,
+            'timestamp': timestamp,
+            'committed': committed or timestamp,
+            'additions': additions,
+            'deletions': deletions
+        }
+        self.fp.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+        self.fp.write('\n')
+        self.count += 1
+    
+    def close(self):
+        """关闭文件，写完后再替换为正式文件名，避免下游读到半截数据"""
+        if self.fp is None:
+            return
+        self.fp.close()
+        self.fp = None
+        os.replace(self.temp_file, self.output_file)
+        print(f"提交明细已导出到: {self.output_file}（{self.count} 条）")
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None and self.fp is not None:
+            # 收集失败时丢弃不完整的临时文件
+            self.fp.close()
+            self.fp = None
+            if os.path.exists(self.temp_file):
+                os.remove(self.temp_file)
+            return False
+        self.close()
+        return False
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+提交日志模块
+负责把统计过的每个提交追加写入定长二进制记录文件（提交时间、作者时间、用户 id、仓库 id、新增、删除），
+用户名和仓库名保存在旁边的名称字典中；查询时通过 NumPy memmap 零拷贝映射，按提交时间二分查找窗口
+（与 git log --since/--until 和日汇总相同），
+历史报告直接从日志聚合，不需要访问 Git
+"""
+
+import os
+import json
+from datetime import datetime, timezone
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+from repo_lock import FileLock
+from time_utils import parse_datetime
+
+
+# 每条记录 40 字节：提交时间和作者时间（Unix 秒）、SHA 前 64 位（与仓库 id 一起去重）、用户 id、仓库 id、新增行数、删除行数；
+# 窗口和分段按提交时间，首次/最近提交和活跃天按作者时间（与实时报告相同）
+RECORD_FIELDS = [
+    ('timestamp', '<i8'),
+    ('authored', '<i8'),
+    ('sha', '<u8'),
+    ('user', '<u4'),
+    ('repo', '<u4'),
+    ('additions', '<u4'),
+    ('deletions', '<u4')
+]
+RECORDS_FILE = 'commits.v2.bin'
+# 旧版本的 32 字节记录只有作者时间，打开日志时转换为新格式（提交时间取作者时间）
+LEGACY_RECORD_FIELDS = [field for field in RECORD_FIELDS if field[0] != 'authored']
+LEGACY_RECORDS_FILE = 'commits.bin'
+USERS_FILE = 'users.txt'
+REPOS_FILE = 'repos.txt'
+# 分段索引：每段内的记录按时间有序，段的 [起始, 结束) 记录号列表；写完记录后才更新，是日志的提交点
+SEGMENTS_FILE = 'segments.json'
+
+
+class CommitLog:
+    """追加写入的二进制提交日志类
+    
+    每次运行结束时把新提交按时间排序后作为一段追加（时间接续上一段时直接并入上一段），
+    已写入的提交按 (SHA, 仓库) 跳过；写入持有排他锁，查询持有共享锁
+    """
+    
+    def __init__(self, path, lock_timeout=600):
+        self.path = path
+        self.lock_timeout = lock_timeout
+        self.enabled = False
+        self.pending = []
+        self.users = []
+        self.repos = []
+        self.segments = []
+        
+        if not path:
+            return
+        if not NUMPY_AVAILABLE:
+            print("未安装 numpy，提交日志不可用")
+            return
+        try:
+            os.makedirs(path, exist_ok=True)
+            self.dtype = np.dtype(RECORD_FIELDS)
+            self.lock = FileLock(os.path.join(path, '.lock'))
+            self._migrate(lock_timeout)
+            self.enabled = True
+            print(f"提交日志已启用: {path}")
+        except OSError as e:
+            print(f"提交日志打开失败: {e}，本次不记录提交")
+    
+    def _file(self, name):
+        return os.path.join(self.path, name)
+    
+    def _migrate(self, lock_timeout):
+        """把旧格式的记录转换为新格式：记录顺序不变，分段索引不需要改动；
+        新文件完整写入后才删除旧文件，转换中途崩溃时下次重新转换
+        """
+        legacy_path = self._file(LEGACY_RECORDS_FILE)
+        if not os.path.exists(legacy_path):
+            return
+        with self.lock.hold(True, lock_timeout):
+            if not os.path.exists(legacy_path):
+                return
+            self._load()
+            count = self.segments[-1][1] if self.segments else 0
+            legacy = np.fromfile(legacy_path, dtype=np.dtype(LEGACY_RECORD_FIELDS), count=count)
+            records = np.zeros(len(legacy), dtype=self.dtype)
+            for name in legacy.dtype.names:
+                records[name] = legacy[name]
+            records['authored'] = legacy['timestamp']
+            with open(self._file(RECORDS_FILE), 'wb') as f:
+                f.write(records.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.remove(legacy_path)
+        print(f"提交日志已转换为新格式（{count} 个提交，旧记录的提交时间按作者时间）")
+    
+    def _read_names(self, name):
+        """读取名称字典（行号即 id），丢弃崩溃时写了一半的最后一行"""
+        path = self._file(name)
+        if not os.path.exists(path):
+            return []
+        with open(path, 'rb+') as f:
+            data = f.read()
+            complete = data.rfind(b'\n') + 1
+            if complete < len(data):
+                f.truncate(complete)
+        return data[:complete].decode('utf-8').split('\n')[:-1]
+    
+    def _load(self):
+        """读取名称字典和分段索引（其他运行可能已经追加，写入和查询前都要重新读取）"""
+        self.users = self._read_names(USERS_FILE)
+        self.repos = self._read_names(REPOS_FILE)
+        path = self._file(SEGMENTS_FILE)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.segments = json.load(f)
+        else:
+            self.segments = []
+    
+    def _intern(self, names, name_file, values):
+        """把名称转换为 id，新名称追加到名称字典"""
+        ids = {name: idx for idx, name in enumerate(names)}
+        added = []
+        result = []
+        for value in values:
+            idx = ids.get(value)
+            if idx is None:
+                idx = ids[value] = len(names)
+                names.append(value)
+                added.append(value)
+            result.append(idx)
+        if added:
+            with open(self._file(name_file), 'a', encoding='utf-8') as f:
+                f.write(''.join(f"{name}\n" for name in added))
+        return result
+    
+    def _records(self):
+        """零拷贝映射已提交的全部记录，没有记录时返回 None"""
+        count = self.segments[-1][1] if self.segments else 0
+        if not count:
+            return None
+        return np.memmap(self._file(RECORDS_FILE), dtype=self.dtype, mode='r', shape=(count,))
+    
+    def _window(self, since_ts=None, until_ts=None):
+        """各段中提交时间落在 [since_ts, until_ts] 内的记录（memmap 视图，不复制数据）"""
+        records = self._records()
+        if records is None:
+            return []
+        views = []
+        for start, end in self.segments:
+            timestamps = records[start:end]['timestamp']
+            low = int(np.searchsorted(timestamps, since_ts, side='left')) if since_ts is not None else 0
+            high = int(np.searchsorted(timestamps, until_ts, side='right')) if until_ts is not None else end - start
+            if high > low:
+                views.append(records[start + low:start + high])
+        return views
+    
+    def _keys(self, records):
+        """记录的去重键 (SHA, 仓库 id)，转换为可排序、可比较的定长字节"""
+        keys = np.empty(len(records), dtype=[('sha', '>u8'), ('repo', '>u4')])
+        keys['sha'] = records['sha']
+        keys['repo'] = records['repo']
+        return keys.view(np.dtype((np.void, keys.dtype.itemsize)))
+    
+    def append(self, sha, repo, user, authored, committed, additions, deletions):
+        """记录一个提交（运行结束时由 flush 统一写入），authored 为作者时间，committed 为提交时间"""
+        if self.enabled and sha:
+            self.pending.append((int(sha[:16], 16), repo, user, int(parse_datetime(committed).timestamp()),
+                                 int(parse_datetime(authored).timestamp()), additions, deletions))
+    
+    def flush(self):
+        """把本次记录的提交去重、按时间排序后追加到日志，返回新写入的提交数"""
+        if not self.enabled or not self.pending:
+            return 0
+        pending, self.pending = self.pending, []
+        
+        with self.lock.hold(True, self.lock_timeout):
+            self._load()
+            batch = np.zeros(len(pending), dtype=self.dtype)
+            batch['sha'] = [item[0] for item in pending]
+            batch['repo'] = self._intern(self.repos, REPOS_FILE, [item[1] for item in pending])
+            batch['user'] = self._intern(self.users, USERS_FILE, [item[2] for item in pending])
+            batch['timestamp'] = [item[3] for item in pending]
+            batch['authored'] = [item[4] for item in pending]
+            batch['additions'] = [item[5] for item in pending]
+            batch['deletions'] = [item[6] for item in pending]
+            
+            # 同一个提交在多个仓库（fork）中各计一次，与实时报告一致；同一仓库的提交在多次运行中只保留第一次
+            _, first = np.unique(self._keys(batch), return_index=True)
+            batch = batch[np.sort(first)]
+            # 同一个提交的时间不变，只需和时间范围内已写入的记录比较
+            existing = self._window(int(batch['timestamp'].min()), int(batch['timestamp'].max()))
+            if existing:
+                batch = batch[~np.isin(self._keys(batch), self._keys(np.concatenate(existing)))]
+            if not len(batch):
+                return 0
+            batch = batch[np.argsort(batch['timestamp'], kind='stable')]
+            
+            count = self.segments[-1][1] if self.segments else 0
+            records = self._records()
+            last_time = int(records[count - 1]['timestamp']) if records is not None else None
+            del records
+            
+            path = self._file(RECORDS_FILE)
+            with open(path, 'ab') as f:
+                # 上次崩溃时写了一半、没有进入分段索引的记录先截掉
+                f.truncate(count * self.dtype.itemsize)
+                f.write(batch.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            
+            if last_time is not None and int(batch['timestamp'][0]) >= last_time:
+                self.segments[-1][1] = count + len(batch)
+            else:
+                self.segments.append([count, count + len(batch)])
+            tmp_path = f"{self._file(SEGMENTS_FILE)}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.segments, f)
+            os.replace(tmp_path, self._file(SEGMENTS_FILE))
+        
+        print(f"提交日志追加 {len(batch)} 个提交（共 {len(self.segments)} 段）")
+        return len(batch)
+    
+    def earliest(self):
+        """日志中最早的提交时间（Unix 秒），日志为空时返回 None"""
+        with self.lock.hold(False, self.lock_timeout):
+            self._load()
+            records = self._records()
+            if records is None:
+                return None
+            return min(int(records[start]['timestamp']) for start, _ in self.segments)
+    
+    def query(self, since_date=None, until_date=None):
+        """返回提交时间在窗口内的记录（结构化数组）、用户名列表和仓库名列表"""
+        since_ts = int(parse_datetime(since_date).timestamp()) if since_date else None
+        until_ts = int(parse_datetime(until_date).timestamp()) if until_date else None
+        with self.lock.hold(False, self.lock_timeout):
+            self._load()
+            views = self._window(since_ts, until_ts)
+            records = np.concatenate(views) if views else np.zeros(0, dtype=self.dtype)
+        return records, self.users, self.repos
+    
+    @staticmethod
+    def _group_quantiles(groups, totals, group_count):
+        """按组计算单次提交代码行数的中位数和 p95（与 numpy.percentile 一样线性插值）"""
+        order = np.lexsort((totals, groups))
+        bounds = np.searchsorted(groups[order], np.arange(group_count + 1))
+        sorted_totals = totals[order]
+        result = []
+        for idx in range(group_count):
+            values = sorted_totals[bounds[idx]:bounds[idx + 1]]
+            median, p95 = np.percentile(values, [50, 95])
+            result.append({'median_commit_lines': round(float(median), 1), 'p95_commit_lines': round(float(p95), 1)})
+        return result
+    
+    def build_stats(self, since_date=None, until_date=None):
+        """从日志聚合时间窗口内的统计数据，结构与 StatsCollector.collect_all_stats 的结果相同"""
+        records, user_names, repo_names = self.query(since_date, until_date)
+        
+        additions = records['additions'].astype(np.int64)
+        deletions = records['deletions'].astype(np.int64)
+        totals = additions + deletions
+        # 窗口按提交时间选择，首次/最近提交和活跃天与实时报告一样按作者时间
+        timestamps = records['authored']
+        days = timestamps // 86400
+        user_ids, users = np.unique(records['user'], return_inverse=True)
+        repo_ids, repos = np.unique(records['repo'], return_inverse=True)
+        users = users.ravel()
+        repos = repos.ravel()
+        
+        def sums(groups, count, weights=None):
+            return np.bincount(groups, weights=weights, minlength=count).astype(np.int64)
+        
+        def to_iso(ts):
+            return datetime.fromtimestamp(int(ts), timezone.utc).isoformat()
+        
+        user_count = len(user_ids)
+        first = np.full(user_count, np.iinfo(np.int64).max)
+        last = np.full(user_count, np.iinfo(np.int64).min)
+        np.minimum.at(first, users, timestamps)
+        np.maximum.at(last, users, timestamps)
+        active_days = sums(np.unique(np.stack([users, days]), axis=1)[0], user_count)
+        user_repo_pairs = np.unique(np.stack([users, repos]), axis=1)
+        user_commits = sums(users, user_count)
+        user_additions = sums(users, user_count, additions)
+        user_deletions = sums(users, user_count, deletions)
+        user_quantiles = self._group_quantiles(users, totals, user_count)
+        
+        user_repos = [[] for _ in range(user_count)]
+        for user, repo in user_repo_pairs.T:
+            user_repos[user].append(repo_names[repo_ids[repo]])
+        
+        user_stats = {}
+        for idx, user_id in enumerate(user_ids):
+            user_stats[user_names[user_id]] = dict({
+                'commits': int(user_commits[idx]),
+                'repos': user_repos[idx],
+                'additions': int(user_additions[idx]),
+                'deletions': int(user_deletions[idx]),
+                'total_lines': int(user_additions[idx] + user_deletions[idx]),
+                'first_commit': to_iso(first[idx]),
+                'last_commit': to_iso(last[idx]),
+                'active_days': int(active_days[idx]),
+                'repos_count': len(user_repos[idx])
+            }, **user_quantiles[idx])
+        
+        # 仓库 × 用户的贡献明细
+        repo_count = len(repo_ids)
+        pairs, pair_index = np.unique(np.stack([repos, users]), axis=1, return_inverse=True)
+        pair_index = pair_index.ravel()
+        pair_commits = sums(pair_index, pairs.shape[1])
+        pair_additions = sums(pair_index, pairs.shape[1], additions)
+        pair_deletions = sums(pair_index, pairs.shape[1], deletions)
+        contributor_stats = [{} for _ in range(repo_count)]
+        for idx, (repo, user) in enumerate(pairs.T):
+            contributor_stats[repo][user_names[user_ids[user]]] = {
+                'commits': int(pair_commits[idx]),
+                'additions': int(pair_additions[idx]),
+                'deletions': int(pair_deletions[idx]),
+                'total_lines': int(pair_additions[idx] + pair_deletions[idx])
+            }
+        
+        repo_commits = sums(repos, repo_count)
+        repo_additions = sums(repos, repo_count, additions)
+        repo_deletions = sums(repos, repo_count, deletions)
+        repo_quantiles = self._group_quantiles(repos, totals, repo_count)
+        repo_stats = []
+        for idx, repo_id in enumerate(repo_ids):
+            contributors = sorted(contributor_stats[idx], key=lambda u: -contributor_stats[idx][u]['total_lines'])
+            repo_stats.append(dict({
+                'name': repo_names[repo_id],
+                'description': '',
+                'commits': int(repo_commits[idx]),
+                'additions': int(repo_additions[idx]),
+                'deletions': int(repo_deletions[idx]),
+                'total_lines': int(repo_additions[idx] + repo_deletions[idx]),
+                'contributors': contributors,
+                'contributor_stats': contributor_stats[idx],
+                'contributors_count': len(contributors)
+            }, **repo_quantiles[idx]))
+        
+        return {
+            'user_stats': user_stats,
+            'repo_stats': repo_stats,
+            'total_repos': len(repo_stats),
+            'total_commits': int(totals.size),
+            'total_additions': int(additions.sum()),
+            'total_deletions': int(deletions.sum()),
+            'total_lines': int(totals.sum())
+        }
@@ -7,6 +7,7 @@
 
 import os
 import sys
+import hashlib
 
 try:
     from dotenv import load_dotenv
@@ -38,19 +39,75 @@ def load_config():
     config['REDIS_DB'] = os.getenv('REDIS_DB')
     config['REDIS_PASSWORD'] = os.getenv('REDIS_PASSWORD')
     config['CLONE_DIR'] = os.getenv('CLONE_DIR')
+    config['REPO_LOCK_TIMEOUT'] = os.getenv('REPO_LOCK_TIMEOUT', '600')
+    config['REPO_FRESH_SECONDS'] = os.getenv('REPO_FRESH_SECONDS', '300')
+    config['RUN_LOCK_WAIT'] = os.getenv('RUN_LOCK_WAIT', 'wait')
+    config['RUN_LOCK_TIMEOUT'] = os.getenv('RUN_LOCK_TIMEOUT', '3600')
+    config['SLICE_DAYS'] = os.getenv('SLICE_DAYS', '30')
+    config['SLICE_MIN_SIZE_KB'] = os.getenv('SLICE_MIN_SIZE_KB', '1048576')
+    config['SLICE_WORKERS'] = os.getenv('SLICE_WORKERS', '4')
+    config['PREFETCH_INTERVAL'] = os.getenv('PREFETCH_INTERVAL', '1800')
+    config['PREFETCH_STOP'] = os.getenv('PREFETCH_STOP', '17:00')
+    config['PREFETCH_MAX_REPOS'] = os.getenv('PREFETCH_MAX_REPOS', '0')
+    config['PREFETCH_WORKERS'] = os.getenv('PREFETCH_WORKERS', '2')
+    config['REPO_SOURCES'] = os.getenv('REPO_SOURCES', 'orgs,users,search')
+    config['DISCOVERY_WORKERS'] = os.getenv('DISCOVERY_WORKERS', '4')
+    config['METADATA_FRESH_SECONDS'] = os.getenv('METADATA_FRESH_SECONDS', '3600')
+    config['METADATA_MAX_STALE_SECONDS'] = os.getenv('METADATA_MAX_STALE_SECONDS', '604800')
+    config['SCAN_MODE'] = os.getenv('SCAN_MODE', 'serial')
+    config['SCAN_WORKERS'] = os.getenv('SCAN_WORKERS')
+    config['WORK_LEASE_SECONDS'] = os.getenv('WORK_LEASE_SECONDS', '900')
+    config['COORDINATOR_SCAN'] = os.getenv('COORDINATOR_SCAN', 'true')
+    config['WORKER_IDLE_EXIT'] = os.getenv('WORKER_IDLE_EXIT', '300')
+    config['HTTP_MAX_CONCURRENCY'] = os.getenv('HTTP_MAX_CONCURRENCY', '8')
+    config['GIT_MAX_CONCURRENCY'] = os.getenv('GIT_MAX_CONCURRENCY', '4')
+    config['MAX_RETRIES'] = os.getenv('MAX_RETRIES', '4')
+    config['RETRY_BASE_DELAY'] = os.getenv('RETRY_BASE_DELAY', '1.0')
+    config['REF_POLICY'] = os.getenv('REF_POLICY', 'all')
+    config['COMMIT_ENGINE'] = os.getenv('COMMIT_ENGINE', 'auto')
+    config['API_ENGINE_MAX_SIZE_KB'] = os.getenv('API_ENGINE_MAX_SIZE_KB', '20480')
+    config['API_ENGINE_MAX_COMMITS'] = os.getenv('API_ENGINE_MAX_COMMITS', '200')
     config['OUTPUT_PATH'] = os.getenv('OUTPUT_PATH')
     config['OUTPUT_FILE'] = os.getenv('OUTPUT_FILE')
     config['JSON_FILE'] = os.getenv('JSON_FILE')
+    config['COMMITS_EXPORT'] = os.getenv('COMMITS_EXPORT')
+    config['COMMIT_LOG'] = os.getenv('COMMIT_LOG')
     config['SINCE_DATE'] = os.getenv('SINCE_DATE')
     config['END_DATE'] = os.getenv('END_DATE')
     config['DAYS'] = os.getenv('DAYS')
     config['PERIOD'] = os.getenv('PERIOD')
     config['USER_ALIASES'] = os.getenv('USER_ALIASES')
+    config['ROLLUP_DB'] = os.getenv('ROLLUP_DB')
+    config['ROLLUP_SETTLE_DAYS'] = os.getenv('ROLLUP_SETTLE_DAYS', '3')
+    config['NUMSTAT_DB'] = os.getenv('NUMSTAT_DB')
+    config['SNAPSHOT_DB'] = os.getenv('SNAPSHOT_DB')
+    config['MAILMAP_FILE'] = os.getenv('MAILMAP_FILE')
+    config['REPORT_VIEWS'] = os.getenv('REPORT_VIEWS')
+    config['REPORT_TOP_USERS'] = os.getenv('REPORT_TOP_USERS', '20')
+    config['RANK_MODE'] = os.getenv('RANK_MODE', 'composite')
+    config['RANK_WEIGHTS'] = os.getenv('RANK_WEIGHTS')
+    config['RANK_CAP_PERCENTILE'] = os.getenv('RANK_CAP_PERCENTILE', '99')
+    config['RANK_BOOTSTRAP'] = os.getenv('RANK_BOOTSTRAP', '200')
+    config['DISTINCT_MODE'] = os.getenv('DISTINCT_MODE', 'exact')
+    config['HLL_PRECISION'] = os.getenv('HLL_PRECISION', '14')
     config['iscommit'] = os.getenv('iscommit', 'true')  # 默认为 true
+    config['REPORT_REPO'] = os.getenv('REPORT_REPO', 'doc/w01.k8s')
+    config['REPORT_BRANCH'] = os.getenv('REPORT_BRANCH')
+    config['REPORT_REPO_DIR'] = os.getenv('REPORT_REPO_DIR', 'docker/gitea/report')
     
     return config
 
 
+def run_window(config):
+    """统计窗口配置的描述，窗口相同的运行共用运行锁和分布式队列"""
+    return f"days={config.get('DAYS')},period={config.get('PERIOD')},since={config.get('SINCE_DATE')},end={config.get('END_DATE')}"
+
+
+def window_id(config):
+    """统计窗口配置的短哈希"""
+    return hashlib.sha1(run_window(config).encode('utf-8')).hexdigest()[:12]
+
+
 def validate_config(config):
     """验证配置参数"""
     # 验证必需参数
@@ -9,18 +9,85 @@ import subprocess
 import tempfile
 import shutil
 import shlex
+import time
 import os
+import re
+import json
+import math
+import hashlib
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from urllib.parse import urlparse, quote
+from throttle import AdaptiveLimiter, RetryPolicy
+from repo_lock import FileLock
+from numstat_cache import NumstatCache
+from path_breakdown import PathTrie
+
+# 这些错误输出通常是服务器繁忙或网络抖动，值得退避后重试
+TRANSIENT_GIT_ERRORS = (
+    'The requested URL returned error: 429',
+    'The requested URL returned error: 5',
+    'RPC failed',
+    'early EOF',
+    'Connection reset',
+    'Connection timed out',
+    'Operation timed out',
+    'unexpected disconnect',
+    'remote end hung up unexpectedly',
+)
+
+# rev-parse 输出中的提交 SHA（SHA-1 或 SHA-256）
+SHA_PATTERN = re.compile(r'^(?:[0-9a-f]{40}|[0-9a-f]{64})$')
+
+# 超时的时间片最多二分几层（即最细切到原时间片的 1/16），短于 MIN_SLICE_SECONDS 的时间片不再二分
+MAX_SLICE_SPLITS = 4
+MIN_SLICE_SECONDS = 3600
+
+# 预取快照的格式版本，提交记录的字段变化时递增，旧格式的快照不再使用（2：提交带有路径分布；3：提交带有提交时间）
+SNAPSHOT_FORMAT = 4
+
+
+class SliceScanError(RuntimeError):
+    """部分时间片二分重试后仍然超时，commits 为其余时间片的提交"""
+    
+    def __init__(self, commits, failed_ranges):
+        ranges = ', '.join(f"{since or '最早'} ~ {until or '现在'}" for since, until in failed_ranges)
+        super().__init__(f"{len(failed_ranges)} 个时间片扫描超时: {ranges}")
+        self.commits = commits
+        self.failed_ranges = failed_ranges
 
 
 class GitOperations:
     """Git 操作类"""
     
-    def __init__(self, token=None, username=None, password=None, clone_dir=None):
+    def __init__(self, token=None, username=None, password=None, clone_dir=None, limiter=None, retry_policy=None,
+                 lock_timeout=600, fresh_seconds=300, slice_days=30, slice_min_size_kb=1048576, slice_workers=4,
+                 mailmap_file=None, numstat_db=None):
         self.token = token
         self.username = username
         self.password = password
         self.clone_dir = clone_dir
+        self.limiter = limiter or AdaptiveLimiter('git', max_limit=4)
+        self.retry_policy = retry_policy or RetryPolicy()
+        # 多个运行共用 CLONE_DIR：等待仓库锁的最长秒数；仓库在 fresh_seconds 秒内已被更新时不再重复 fetch
+        self.lock_timeout = lock_timeout
+        self.fresh_seconds = fresh_seconds
+        # 每个本地仓库按分支选择解析出的提交 SHA，clone/fetch 后失效
+        self.ref_tips = {}
+        # 每个本地仓库已读取的预取快照（没有快照时为 None），一个仓库的多个扫描时间段只读取一次，clone/fetch 后失效
+        self.snapshots = {}
+        # 设置后 git log 通过该 mailmap 输出规范化的作者名和邮箱（%aN / %aE）
+        self.mailmap_file = mailmap_file
+        # 对象大小超过 slice_min_size_kb 的仓库，超过 slice_days 天的窗口预先按天数切片，由 slice_workers 个 git log 并行扫描
+        self.slice_days = slice_days
+        self.slice_min_size_kb = slice_min_size_kb
+        self.slice_workers = max(1, slice_workers)
+        # 按提交 SHA 缓存的 numstat 结果，git 只计算从未见过的提交的差异
+        self.numstat_cache = NumstatCache(numstat_db)
+        # numstat 中的文件路径按前缀树归类为语言和第一级目录，多个仓库共用
+        self.path_trie = PathTrie()
         
         if self.clone_dir and not os.path.exists(self.clone_dir):
             os.makedirs(self.clone_dir, exist_ok=True)
@@ -39,31 +106,79 @@ class GitOperations:
         else:
             return url
     
+    def is_cached_path(self, repo_path):
+        """本地路径是否在 CLONE_DIR 仓库缓存中（缓存中的仓库由其他运行共用，不能直接删除）"""
+        if not self.clone_dir or not repo_path:
+            return False
+        return os.path.abspath(repo_path).startswith(os.path.abspath(self.clone_dir) + os.sep)
+    
+    def repo_lock(self, repo_path):
+        """返回缓存仓库的文件锁（放在 CLONE_DIR/.locks 下，删除仓库目录时不受影响），临时目录中的仓库返回 None"""
+        if not self.is_cached_path(repo_path):
+            return None
+        repo_name = os.path.relpath(os.path.abspath(repo_path), os.path.abspath(self.clone_dir))
+        return FileLock(os.path.join(self.clone_dir, '.locks', repo_name.replace(os.sep, '__') + '.lock'))
+    
+    @contextmanager
+    def locked(self, repo_path, exclusive):
+        """在 with 块内持有缓存仓库的锁：更新/删除用排他锁，读取用共享锁；等待超过 lock_timeout 抛出 LockTimeout"""
+        lock = self.repo_lock(repo_path)
+        if lock is None:
+            yield None
+            return
+        
+        repo_name = os.path.relpath(os.path.abspath(repo_path), os.path.abspath(self.clone_dir))
+        
+        def on_wait(_):
+            action = '更新' if exclusive else '读取'
+            print(f"  等待仓库锁（{action}）: {repo_name}，其他运行正在使用该仓库")
+        
+        with lock.hold(exclusive, self.lock_timeout, on_wait):
+            yield lock
+    
     def clone_repo(self, repo_url, since_date=None, timeout=300):
-        """克隆仓库到本地缓存目录或临时目录"""
+        """克隆仓库到本地缓存目录或临时目录（缓存目录中的仓库在更新期间持有排他锁）"""
         repo_name = self._extract_repo_name(repo_url)
         
         if self.clone_dir:
             local_path = os.path.join(self.clone_dir, repo_name)
+            self.forget_ref_tips(local_path)
             
-            if os.path.exists(local_path):
-                shallow_file = os.path.join(local_path, '.git', 'shallow')
-                if os.path.exists(shallow_file):
-                    print(f"  检测到浅克隆仓库，删除后重新完整克隆: {repo_name}")
-                    shutil.rmtree(local_path)
-                    print(f"  本地仓库不存在，执行 git clone: {repo_name}")
-                    return self._clone_to_dir(repo_url, local_path, timeout)
-                else:
-                    print(f"  本地仓库已存在，执行 git fetch --all 更新: {repo_name}")
-                    return self._pull_repo(local_path, repo_url, timeout)
-            else:
-                print(f"  本地仓库不存在，执行 git clone: {repo_name}")
-                return self._clone_to_dir(repo_url, local_path, timeout)
+            with self.locked(local_path, exclusive=True) as lock:
+                return self._update_cached_repo(repo_url, repo_name, local_path, timeout, lock)
         else:
             temp_dir = tempfile.mkdtemp()
             print(f"  克隆到临时目录: {temp_dir}")
             return self._clone_to_dir(repo_url, temp_dir, timeout)
     
+    def _update_cached_repo(self, repo_url, repo_name, local_path, timeout, lock):
+        """克隆或更新缓存目录中的仓库（调用方持有排他锁），锁文件记录最近一次更新时间"""
+        if os.path.exists(local_path):
+            shallow_file = os.path.join(local_path, '.git', 'shallow')
+            if os.path.exists(shallow_file):
+                print(f"  检测到浅克隆仓库，删除后重新完整克隆: {repo_name}")
+                shutil.rmtree(local_path)
+                print(f"  本地仓库不存在，执行 git clone: {repo_name}")
+                repo_path = self._clone_to_dir(repo_url, local_path, timeout)
+            else:
+                try:
+                    updated_at = float(lock.read() or 0)
+                except ValueError:
+                    updated_at = 0
+                age = time.time() - updated_at
+                if self.fresh_seconds and age < self.fresh_seconds:
+                    # 其他运行刚更新过（例如同时启动的另一个统计窗口），直接使用
+                    print(f"  本地仓库 {age:.0f} 秒前已更新，跳过 fetch: {repo_name}")
+                    return local_path
+                print(f"  本地仓库已存在，执行 git fetch --all 更新: {repo_name}")
+                repo_path = self._pull_repo(local_path, repo_url, timeout)
+        else:
+            print(f"  本地仓库不存在，执行 git clone: {repo_name}")
+            repo_path = self._clone_to_dir(repo_url, local_path, timeout)
+        
+        lock.write(f"{time.time():.0f}")
+        return repo_path
+    
     def _extract_repo_name(self, repo_url):
         """从 URL 中提取仓库名称"""
         parsed = urlparse(repo_url)
@@ -74,6 +189,53 @@ class GitOperations:
             path = path[1:]
         return path
     
+    def _run_network_git(self, cmd, timeout, cleanup_dir=None, retry_timeout=True):
+        """执行会访问服务器的 Git 命令（clone / fetch）
+        
+        受自适应并发控制，遇到服务器繁忙类错误时带抖动指数退避重试，cleanup_dir 为重试前需要删除的半成品目录；
+        retry_timeout 时超时也重试，每次重试的超时时间加倍（clone 超时多半是仓库太大，不重试）
+        """
+        attempt = 0
+        
+        while True:
+            timed_out = False
+            self.limiter.acquire()
+            start = time.monotonic()
+            try:
+                result = subprocess.run(cmd, check=True, capture_output=True, text=True, timeout=timeout)
+                self.limiter.release()
+                self.limiter.record(time.monotonic() - start)
+                return result
+            except subprocess.TimeoutExpired as e:
+                self.limiter.release()
+                if not retry_timeout:
+                    self.limiter.record(time.monotonic() - start)
+                    raise
+                error = e
+                reason = f"超时 {timeout} 秒"
+                timed_out = True
+            except subprocess.CalledProcessError as e:
+                self.limiter.release()
+                if not any(marker in (e.stderr or '') for marker in TRANSIENT_GIT_ERRORS):
+                    self.limiter.record(time.monotonic() - start)
+                    raise
+                error = e
+                reason = f"退出码 {e.returncode}"
+            
+            self.limiter.record(time.monotonic() - start, throttled=True)
+            if attempt >= self.retry_policy.max_retries:
+                raise error
+            
+            delay = self.retry_policy.delay(attempt)
+            self.limiter.retry_count += 1
+            attempt += 1
+            if timed_out:
+                timeout *= 2
+            print(f"  Git 命令失败（{reason}），{delay:.1f} 秒后第 {attempt} 次重试")
+            if cleanup_dir and os.path.exists(cleanup_dir):
+                shutil.rmtree(cleanup_dir)
+            time.sleep(delay)
+    
     def _clone_to_dir(self, repo_url, target_dir, timeout=300):
         """克隆仓库到指定目录"""
         try:
@@ -81,7 +243,7 @@ class GitOperations:
             clone_cmd = ['git', 'clone', auth_url, target_dir]
             
             print(f"  执行命令: {' '.join(clone_cmd)}")
-            result = subprocess.run(clone_cmd, check=True, capture_output=True, text=True, timeout=timeout)
+            result = self._run_network_git(clone_cmd, timeout, cleanup_dir=target_dir, retry_timeout=False)
             
             if result.stdout:
                 print(f"  输出: {result.stdout}")
@@ -112,7 +274,7 @@ class GitOperations:
             fetch_cmd = ['git', '-C', local_path, 'fetch', '--all', '--prune']
             
             print(f"  执行命令: {' '.join(fetch_cmd)}")
-            result = subprocess.run(fetch_cmd, check=True, capture_output=True, text=True, timeout=timeout)
+            result = self._run_network_git(fetch_cmd, timeout)
             
             if result.stdout:
                 print(f"  输出: {result.stdout}")
@@ -122,7 +284,11 @@ class GitOperations:
             pull_cmd = ['git', '-C', local_path, 'pull']
             
             print(f"  执行命令: {' '.join(pull_cmd)}")
-            pull_result = subprocess.run(pull_cmd, capture_output=True, text=True, timeout=timeout)
+            self.limiter.acquire()
+            try:
+                pull_result = subprocess.run(pull_cmd, capture_output=True, text=True, timeout=timeout)
+            finally:
+                self.limiter.release()
             
             if pull_result.stdout:
                 print(f"  输出: {pull_result.stdout}")
@@ -146,42 +312,181 @@ class GitOperations:
             print(f"  Git 操作异常: {e}")
             raise e
     
-    def get_commits_with_stats(self, repo_path, since_date=None, until_date=None, timeout=300):
-        """获取仓库的提交记录和代码行数统计"""
-        if since_date and until_date:
-            log_cmd = ["git", "-C", repo_path, "log", "--all", "--since", since_date, "--until", until_date, "--pretty=format:AUTHOR:%an<%ae> %aI", "--numstat"]
-        elif since_date:
-            log_cmd = ["git", "-C", repo_path, "log", "--all", "--since", since_date, "--pretty=format:AUTHOR:%an<%ae> %aI", "--numstat"]
-        elif until_date:
-            log_cmd = ["git", "-C", repo_path, "log", "--all", "--until", until_date, "--pretty=format:AUTHOR:%an<%ae> %aI", "--numstat"]
+    def resolve_ref_tips(self, repo_path, refs, timeout=60):
+        """把分支名/通配符解析为本地仓库中的提交 SHA（匹配 origin 远程分支和本地分支），同一仓库只解析一次"""
+        key = (repo_path, tuple(refs))
+        if key in self.ref_tips:
+            return self.ref_tips[key]
+        
+        result = subprocess.run(
+            ['git', '-C', repo_path, 'for-each-ref', '--format=%(objectname) %(refname)', 'refs/heads', 'refs/remotes/origin'],
+            check=True, capture_output=True, text=True, timeout=timeout
+        )
+        
+        tips = set()
+        for line in result.stdout.splitlines():
+            sha, _, refname = line.partition(' ')
+            if refname.startswith('refs/remotes/origin/'):
+                branch = refname[len('refs/remotes/origin/'):]
+            else:
+                branch = refname[len('refs/heads/'):]
+            if branch == 'HEAD':
+                continue
+            if any(fnmatch.fnmatchcase(branch, pattern) for pattern in refs):
+                tips.add(sha)
+        
+        tips = sorted(tips)
+        if not tips:
+            print(f"  没有分支匹配 {', '.join(refs)}，改为只统计 HEAD")
+            tips = ['HEAD']
+        
+        self.ref_tips[key] = tips
+        return tips
+    
+    def forget_ref_tips(self, repo_path):
+        """丢弃本地仓库已解析的分支 SHA 和已读取的预取快照（仓库更新或扫描结束后调用）"""
+        self.ref_tips = {key: tips for key, tips in self.ref_tips.items() if key[0] != repo_path}
+        self.snapshots.pop(repo_path, None)
+    
+    def get_commits_with_stats(self, repo_path, since_date=None, until_date=None, timeout=300, refs=None, exclude=()):
+        """获取仓库的提交记录和代码行数统计
+        
+        refs 为需要统计的分支名/通配符列表，为 None 时遍历所有引用（--all）；exclude 中提交可达的提交不再输出；
+        缓存目录中的仓库在查询期间持有共享锁，其他运行可以同时读取，但不能更新或删除
+        """
+        with self.locked(repo_path, exclusive=False):
+            return self._log_commits(repo_path, since_date, until_date, timeout, refs, exclude)
+    
+    def _log_commits(self, repo_path, since_date, until_date, timeout, refs, exclude=()):
+        """执行 git log --numstat 并解析；启用提交行数缓存时 git log 只列出提交，代码行数由 _fill_numstat 填充"""
+        # 中文等非 ASCII 文件名按原样输出，不转义为八进制
+        log_cmd = ["git", "-C", repo_path, "-c", "core.quotePath=false"]
+        if self.mailmap_file:
+            log_cmd += ["-c", f"mailmap.file={os.path.abspath(self.mailmap_file)}", "log"]
+            # 同时输出原始作者：邮箱规则把别名/登录名改成邮箱所属用户时，按原始作者匹配（与 UserMatcher 的优先级一致）
+            log_format = "--pretty=format:AUTHOR:%H %aN<%aE> %aI %cI%nRAW:%an<%ae>"
         else:
-            log_cmd = ["git", "-C", repo_path, "log", "--all", "--pretty=format:AUTHOR:%an<%ae> %aI", "--numstat"]
+            log_cmd.append("log")
+            log_format = "--pretty=format:AUTHOR:%H %an<%ae> %aI %cI"
+        if since_date:
+            log_cmd += ["--since", since_date]
+        if until_date:
+            log_cmd += ["--until", until_date]
+        log_cmd.append(log_format)
+        if not self.numstat_cache.enabled:
+            log_cmd.append("--numstat")
         
-        result = subprocess.run(log_cmd, check=True, capture_output=True, text=True, timeout=timeout)
+        if refs is None:
+            log_cmd.append("--all")
+            tips = []
+        else:
+            tips = self.resolve_ref_tips(repo_path, refs)
+        
+        log_input = None
+        if tips or exclude:
+            # 起点较多时通过标准输入传给 git log，避免命令行过长
+            log_cmd.append("--stdin")
+            log_input = '\n'.join(list(tips) + [f"^{sha}" for sha in exclude]) + '\n'
+        
+        result = subprocess.run(log_cmd, check=True, capture_output=True, text=True, timeout=timeout, input=log_input)
         
         if result.returncode != 0:
             print(f"  Git log 命令执行失败: {result.stderr}")
             return []
         
-        commits = []
         lines = result.stdout.strip().split('\n')
         print(f"  Git log 输出 {len(lines)} 行")
+        commits = self.parse_log_lines(lines, self.path_trie)
         
+        print(f"  从 Git 获取到 {len(commits)} 个提交")
+        
+        if self.numstat_cache.enabled:
+            self._fill_numstat(repo_path, commits, timeout)
+        
+        return commits
+    
+    def _fill_numstat(self, repo_path, commits, timeout):
+        """从提交行数缓存填充代码行数；缓存中没有的提交由一次 git log --no-walk --numstat 计算后写入缓存"""
+        shas = [commit['sha'] for commit in commits]
+        numstats = self.numstat_cache.get_many(shas)
+        missing = [sha for sha in shas if sha not in numstats]
+        if missing:
+            result = subprocess.run(
+                ["git", "-C", repo_path, "-c", "core.quotePath=false", "log", "--no-walk=unsorted", "--stdin", "--format=COMMIT:%H", "--numstat"],
+                check=True, capture_output=True, text=True, timeout=timeout, input='\n'.join(missing) + '\n'
+            )
+            computed = self.parse_numstat_lines(result.stdout.split('\n'))
+            self.numstat_cache.put_many(computed)
+            numstats.update(computed)
+        print(f"  提交行数缓存命中 {len(shas) - len(missing)} 个提交，计算 {len(missing)} 个")
+        
+        for commit in commits:
+            additions, deletions, files = numstats.get(commit['sha'], (0, 0, []))
+            commit['stats'] = {
+                'additions': additions,
+                'deletions': deletions,
+                'total': additions + deletions,
+                'paths': self.path_trie.summarize(files)
+            }
+    
+    @staticmethod
+    def parse_numstat_lines(lines):
+        """解析 git log --format=COMMIT:%H --numstat 的输出行，返回 {sha: (新增, 删除, [[路径, 新增, 删除], ...])}
+        
+        二进制文件的行数记为 0；合并提交没有差异输出，结果为 (0, 0, [])
+        """
+        numstats = {}
+        files = None
+        
+        for line in lines:
+            if line.startswith('COMMIT:'):
+                files = numstats[line[7:].strip()] = []
+                continue
+            if files is None or not line.strip():
+                continue
+            
+            parts = line.split('\t', 2)
+            if len(parts) == 3:
+                add_raw = parts[0].strip()
+                del_raw = parts[1].strip()
+                files.append([parts[2], int(add_raw) if add_raw.isdigit() else 0, int(del_raw) if del_raw.isdigit() else 0])
+        
+        return {
+            sha: (sum(item[1] for item in files), sum(item[2] for item in files), files)
+            for sha, files in numstats.items()
+        }
+    
+    @staticmethod
+    def parse_log_lines(lines, trie=None):
+        """解析 git log --pretty=format:AUTHOR:... --numstat 的输出行，返回提交列表
+        
+        文件路径在同一遍解析中经 trie（PathTrie）归类，stats['paths'] 为 [[语言, 第一级目录, 代码行数], ...]；
+        commit.committer.date 为作者时间，committed 为提交时间（git log --since/--until 过滤的时间，日汇总按它分天）；
+        使用 mailmap 时 RAW: 行为原始作者，与规范化后的作者不同时记为 author.raw = [作者名, 邮箱]
+        """
+        trie = trie or PathTrie()
+        commits = []
         current_commit = None
+        files = []
         
         for line in lines:
             if line.startswith('AUTHOR:'):
                 if current_commit is not None:
+                    current_commit['stats']['paths'] = trie.summarize(files)
                     commits.append(current_commit)
+                files = []
                 
-                parts = line[7:].split('<')
+                sha, _, author_part = line[7:].partition(' ')
+                parts = author_part.split('<')
                 if len(parts) >= 2:
                     author = parts[0]
-                    author_email = parts[1].replace('>', '')
-                    commit_date = parts[1].split('>')[-1].strip()
+                    author_email = parts[1].split('>')[0]
+                    dates = parts[1].split('>')[-1].split()
+                    commit_date = dates[0] if dates else ''
+                    committed_date = dates[1] if len(dates) > 1 else commit_date
                     
                     current_commit = {
-                        'sha': '',
+                        'sha': sha,
                         'author': {
                             'login': author,
                             'name': author,
@@ -192,10 +497,12 @@ class GitOperations:
                                 'date': commit_date
                             }
                         },
+                        'committed': committed_date,
                         'stats': {
                             'additions': 0,
                             'deletions': 0,
-                            'total': 0
+                            'total': 0,
+                            'paths': []
                         }
                     }
                 continue
@@ -203,37 +510,316 @@ class GitOperations:
             if current_commit is None:
                 continue
             
+            if line.startswith('RAW:'):
+                raw_name, _, raw_email = line[4:].rpartition('<')
+                raw = [raw_name, raw_email[:-1] if raw_email.endswith('>') else raw_email]
+                if raw != [current_commit['author']['name'], current_commit['author']['email']]:
+                    current_commit['author']['raw'] = raw
+                continue
+            
             if not line.strip():
                 continue
             
-            stats_parts = line.split('\t')
+            stats_parts = line.split('\t', 2)
             if len(stats_parts) >= 2:
                 add_raw = stats_parts[0].strip()
                 del_raw = stats_parts[1].strip()
+                additions = int(add_raw) if add_raw.isdigit() else 0
+                deletions = int(del_raw) if del_raw.isdigit() else 0
                 
-                if add_raw and add_raw.isdigit():
-                    current_commit['stats']['additions'] += int(add_raw)
-                if del_raw and del_raw.isdigit():
-                    current_commit['stats']['deletions'] += int(del_raw)
+                current_commit['stats']['additions'] += additions
+                current_commit['stats']['deletions'] += deletions
                 current_commit['stats']['total'] = current_commit['stats']['additions'] + current_commit['stats']['deletions']
+                if len(stats_parts) == 3:
+                    files.append((stats_parts[2], additions, deletions))
         
         if current_commit is not None:
+            current_commit['stats']['paths'] = trie.summarize(files)
             commits.append(current_commit)
         
-        print(f"  从 Git 获取到 {len(commits)} 个提交")
-        
         return commits
     
-    def get_repo_commits(self, repo_url, since_date=None, until_date=None, timeout=300):
-        """获取仓库的提交记录（包含克隆和查询）"""
+    @staticmethod
+    def _parse_time(value):
+        """把 --since/--until 参数解析为带时区的时间（没有时区时与 Git 一样按本地时间），无法解析时返回 None"""
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except (AttributeError, ValueError):
+            return None
+        return parsed if parsed.tzinfo else parsed.astimezone()
+    
+    def _slice_bounds(self, repo_path, since_date, until_date, timeout=60):
+        """时间片的实际起止时间：没有起点时取最早根提交的时间，没有终点时取当前时间；无法确定时返回 None"""
+        if since_date:
+            start = self._parse_time(since_date)
+        else:
+            result = subprocess.run(['git', '-C', repo_path, 'log', '--all', '--max-parents=0', '--format=%ct'],
+                                    capture_output=True, text=True, timeout=timeout)
+            times = [int(value) for value in result.stdout.split() if value.isdigit()]
+            start = datetime.fromtimestamp(min(times), timezone.utc) if times else None
+        end = self._parse_time(until_date) if until_date else datetime.now(timezone.utc)
+        
+        if start is None or end is None or end <= start:
+            return None
+        return start, end
+    
+    @staticmethod
+    def _split_window(since_date, until_date, bounds, parts):
+        """把时间片等分为 parts 段，首尾沿用原来的起止参数（没有起止时保持开放，不会漏掉更早或更晚的提交）"""
+        start, end = bounds
+        step = (end - start) / parts
+        edges = [since_date] + [(start + step * i).isoformat(timespec='seconds') for i in range(1, parts)] + [until_date]
+        return list(zip(edges[:-1], edges[1:]))
+    
+    def _pack_size_kb(self, repo_path, timeout=60):
+        """本地仓库对象占用的空间（KB，git count-objects）"""
+        result = subprocess.run(['git', '-C', repo_path, 'count-objects', '-v'], capture_output=True, text=True, timeout=timeout)
+        size_kb = 0
+        for line in result.stdout.splitlines():
+            key, _, value = line.partition(':')
+            if key in ('size', 'size-pack') and value.strip().isdigit():
+                size_kb += int(value.strip())
+        return size_kb
+    
+    def plan_slices(self, repo_path, since_date=None, until_date=None):
+        """对象大小超过 slice_min_size_kb 的仓库，超过 slice_days 天的窗口按天数切片；其余仓库返回原窗口"""
+        window = [(since_date, until_date)]
+        if not self.slice_days or self._pack_size_kb(repo_path) < self.slice_min_size_kb:
+            return window
+        
+        bounds = self._slice_bounds(repo_path, since_date, until_date)
+        if bounds is None:
+            return window
+        parts = math.ceil((bounds[1] - bounds[0]) / timedelta(days=self.slice_days))
+        if parts <= 1:
+            return window
+        return self._split_window(since_date, until_date, bounds, parts)
+    
+    def get_commits_sliced(self, repo_path, since_date=None, until_date=None, timeout=300, refs=None):
+        """按时间片获取仓库的提交记录和代码行数统计
+        
+        大仓库的长窗口先按 plan_slices 切片，由 slice_workers 个 git log 并行扫描；某个时间片超时后只把它二分重试
+        （最多 MAX_SLICE_SPLITS 层），已完成的时间片不重复扫描。相邻时间片边界上的提交按 SHA 去重；
+        二分后仍然超时的时间片抛出 SliceScanError，其中带有其余时间片的提交。
+        有可用的预取快照时只扫描快照之后的新提交
+        """
+        snapshot = self.load_snapshot(repo_path, since_date, refs)
+        if snapshot is not None:
+            try:
+                return self._commits_after_snapshot(repo_path, snapshot, since_date, until_date, timeout, refs)
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired, ValueError) as e:
+                # 快照中的起点提交已被清理、新提交过多或时间无法比较
+                print(f"  增量扫描预取快照之后的提交失败: {type(e).__name__}，改为完整扫描")
+        
+        slices = self.plan_slices(repo_path, since_date, until_date)
+        if len(slices) > 1:
+            print(f"  大仓库按 {self.slice_days} 天切为 {len(slices)} 个时间片，{self.slice_workers} 个 git log 并行扫描")
+        
+        commits = {}
+        failed_ranges = []
+        pending = {}
+        
+        with ThreadPoolExecutor(max_workers=self.slice_workers) as pool:
+            def submit(since, until, depth):
+                future = pool.submit(self.get_commits_with_stats, repo_path, since, until, timeout, refs)
+                pending[future] = (since, until, depth)
+            
+            for since, until in slices:
+                submit(since, until, 0)
+            
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    since, until, depth = pending.pop(future)
+                    try:
+                        for commit in future.result():
+                            commits.setdefault(commit['sha'], commit)
+                        continue
+                    except subprocess.TimeoutExpired:
+                        pass
+                    
+                    label = f"{since or '最早'} ~ {until or '现在'}"
+                    bounds = self._slice_bounds(repo_path, since, until) if depth < MAX_SLICE_SPLITS else None
+                    if bounds is None or (bounds[1] - bounds[0]).total_seconds() < 2 * MIN_SLICE_SECONDS:
+                        print(f"  时间片 {label} 扫描超时，不再拆分")
+                        failed_ranges.append((since, until))
+                        continue
+                    
+                    print(f"  时间片 {label} 扫描超时，拆成两半重试")
+                    for half_since, half_until in self._split_window(since, until, bounds, 2):
+                        submit(half_since, half_until, depth + 1)
+        
+        if failed_ranges:
+            # 相邻的失败时间片合并后再报告
+            merged = []
+            for since, until in sorted(failed_ranges, key=lambda item: item[0] or ''):
+                if merged and merged[-1][1] == since:
+                    merged[-1] = (merged[-1][0], until)
+                else:
+                    merged.append((since, until))
+            raise SliceScanError(list(commits.values()), merged)
+        return list(commits.values())
+    
+    def snapshot_path(self, repo_path):
+        """缓存仓库的预取快照路径（CLONE_DIR/.prefetch 下），临时目录中的仓库返回 None"""
+        if not self.is_cached_path(repo_path):
+            return None
+        repo_name = os.path.relpath(os.path.abspath(repo_path), os.path.abspath(self.clone_dir))
+        return os.path.join(self.clone_dir, '.prefetch', repo_name.replace(os.sep, '__') + '.json')
+    
+    def _mailmap_version(self):
+        """当前 mailmap 文件内容的哈希（与 Mailmap.version 一致），未使用 mailmap 时返回 None"""
+        if not self.mailmap_file or not os.path.exists(self.mailmap_file):
+            return None
+        with open(self.mailmap_file, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()[:12]
+    
+    def load_snapshot(self, repo_path, since_date=None, refs=None):
+        """读取仓库的预取快照，格式版本、分支选择或 mailmap 不同、快照起点晚于 since_date 时返回 None
+        
+        快照文件每个仓库只读取一次（forget_ref_tips 之前的多个扫描时间段共用）
+        """
+        if repo_path not in self.snapshots:
+            self.snapshots[repo_path] = self._read_snapshot(repo_path)
+        snapshot = self.snapshots[repo_path]
+        if snapshot is None:
+            return None
+        
+        if snapshot.get('format') != SNAPSHOT_FORMAT:
+            return None
+        if snapshot.get('refs') != (list(refs) if refs is not None else None):
+            return None
+        if snapshot.get('mailmap') != self._mailmap_version():
+            return None
+        if snapshot.get('since'):
+            snapshot_since = self._parse_time(snapshot['since'])
+            requested = self._parse_time(since_date) if since_date else None
+            if snapshot_since is None or requested is None or requested < snapshot_since:
+                return None
+        return snapshot
+    
+    def _read_snapshot(self, repo_path):
+        """读取快照文件，不存在或无法解析时返回 None"""
+        path = self.snapshot_path(repo_path)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def _unreachable_commits(self, repo_path, old_tips, refs, timeout=300):
+        """快照起点可达、当前起点不可达的提交 SHA（快照之后分支被强制推送或删除，这些提交不应再统计）"""
+        if not old_tips:
+            return set()
+        with self.locked(repo_path, exclusive=False):
+            current = self._current_tips(repo_path, refs)
+            result = subprocess.run(['git', '-C', repo_path, 'rev-list', '--stdin'], check=True, capture_output=True,
+                                    text=True, timeout=timeout, input='\n'.join(list(old_tips) + [f'^{sha}' for sha in current]) + '\n')
+        return set(result.stdout.split())
+    
+    def _current_tips(self, repo_path, refs, timeout=60):
+        """当前要统计的起点提交 SHA（refs 为 None 时为所有引用和 HEAD）"""
+        args = ['--all', 'HEAD'] if refs is None else self.resolve_ref_tips(repo_path, refs)
+        result = subprocess.run(['git', '-C', repo_path, 'rev-parse'] + list(args), capture_output=True, text=True, timeout=timeout)
+        return sorted({line.strip() for line in result.stdout.splitlines() if SHA_PATTERN.match(line.strip())})
+    
+    def _commit_times(self, repo_path, since_date, tips, timeout=300):
+        """起点可达、提交时间不早于 since_date 的提交的提交时间（Unix 秒，与 git log --since/--until 比较的时间一致）"""
+        if not tips:
+            return {}
+        log_cmd = ['git', '-C', repo_path, 'log', '--format=%H %ct', '--stdin']
+        if since_date:
+            log_cmd += ['--since', since_date]
+        result = subprocess.run(log_cmd, check=True, capture_output=True, text=True, timeout=timeout,
+                                input='\n'.join(tips) + '\n')
+        times = {}
+        for line in result.stdout.splitlines():
+            sha, _, committed = line.partition(' ')
+            if committed.isdigit():
+                times[sha] = int(committed)
+        return times
+    
+    def _commits_after_snapshot(self, repo_path, snapshot, since_date, until_date, timeout, refs):
+        """快照中落在时间窗口内、当前起点仍然可达的提交，加上快照起点之后新增的提交"""
+        since_ts = self._parse_time(since_date).timestamp() if since_date else None
+        until_dt = self._parse_time(until_date) if until_date else None
+        if until_date and until_dt is None:
+            raise ValueError(f"无法解析结束时间: {until_date}")
+        until_ts = until_dt.timestamp() if until_dt else None
+        times = snapshot['times']
+        unreachable = self._unreachable_commits(repo_path, snapshot['tips'], refs, timeout)
+        if unreachable:
+            print(f"  预取快照之后有分支被强制推送或删除，快照中 {len(unreachable)} 个提交不再可达")
+        
+        commits = {}
+        for commit in snapshot['commits']:
+            committed = times.get(commit['sha'])
+            if committed is None or commit['sha'] in unreachable:
+                continue
+            if (since_ts is None or committed >= since_ts) and (until_ts is None or committed <= until_ts):
+                commits[commit['sha']] = commit
+        cached_count = len(commits)
+        
+        for commit in self.get_commits_with_stats(repo_path, since_date, until_date, timeout, refs, exclude=snapshot['tips']):
+            commits.setdefault(commit['sha'], commit)
+        
+        print(f"  使用预取快照: {cached_count} 个提交，快照之后新增 {len(commits) - cached_count} 个")
+        return list(commits.values())
+    
+    def prefetch_repo(self, repo_url, since_date=None, refs=None, pushed_at=None, timeout=300):
+        """预取仓库：更新本地克隆，并把 since_date 之后的提交和代码行数写入快照，供统计运行只扫描之后的新提交
+        
+        已有快照且 pushed_at（Unix 秒）不晚于快照时间时跳过并返回 None，否则返回快照中的提交数；
+        已有快照时只扫描快照之后的新提交
+        """
+        local_path = os.path.join(self.clone_dir, self._extract_repo_name(repo_url))
+        previous = self.load_snapshot(local_path, since_date, refs)
+        if previous is not None and pushed_at is not None and previous['fetched_at'] >= pushed_at:
+            return None
+        
+        fetched_at = time.time()
+        repo_path = self.clone_repo(repo_url, since_date, timeout)
+        try:
+            # 持有共享锁期间仓库不会被更新，起点和提交列表一致
+            with self.locked(repo_path, exclusive=False):
+                tips = self._current_tips(repo_path, refs)
+                commits = self.get_commits_sliced(repo_path, since_date, None, timeout, refs)
+                times = self._commit_times(repo_path, since_date, tips, timeout)
+        finally:
+            self.forget_ref_tips(repo_path)
+        
+        snapshot = {
+            'format': SNAPSHOT_FORMAT,
+            'since': since_date,
+            'refs': list(refs) if refs is not None else None,
+            'mailmap': self._mailmap_version(),
+            'fetched_at': fetched_at,
+            'tips': tips,
+            'times': times,
+            'commits': commits
+        }
+        path = self.snapshot_path(repo_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return len(commits)
+    
+    def get_repo_commits(self, repo_url, since_date=None, until_date=None, timeout=300, refs=None):
+        """获取仓库的提交记录（包含克隆和查询），部分时间片失败时抛出 SliceScanError"""
         repo_path = None
         is_temp = False
         
         try:
             repo_path = self.clone_repo(repo_url, since_date, timeout)
-            is_temp = repo_path.startswith('/tmp')
-            commits = self.get_commits_with_stats(repo_path, since_date, until_date, timeout)
+            is_temp = not self.is_cached_path(repo_path)
+            commits = self.get_commits_sliced(repo_path, since_date, until_date, timeout, refs)
             return commits
+        except SliceScanError:
+            raise
         except subprocess.TimeoutExpired:
             print(f"  Git 操作超时，跳过仓库: {repo_url}")
             return []
@@ -241,5 +827,43 @@ class GitOperations:
             print(f"  Git 操作失败: {e}，跳过仓库: {repo_url}")
             return []
         finally:
+            if repo_path:
+                self.forget_ref_tips(repo_path)
+            if is_temp and repo_path and os.path.exists(repo_path):
+                shutil.rmtree(repo_path)
+    
+    def get_repo_commits_in_ranges(self, repo_url, ranges, timeout=300, refs=None):
+        """获取仓库在多个时间段内的提交记录（只克隆/更新一次，逐段查询），失败时返回 None
+        
+        部分时间片失败时抛出 SliceScanError，其中带有全部时间段中已成功扫描的提交
+        """
+        repo_path = None
+        is_temp = False
+        
+        try:
+            repo_path = self.clone_repo(repo_url, ranges[0][0] if ranges else None, timeout)
+            is_temp = not self.is_cached_path(repo_path)
+            commits = []
+            failed_ranges = []
+            for since_date, until_date in ranges:
+                try:
+                    commits.extend(self.get_commits_sliced(repo_path, since_date, until_date, timeout, refs))
+                except SliceScanError as e:
+                    commits.extend(e.commits)
+                    failed_ranges.extend(e.failed_ranges)
+            if failed_ranges:
+                raise SliceScanError(commits, failed_ranges)
+            return commits
+        except SliceScanError:
+            raise
+        except subprocess.TimeoutExpired:
+            print(f"  Git 操作超时，跳过仓库: {repo_url}")
+            return None
+        except Exception as e:
+            print(f"  Git 操作失败: {e}，跳过仓库: {repo_url}")
+            return None
+        finally:
+            if repo_path:
+                self.forget_ref_tips(repo_path)
             if is_temp and repo_path and os.path.exists(repo_path):
                 shutil.rmtree(repo_path)
@@ -7,17 +7,40 @@ Gitea API 模块
 
 import requests
 import base64
+import time
+import queue
+import threading
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+from throttle import AdaptiveLimiter, RetryPolicy, parse_retry_after
+from time_utils import parse_datetime
+
+
+class ListingError(RuntimeError):
+    """分页列表请求在重试后仍然失败，列表不完整"""
+    
+    def __init__(self, url, status_code):
+        super().__init__(f"列表请求失败 HTTP {status_code}: {url}")
+        self.url = url
+        self.status_code = status_code
 
 
 class GiteaAPI:
     """Gitea API 交互类"""
     
-    def __init__(self, base_url, token=None, username=None, password=None):
+    def __init__(self, base_url, token=None, username=None, password=None, cache=None,
+                 limiter=None, retry_policy=None, timeout=30):
         self.base_url = base_url.rstrip('/')
         self.token = token
         self.username = username
         self.password = password
+        self.cache = cache
+        self.limiter = limiter or AdaptiveLimiter('http')
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.timeout = timeout
         self.headers = {}
+        self.not_modified_count = 0
+        self.fetched_count = 0
         
         if self.token:
             self.headers['Authorization'] = f'token {self.token}'
@@ -25,6 +48,96 @@ class GiteaAPI:
             credentials = base64.b64encode(f"{self.username}:{self.password}".encode()).decode()
             self.headers['Authorization'] = f'Basic {credentials}'
     
+    def _request(self, url, headers=None, params=None, method='GET', json_body=None):
+        """带自适应并发控制的请求（默认 GET）
+        
+        429 / 5xx / 网络异常按带抖动的指数退避重试，重试耗尽后返回最后一次响应（网络异常则抛出）；
+        写请求的调用方需要自己保证重试幂等
+        """
+        attempt = 0
+        
+        while True:
+            response = None
+            error = None
+            
+            self.limiter.acquire()
+            start = time.monotonic()
+            try:
+                response = requests.request(method, url, headers=headers or self.headers, params=params,
+                                            json=json_body, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            finally:
+                self.limiter.release()
+            
+            retryable = error is not None or response.status_code == 429 or response.status_code >= 500
+            self.limiter.record(time.monotonic() - start, throttled=retryable)
+            
+            if not retryable:
+                return response
+            
+            reason = f"{type(error).__name__}" if error is not None else f"HTTP {response.status_code}"
+            if attempt >= self.retry_policy.max_retries:
+                print(f"  请求失败（{reason}），已重试 {attempt} 次: {url}")
+                if error is not None:
+                    raise error
+                return response
+            
+            retry_after = parse_retry_after(response.headers.get('Retry-After')) if response is not None else None
+            if retry_after:
+                self.limiter.pause(retry_after)
+            delay = self.retry_policy.delay(attempt, retry_after)
+            self.limiter.retry_count += 1
+            attempt += 1
+            print(f"  请求失败（{reason}），{delay:.1f} 秒后第 {attempt} 次重试: {url}")
+            time.sleep(delay)
+    
+    def _get_json(self, url, params=None):
+        """发送 GET 请求并返回 (状态码, JSON 数据)
+        
+        启用缓存时按页 URL 保存 ETag / Last-Modified 和响应体，下次请求带上
+        If-None-Match / If-Modified-Since，服务端返回 304 时直接使用缓存的响应体
+        """
+        cache_key = None
+        cached = None
+        headers = self.headers
+        
+        if self.cache is not None and self.cache.enabled:
+            query = '&'.join(f"{k}={v}" for k, v in sorted((params or {}).items()))
+            cache_key = f"gitea:http:{url}?{query}"
+            cached = self.cache.get(cache_key)
+            if cached:
+                headers = dict(self.headers)
+                if cached.get('etag'):
+                    headers['If-None-Match'] = cached['etag']
+                if cached.get('last_modified'):
+                    headers['If-Modified-Since'] = cached['last_modified']
+        
+        response = self._request(url, headers=headers, params=params)
+        
+        if response.status_code == 304 and cached:
+            self.not_modified_count += 1
+            return 200, cached['body']
+        
+        if response.status_code != 200:
+            print(f"  请求失败 HTTP {response.status_code}: {url}")
+            return response.status_code, None
+        
+        data = response.json()
+        self.fetched_count += 1
+        
+        if cache_key:
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            if etag or last_modified:
+                self.cache.set(cache_key, {
+                    'etag': etag,
+                    'last_modified': last_modified,
+                    'body': data
+                }, expire_seconds=7 * 86400)
+        
+        return 200, data
+    
     def get_users(self):
         """获取所有用户列表，返回 {login: email} 的字典"""
         users = {}
@@ -36,14 +149,9 @@ class GiteaAPI:
                 'page': page,
                 'limit': limit
             }
-            response = requests.get(
-                f'{self.base_url}/api/v1/admin/users',
-                headers=self.headers,
-                params=params
-            )
+            status_code, data = self._get_json(f'{self.base_url}/api/v1/admin/users', params)
             
-            if response.status_code == 200:
-                data = response.json()
+            if status_code == 200:
                 if not data:
                     break
                 
@@ -77,9 +185,8 @@ class GiteaAPI:
                 'page': page,
                 'limit': limit
             }
-            response = requests.get(
+            response = self._request(
                 f'{self.base_url}/api/v1/repos/search',
-                headers=self.headers,
                 params=params
             )
             
@@ -102,11 +209,113 @@ class GiteaAPI:
         
         return users
     
-    def get_repos(self):
+    def get_repos(self, sources=('orgs', 'users', 'search'), users=None, workers=4, failures=None):
         """获取所有仓库列表，排除 fork 的仓库和 fork/ 开头的仓库"""
-        # 直接使用组织接口获取仓库，避免 search 接口的限制和排序问题
-        print(f"  使用组织接口获取仓库列表")
-        return self._get_repos_by_orgs()
+        return list(self.iter_repos(sources, users, workers, failures))
+    
+    @staticmethod
+    def _is_excluded(repo):
+        """fork 仓库和 fork/ 开头的仓库不参与统计"""
+        return bool(repo.get('fork')) or repo.get('full_name', '').startswith('fork/')
+    
+    def iter_repos(self, sources=('orgs', 'users', 'search'), users=None, workers=4, failures=None):
+        """并发遍历组织、用户和全站搜索的仓库列表，按仓库 id 去重，边发现边产出
+        
+        sources 可选 orgs / users / search；users 为用户名列表，不传时通过管理接口获取；
+        某个列表重试后仍然失败时不当作列表结束，而是把失败的地址加入 failures（列表不完整）
+        """
+        if failures is None:
+            failures = []
+        
+        found = queue.Queue()
+        seen = set()
+        seen_lock = threading.Lock()
+        finished = object()
+        
+        def emit(repo):
+            if self._is_excluded(repo):
+                return
+            repo_key = repo.get('id') or repo.get('full_name')
+            with seen_lock:
+                if repo_key in seen:
+                    return
+                seen.add(repo_key)
+            found.put(repo)
+        
+        def walk(url, unwrap=False):
+            page = 1
+            limit = 50
+            
+            while True:
+                params = {
+                    'page': page,
+                    'limit': limit
+                }
+                status_code, data = self._get_json(url, params)
+                
+                if status_code != 200:
+                    raise ListingError(url, status_code)
+                
+                items = data.get('data', []) if unwrap else data
+                if not items:
+                    break
+                
+                for repo in items:
+                    emit(repo)
+                
+                if len(items) < limit:
+                    break
+                
+                page += 1
+        
+        def safe_walk(url, unwrap=False):
+            try:
+                walk(url, unwrap)
+            except Exception as e:
+                print(f"  仓库列表获取失败: {url}: {e}")
+                failures.append(url)
+        
+        def produce():
+            try:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    if 'search' in sources:
+                        executor.submit(safe_walk, f'{self.base_url}/api/v1/repos/search', True)
+                    if 'orgs' in sources:
+                        try:
+                            org_names = self._get_orgs()
+                        except Exception as e:
+                            print(f"  组织列表获取失败: {e}")
+                            failures.append(f'{self.base_url}/api/v1/admin/orgs')
+                            org_names = []
+                        for org_name in org_names:
+                            executor.submit(safe_walk, f'{self.base_url}/api/v1/orgs/{org_name}/repos')
+                    if 'users' in sources:
+                        user_names = users
+                        if user_names is None:
+                            all_users = self.get_users()
+                            if all_users is None:
+                                print("  用户列表获取失败，无法遍历用户的仓库")
+                                failures.append(f'{self.base_url}/api/v1/admin/users')
+                            user_names = list((all_users or {}).keys())
+                        for username in user_names:
+                            executor.submit(safe_walk, f'{self.base_url}/api/v1/users/{username}/repos')
+            except Exception as e:
+                print(f"  仓库发现异常: {e}")
+                failures.append(str(e))
+            finally:
+                found.put(finished)
+        
+        print(f"  并发获取仓库列表: {', '.join(sources)}")
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        
+        while True:
+            repo = found.get()
+            if repo is finished:
+                break
+            yield repo
+        
+        producer.join()
     
     def _get_repos_by_search(self):
         """使用 search 接口获取仓库列表（备用方法）"""
@@ -120,9 +329,8 @@ class GiteaAPI:
                 'page': page,
                 'limit': limit
             }
-            response = requests.get(
+            response = self._request(
                 f'{self.base_url}/api/v1/repos/search',
-                headers=self.headers,
                 params=params
             )
             
@@ -158,9 +366,8 @@ class GiteaAPI:
                     'page': page,
                     'limit': limit
                 }
-                response = requests.get(
+                response = self._request(
                     f'{self.base_url}/api/v1/users/{username}/repos',
-                    headers=self.headers,
                     params=params
                 )
                 
@@ -198,16 +405,10 @@ class GiteaAPI:
                     'page': page,
                     'limit': limit
                 }
-                response = requests.get(
-                    f'{self.base_url}/api/v1/orgs/{org_name}/repos',
-                    headers=self.headers,
-                    params=params
-                )
+                status_code, data = self._get_json(f'{self.base_url}/api/v1/orgs/{org_name}/repos', params)
                 
-                if response.status_code != 200:
+                if status_code != 200:
                     break
-                
-                data = response.json()
                 if not data:
                     break
                 
@@ -223,7 +424,7 @@ class GiteaAPI:
         return repos
     
     def _get_orgs(self):
-        """获取所有组织"""
+        """获取所有组织，某页重试后仍然失败时抛出 ListingError（不返回不完整的列表）"""
         orgs = []
         page = 1
         limit = 50
@@ -233,16 +434,11 @@ class GiteaAPI:
                 'page': page,
                 'limit': limit
             }
-            response = requests.get(
-                f'{self.base_url}/api/v1/admin/orgs',
-                headers=self.headers,
-                params=params
-            )
+            url = f'{self.base_url}/api/v1/admin/orgs'
+            status_code, data = self._get_json(url, params)
             
-            if response.status_code != 200:
-                break
-            
-            data = response.json()
+            if status_code != 200:
+                raise ListingError(url, status_code)
             if not data:
                 break
             
@@ -258,9 +454,95 @@ class GiteaAPI:
         
         return orgs
     
-    def get_repo_commits(self, owner, repo_name, since=None):
-        """获取指定仓库的所有提交记录（使用 API）"""
-        commits = []
+    def get_teams(self, orgs=None):
+        """获取组织下所有团队及成员，返回 {"组织/团队": [login, ...]} 的字典"""
+        teams = {}
+        
+        if orgs is None:
+            orgs = self._get_orgs()
+        
+        for org_name in orgs:
+            page = 1
+            limit = 50
+            
+            while True:
+                params = {
+                    'page': page,
+                    'limit': limit
+                }
+                status_code, data = self._get_json(f'{self.base_url}/api/v1/orgs/{org_name}/teams', params)
+                
+                if status_code != 200:
+                    break
+                if not data:
+                    break
+                
+                for team in data:
+                    team_id = team.get('id')
+                    team_name = team.get('name', '')
+                    if team_id and team_name:
+                        teams[f"{org_name}/{team_name}"] = self._get_team_members(team_id)
+                
+                if len(data) < limit:
+                    break
+                
+                page += 1
+        
+        return teams
+    
+    def get_branch_protections(self, owner, repo_name):
+        """获取仓库的分支保护规则名（可能是分支名或通配符），失败时返回 None"""
+        status_code, data = self._get_json(f'{self.base_url}/api/v1/repos/{owner}/{repo_name}/branch_protections')
+        
+        if status_code != 200:
+            return None
+        
+        rules = []
+        for protection in data or []:
+            rule_name = protection.get('rule_name') or protection.get('branch_name')
+            if rule_name:
+                rules.append(rule_name)
+        
+        return rules
+    
+    def get_file(self, owner, repo_name, path, ref=None):
+        """读取仓库中的文件，返回 (blob sha, 内容 bytes)，文件不存在时返回 None，请求失败时抛出 RuntimeError"""
+        response = self._request(
+            f'{self.base_url}/api/v1/repos/{owner}/{repo_name}/contents/{quote(path)}',
+            params={'ref': ref} if ref else None
+        )
+        
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise RuntimeError(f"读取文件失败 HTTP {response.status_code}: {owner}/{repo_name}/{path}")
+        
+        data = response.json()
+        return data.get('sha'), base64.b64decode(data.get('content') or '')
+    
+    def change_files(self, owner, repo_name, branch, message, files):
+        """在一次提交中创建/更新多个文件（Gitea 1.20+ 的批量文件接口），返回 HTTP 状态码
+        
+        branch 为空时提交到仓库默认分支；files 为 [{'operation': 'create' | 'update', 'path', 'content'(base64), 'sha'(更新时)}]
+        """
+        body = {
+            'message': message,
+            'files': files
+        }
+        if branch:
+            body['branch'] = branch
+        response = self._request(
+            f'{self.base_url}/api/v1/repos/{owner}/{repo_name}/contents',
+            method='POST',
+            json_body=body
+        )
+        if response.status_code not in (200, 201):
+            print(f"  批量提交文件失败 HTTP {response.status_code}: {response.text[:200]}")
+        return response.status_code
+    
+    def _get_team_members(self, team_id):
+        """获取团队成员登录名列表"""
+        members = []
         page = 1
         limit = 50
         
@@ -269,27 +551,116 @@ class GiteaAPI:
                 'page': page,
                 'limit': limit
             }
+            status_code, data = self._get_json(f'{self.base_url}/api/v1/teams/{team_id}/members', params)
+            
+            if status_code != 200:
+                break
+            if not data:
+                break
+            
+            for user in data:
+                if user.get('login'):
+                    members.append(user['login'])
+            
+            if len(data) < limit:
+                break
+            
+            page += 1
+        
+        return members
+    
+    def get_branches(self, owner, repo_name):
+        """获取仓库的所有分支名，失败时返回 None"""
+        branches = []
+        page = 1
+        limit = 50
+        
+        while True:
+            status_code, data = self._get_json(
+                f'{self.base_url}/api/v1/repos/{owner}/{repo_name}/branches',
+                params={'page': page, 'limit': limit}
+            )
+            if status_code != 200:
+                return None
+            
+            branches.extend(branch['name'] for branch in data or [])
+            
+            if not data or len(data) < limit:
+                break
+            
+            page += 1
+        
+        return branches
+    
+    def get_repo_commits(self, owner, repo_name, sha=None, since=None, until=None, max_commits=None, seen=None):
+        """获取仓库指定分支的提交记录（使用 API，含每个提交的增删行数）
+        
+        since / until 同时传给服务端（Gitea 1.23+ 支持）并在本地按提交时间判断：整页提交都早于 since 时停止翻页，
+        兼容忽略这两个参数的旧版本。请求失败或提交数超过 max_commits 时返回 None，由调用方改用 Git
+        
+        seen 为多个分支共用的已获取 SHA 集合：只返回其中没有的提交并加入集合，max_commits 按集合大小（不重复的提交数）判断；
+        某页的提交全部已经获取过时，说明该分支剩下的历史与之前的分支相同，停止翻页
+        """
+        since_dt = parse_datetime(since) if since else None
+        if seen is None:
+            seen = set()
+        commits = []
+        page = 1
+        limit = 50
+        
+        while True:
+            params = {
+                'page': page,
+                'limit': limit,
+                'stat': 'true',
+                'verification': 'false',
+                'files': 'false'
+            }
+            if sha:
+                params['sha'] = sha
             if since:
                 params['since'] = since
+            if until:
+                params['until'] = until
             
-            response = requests.get(
+            response = self._request(
                 f'{self.base_url}/api/v1/repos/{owner}/{repo_name}/commits',
-                headers=self.headers,
                 params=params
             )
             
+            if response.status_code == 409:
+                # 空仓库
+                return commits
             if response.status_code != 200:
+                print(f"  请求失败 HTTP {response.status_code}: {owner}/{repo_name} 提交列表")
+                return None
+            
+            # 总数包含与之前分支共同的提交，只在还没有获取过提交时用于提前判断
+            total = response.headers.get('X-Total-Count')
+            if max_commits is not None and page == 1 and not seen and total and total.isdigit() and int(total) > max_commits:
+                print(f"  API 报告 {total} 个提交，超过 {max_commits}")
                 return None
             
             data = response.json()
             if not data:
                 break
             
-            commits.extend(data)
+            new_commits = [item for item in data if item.get('sha') not in seen]
+            seen.update(item.get('sha') for item in new_commits)
+            commits.extend(new_commits)
             
-            if len(data) < limit:
+            if max_commits is not None and len(seen) > max_commits:
+                print(f"  已获取 {len(seen)} 个提交，超过 {max_commits}")
+                return None
+            
+            if len(data) < limit or not new_commits:
                 break
             
+            if since_dt is not None:
+                dates = [parse_datetime(((item.get('commit') or {}).get('committer') or {}).get('date')) for item in data]
+                if all(date is not None and date < since_dt for date in dates):
+                    break
+            
             page += 1
         
         return commits
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Gitea 代码贡献度统计 - 历史报告
+从提交日志（COMMIT_LOG）按任意时间窗口生成报告和 JSON，不访问 Gitea API 和 Git，
+用于同比等历史分析
+"""
+
+import os
+import sys
+import argparse
+from datetime import datetime, timezone
+
+from config import load_config
+from commit_log import CommitLog
+from report_generator import ReportGenerator
+from time_utils import parse_datetime
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='从提交日志生成历史报告')
+    parser.add_argument('--since', required=True, help='起始时间（YYYY-MM-DD 或 YYYY-MM-DD HH:MM:SS，UTC）')
+    parser.add_argument('--until', help='结束时间（同上，不填为至今）')
+    parser.add_argument('--yoy', action='store_true', help='同时统计上一年相同窗口，输出同比变化')
+    parser.add_argument('--output', default='history_report.md', help='报告文件名（写到 OUTPUT_PATH 下）')
+    parser.add_argument('--json', dest='json_file', help='JSON 文件名（写到 OUTPUT_PATH 下）')
+    return parser.parse_args()
+
+
+def previous_year(date_str):
+    """同一时间点的上一年（2 月 29 日退到 2 月 28 日）"""
+    if not date_str:
+        return None
+    dt = parse_datetime(date_str)
+    try:
+        return dt.replace(year=dt.year - 1).isoformat()
+    except ValueError:
+        return dt.replace(year=dt.year - 1, day=28).isoformat()
+
+
+def percent_change(current, previous):
+    """同比变化的显示：+n (+x%)"""
+    change = current - previous
+    if not previous:
+        return f"{change:+,}"
+    return f"{change:+,} ({change / previous * 100:+.1f}%)"
+
+
+def main():
+    """主函数"""
+    args = parse_args()
+    
+    print("=" * 80)
+    print("Gitea 代码贡献度统计工具 - 历史报告")
+    print("=" * 80)
+    print()
+    
+    config = load_config()
+    commit_log = CommitLog(config.get('COMMIT_LOG'))
+    if not commit_log.enabled:
+        print("错误: 未配置 COMMIT_LOG 或提交日志不可用")
+        sys.exit(1)
+    
+    since_date = parse_datetime(args.since).isoformat()
+    until_date = parse_datetime(args.until).isoformat() if args.until else None
+    earliest = commit_log.earliest()
+    checked_since = previous_year(since_date) if args.yoy else since_date
+    if earliest is None or parse_datetime(checked_since).timestamp() < earliest:
+        earliest_str = datetime.fromtimestamp(earliest, timezone.utc).isoformat() if earliest is not None else '无'
+        print(f"警告: 提交日志中最早的提交为 {earliest_str}，早于此时间的窗口数据不完整，"
+              f"请先用覆盖 {checked_since[:10]} 起的窗口运行一次统计补齐历史")
+    stats = commit_log.build_stats(since_date, until_date)
+    print(f"从提交日志读取 {stats['total_commits']} 个提交")
+    
+    if args.yoy:
+        # 不填结束时间时窗口截止到现在，上一年的窗口也截止到一年前的现在，而不是至今
+        last_year_until = previous_year(until_date or datetime.now(timezone.utc).isoformat())
+        last_year = commit_log.build_stats(previous_year(since_date), last_year_until)
+        stats['yoy'] = {
+            'since': previous_year(since_date),
+            'until': last_year_until,
+            'total_commits': last_year['total_commits'],
+            'total_lines': last_year['total_lines'],
+            'total_repos': last_year['total_repos'],
+            'total_contributors': len(last_year['user_stats'])
+        }
+        print(f"同比（{previous_year(since_date)[:10]} 起的相同窗口）: "
+              f"提交 {percent_change(stats['total_commits'], last_year['total_commits'])}，"
+              f"代码行数 {percent_change(stats['total_lines'], last_year['total_lines'])}，"
+              f"贡献人数 {percent_change(len(stats['user_stats']), len(last_year['user_stats']))}")
+    
+    output_path = config.get('OUTPUT_PATH') or ''
+    if output_path and not os.path.exists(output_path):
+        os.makedirs(output_path, exist_ok=True)
+    
+    # 历史报告不请求 Gitea 用户表：用户排行只列窗口内有提交的用户，不显示真实姓名
+    gitea_users = {username: {} for username in stats['user_stats']}
+    report_generator = ReportGenerator(gitea_users, config.get('GITEA_URL') or '', int(config['REPORT_TOP_USERS']))
+    output_file = os.path.join(output_path, args.output) if output_path else args.output
+    report = report_generator.generate_text_report(stats, output_file, since_date, until_date)
+    print("\n" + report)
+    
+    if args.json_file:
+        json_file = os.path.join(output_path, args.json_file) if output_path else args.json_file
+        report_generator.export_json(stats, json_file)
+    
+    print(f"\n历史报告生成完成: {datetime.now().strftime('%Y-%m-%d %H:%M')}")
+
+
+if __name__ == '__main__':
+    main()
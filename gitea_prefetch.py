@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Gitea 代码贡献度统计 - 日间预取
+在定时统计运行之前，按最近推送时间反复更新活跃仓库的本地克隆，并把统计窗口内的提交和代码行数写入快照，
+定时运行只需 fetch 并扫描快照之后的少量新提交
+"""
+
+import time
+from datetime import datetime
+
+from config import load_config, validate_config
+from stats_collector import StatsCollector
+from gitea_stats import process_date_range
+
+
+def seconds_until(stop_at):
+    """距离当天停止时间（本地时间 HH:MM）的秒数，已过停止时间时为负数"""
+    hour, minute = (int(part) for part in stop_at.split(':'))
+    now = datetime.now()
+    return (now.replace(hour=hour, minute=minute, second=0, microsecond=0) - now).total_seconds()
+
+
+def main():
+    """主函数"""
+    print("=" * 80)
+    print("Gitea 代码贡献度统计工具 - 日间预取")
+    print("=" * 80)
+    print()
+    
+    # 统计窗口、CLONE_DIR、REF_POLICY、MAILMAP_FILE 与定时运行使用同一份配置，快照才能被定时运行使用
+    config = load_config()
+    validate_config(config)
+    
+    interval = int(config.get('PREFETCH_INTERVAL') or 1800)
+    stop_at = config.get('PREFETCH_STOP')
+    
+    collector = StatsCollector(config)
+    rounds = 0
+    
+    while True:
+        since_date, until_date = process_date_range(config)
+        started = time.monotonic()
+        collector.prefetch(since_date, until_date)
+        rounds += 1
+        
+        # 未配置 PREFETCH_STOP 时只预取一轮（由 cron 反复启动）
+        if not stop_at or interval <= 0:
+            break
+        wait_seconds = max(0, interval - (time.monotonic() - started))
+        if seconds_until(stop_at) <= wait_seconds:
+            print(f"已接近停止时间 {stop_at}，结束预取，共 {rounds} 轮")
+            break
+        print(f"{wait_seconds:.0f} 秒后开始下一轮预取")
+        time.sleep(wait_seconds)
+
+
+if __name__ == '__main__':
+    main()
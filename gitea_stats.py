@@ -18,12 +18,20 @@ Gitea 所有项目所有人员代码贡献度统计工具
 
 import sys
 import os
-import shutil
+import socket
+import argparse
 from datetime import datetime, timedelta, timezone
 
-from config import load_config, validate_config
+from config import load_config, validate_config, run_window, window_id
 from stats_collector import StatsCollector
 from report_generator import ReportGenerator
+from commit_exporter import CommitExporter
+from ranking import RankingEngine
+from snapshot_store import SnapshotStore
+from report_publisher import ReportPublisher
+from profiler import PhaseProfiler
+from repo_lock import FileLock
+import stats_collector
 
 
 def process_date_range(config):
@@ -72,8 +80,64 @@ def process_date_range(config):
     return since_date, until_date
 
 
+def acquire_run_lock(config):
+    """获取运行锁：统计窗口配置相同的运行按 RUN_LOCK_WAIT 处理，窗口不同的运行可以并行（共用的仓库由仓库锁保护）
+    
+    RUN_LOCK_WAIT=wait 时最多等待 RUN_LOCK_TIMEOUT 秒，超时退出（退出码 1）；skip 时直接跳过本次运行（退出码 0）；
+    fail 时直接退出（退出码 1）。返回持有的锁，进程退出时自动释放
+    """
+    window = run_window(config)
+    lock_dir = os.path.join(config.get('CLONE_DIR') or config.get('OUTPUT_PATH') or '.', '.locks')
+    lock = FileLock(os.path.join(lock_dir, f"run_{window_id(config)}.lock"))
+    
+    policy = (config.get('RUN_LOCK_WAIT') or 'wait').lower()
+    timeout = int(config.get('RUN_LOCK_TIMEOUT') or 3600) if policy == 'wait' else 0
+    
+    def on_wait(holder):
+        print(f"相同统计窗口的运行正在进行（{holder or '未知'}），最多等待 {timeout} 秒...")
+    
+    if not lock.acquire(exclusive=True, timeout=timeout, on_wait=on_wait):
+        holder = lock.read() or '未知'
+        if policy == 'skip':
+            print(f"相同统计窗口的运行正在进行（{holder}），RUN_LOCK_WAIT=skip，跳过本次运行")
+            sys.exit(0)
+        if policy == 'wait':
+            print(f"错误: 等待 {timeout} 秒后相同统计窗口的运行仍在进行（{holder}），退出")
+        else:
+            print(f"错误: 相同统计窗口的运行正在进行（{holder}），RUN_LOCK_WAIT={policy}，退出")
+        sys.exit(1)
+    
+    lock.write(f"pid={os.getpid()} host={socket.gethostname()} started={datetime.now().strftime('%Y-%m-%d %H:%M:%S')} {window}")
+    return lock
+
+
+def parse_args():
+    """解析命令行参数（其余配置均来自 gs.env）"""
+    parser = argparse.ArgumentParser(description='Gitea 代码贡献度统计工具')
+    parser.add_argument('--profile', action='store_true',
+                        help='按阶段收集 cProfile 和 tracemalloc 数据，结果写到报告所在目录')
+    return parser.parse_args()
+
+
+def install_profiler(profiler, collector):
+    """把收集阶段的关键函数替换为带阶段统计的版本"""
+    profiler.wrap(collector, 'collect_all_stats', 'collect')
+    profiler.wrap(collector, 'get_gitea_users', 'api_listing')
+    profiler.wrap(collector, 'get_teams', 'api_listing')
+    profiler.wrap(collector.gitea_api, '_get_json', 'api_listing')
+    profiler.wrap(collector.git_ops, 'clone_repo', 'clone_repo')
+    profiler.wrap(collector.git_ops, 'get_commits_sliced', 'git_log')
+    profiler.wrap(stats_collector, 'aggregate_commits', 'aggregate')
+    profiler.wrap(collector, '_merge_partial', 'aggregate')
+    
+    if collector.scan_mode != 'serial':
+        print(f"注意: SCAN_MODE={collector.scan_mode} 时 git log 解析和聚合在工作进程中执行，不计入性能分析，建议用 serial 模式分析")
+
+
 def main():
     """主函数"""
+    args = parse_args()
+    
     print("=" * 80)
     print("Gitea 代码贡献度统计工具")
     print("=" * 80)
@@ -88,19 +152,71 @@ def main():
     # 处理时间范围参数
     since_date, until_date = process_date_range(config)
     
+    # 相同统计窗口的运行互斥（cron 与手动补跑同时启动时）
+    run_lock = acquire_run_lock(config)
+    
     # 创建统计收集器
     collector = StatsCollector(config)
     
+    # --profile：按阶段收集 CPU 和内存数据
+    profiler = None
+    if args.profile:
+        profiler = PhaseProfiler()
+        install_profiler(profiler, collector)
+        print("性能分析已启用")
+    
     # 清理所有提交记录的缓存
     if collector.redis_cache and collector.redis_cache.enabled:
         collector.redis_cache.delete_pattern('gitea:commits:*')
         print("已清理所有提交记录缓存")
     
-    # 收集统计数据
-    stats = collector.collect_all_stats(since_date=since_date, until_date=until_date)
+    # 确定输出路径
+    output_path = config.get('OUTPUT_PATH', '')
+    if output_path:
+        if not os.path.exists(output_path):
+            os.makedirs(output_path, exist_ok=True)
+            print(f"创建输出目录: {output_path}")
+    
+    # 收集统计数据（配置 COMMITS_EXPORT 时同时流式导出提交明细）
+    commits_export_file = config.get('COMMITS_EXPORT')
+    if commits_export_file:
+        if output_path:
+            commits_export_file = os.path.join(output_path, commits_export_file)
+        with CommitExporter(commits_export_file) as commit_exporter:
+            stats = collector.collect_all_stats(since_date=since_date, until_date=until_date, commit_exporter=commit_exporter)
+    else:
+        stats = collector.collect_all_stats(since_date=since_date, until_date=until_date)
+    
+    # 计算综合排名（需要 numpy，RANK_MODE=lines 时按代码行数排序）
+    if config.get('RANK_MODE', 'composite') == 'composite':
+        ranking_engine = RankingEngine(
+            weights=RankingEngine.parse_weights(config.get('RANK_WEIGHTS')),
+            cap_percentile=float(config['RANK_CAP_PERCENTILE']),
+            bootstrap_rounds=int(config['RANK_BOOTSTRAP'])
+        )
+        if profiler:
+            profiler.wrap(ranking_engine, 'rank', 'ranking')
+        rankings = ranking_engine.rank(stats['user_stats'], collector.size_sketches)
+        if rankings:
+            stats['rankings'] = rankings
     
     # 创建报告生成器
-    report_generator = ReportGenerator(collector.gitea_users)
+    report_generator = ReportGenerator(collector.gitea_users, config['GITEA_URL'], int(config['REPORT_TOP_USERS']))
+    if profiler:
+        profiler.wrap(report_generator, 'generate_text_report', 'report')
+        profiler.wrap(report_generator, 'generate_view_reports', 'report')
+        profiler.wrap(report_generator, 'export_json', 'report')
+    
+    # 与上次相同窗口天数的运行快照比较，计算排名变化和指标增减（配置 SNAPSHOT_DB 时）
+    snapshot_store = SnapshotStore(config.get('SNAPSHOT_DB'))
+    if snapshot_store.enabled:
+        previous = snapshot_store.previous(SnapshotStore.window_days(since_date, until_date))
+        deltas = report_generator.compute_deltas(stats, previous)
+        if deltas:
+            stats['deltas'] = deltas
+            print(f"与上次运行比较: {deltas['previous']['created_at'][:16].replace('T', ' ')} UTC")
+        else:
+            print("没有相同窗口的历史快照，本次报告不显示变化")
     
     # 生成带时间戳的文件名
     timestamp = datetime.now().strftime('%Y%m%d_%H%M')
@@ -109,18 +225,23 @@ def main():
         output_file = output_file.replace('.md', '').replace('.txt', '')
         output_file = f"{output_file}_{timestamp}.md"
     
-    # 确定输出路径
-    output_path = config.get('OUTPUT_PATH', '')
     if output_path:
-        if not os.path.exists(output_path):
-            os.makedirs(output_path, exist_ok=True)
-            print(f"创建输出目录: {output_path}")
         output_file = os.path.join(output_path, output_file)
     
     # 生成报告
     report = report_generator.generate_text_report(stats, output_file, since_date, until_date)
     print("\n" + report)
     
+    # 按组织/团队/用户拆分的视图报告（基于同一份聚合数据）
+    view_files = []
+    views = ReportGenerator.parse_views(config.get('REPORT_VIEWS'))
+    if views:
+        teams = collector.get_teams() if any(kind == 'team' for kind, _ in views) else {}
+        view_prefix = os.path.basename(output_file).rsplit(f"_{timestamp}", 1)[0] if output_file else 'report'
+        view_files = report_generator.generate_view_reports(
+            stats, views, output_path, timestamp, teams, since_date, until_date, prefix=view_prefix
+        )
+    
     # 导出 JSON
     json_file = config['JSON_FILE']
     if json_file:
@@ -128,54 +249,40 @@ def main():
             json_file = os.path.join(output_path, json_file)
         report_generator.export_json(stats, json_file)
     
-    # 复制报告到指定目录（仅在 iscommit 为 true 时执行）
+    # 保存本次运行快照，供下次报告比较；仓库列表不完整时不保存，避免下次把缺失的仓库算成贡献下降
+    if stats.get('incomplete'):
+        print("\n警告: 部分仓库列表获取失败，本次统计不完整，不保存运行快照")
+    else:
+        snapshot_store.save(stats, since_date, until_date)
+    snapshot_store.close()
+    
+    # 通过 Gitea API 发布报告到文档仓库（仅在 iscommit 为 true 时执行）
     if config.get('iscommit', 'true').lower() == 'true':
-        target_report_dir = '/home/gitea/clone/doc/w01.k8s/docker/gitea/report'
-        if not os.path.exists(target_report_dir):
-            os.makedirs(target_report_dir, exist_ok=True)
-            print(f"创建目标目录: {target_report_dir}")
-        
-        # 复制 Markdown 报告
-        if output_path:
-            source_md_file = output_file
-            target_md_file = os.path.join(target_report_dir, os.path.basename(output_file))
-            shutil.copy(source_md_file, target_md_file)
-            print(f"复制 Markdown 报告到: {target_md_file}")
-        
-        # 复制 JSON 报告
-        if json_file:
-            if output_path:
-                source_json_file = json_file
-                target_json_file = os.path.join(target_report_dir, os.path.basename(json_file))
-                shutil.copy(source_json_file, target_json_file)
-                print(f"复制 JSON 报告到: {target_json_file}")
-        
-        # Git 提交和推送
-        try:
-            import subprocess
-            
-            # 进入目标目录
-            os.chdir(target_report_dir)
-            
-            # 添加所有文件
-            subprocess.run(['git', 'add', '.'], check=True, capture_output=True, text=True)
-            
-            # 提交
-            commit_message = f"更新代码贡献度统计报告 - {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-            subprocess.run(['git', 'commit', '-m', commit_message], check=True, capture_output=True, text=True)
-            
-            # 推送
-            subprocess.run(['git', 'push'], check=True, capture_output=True, text=True)
-            
-            print(f"已提交并推送到 Gitea: {target_report_dir}")
-        except subprocess.CalledProcessError as e:
-            print(f"Git 操作失败: {e}")
-            print(f"错误输出: {e.stderr}")
-        except Exception as e:
-            print(f"发生错误: {e}")
+        publisher = ReportPublisher(
+            collector.gitea_api,
+            config['REPORT_REPO'],
+            branch=config.get('REPORT_BRANCH'),
+            directory=config['REPORT_REPO_DIR']
+        )
+        if profiler:
+            profiler.wrap(publisher, 'publish', 'publish')
+        commit_message = f"更新代码贡献度统计报告 - {datetime.now().strftime('%Y-%m-%d %H:%M')}"
+        publisher.publish([output_file] + view_files + [json_file], commit_message)
     else:
-        print("\niscommit=false，跳过复制报告和 Git 提交推送操作")
+        print("\niscommit=false，跳过发布报告")
+    
+    # 性能分析结果写到报告所在目录，文件名以报告名为前缀
+    if profiler:
+        profile_prefix = os.path.basename(output_file).rsplit('.', 1)[0] if output_file else f"report_{timestamp}"
+        profiler.write(output_path, profile_prefix)
     
+    run_lock.release()
+    if stats.get('incomplete'):
+        failures = stats['run_metrics']['discovery_failures']
+        print(f"\n统计完成，但结果不完整: {len(failures)} 个仓库列表获取失败")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(2)
     print("\n统计完成！")
 
 
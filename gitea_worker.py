@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Gitea 代码贡献度统计 - 分布式工作节点
+从 Redis 队列领取协调者（SCAN_MODE=distributed 的 gitea_stats.py）推送的仓库任务，
+拉取并解析后把部分结果写回 Redis，由协调者合并生成报告
+"""
+
+from config import load_config, validate_config
+from stats_collector import StatsCollector
+
+
+def main():
+    """主函数"""
+    print("=" * 80)
+    print("Gitea 代码贡献度统计工具 - 工作节点")
+    print("=" * 80)
+    print()
+    
+    # 加载配置（Redis 连接参数与协调者一致，Git 认证和 CLONE_DIR 使用本机配置）
+    config = load_config()
+    validate_config(config)
+    
+    collector = StatsCollector(config)
+    collector.run_worker()
+
+
+if __name__ == '__main__':
+    main()
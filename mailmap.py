@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Mailmap 生成模块
+负责根据 Gitea 用户邮箱和已解析过的作者身份生成 Git mailmap 文件，
+让 git log 直接输出规范化的作者（%aN / %aE），减少需要在 Python 中逐个匹配的身份
+"""
+
+import os
+import re
+import hashlib
+
+
+# "规范名 <规范邮箱> 提交名 <提交邮箱>" 和 "规范名 <规范邮箱> <提交邮箱>" 两种条目
+ENTRY_PATTERN = re.compile(r'^(?P<name>[^<]+?) <(?P<email>[^>]*)>(?: (?P<commit_name>[^<]+?))? <(?P<commit_email>[^>]*)>$')
+
+
+class Mailmap:
+    """Git mailmap 生成类
+    
+    包含两类条目：
+    - 邮箱规则：Gitea 用户邮箱的提交一律映射为该用户（与 Gitea 按邮箱关联提交一致）
+    - 已学习身份：此前由 USER_ALIASES 或模糊匹配解析到用户的 (作者名, 邮箱)，每次运行用当前用户表和别名重新验证；
+      作者名是别名或登录名、邮箱却属于另一个用户时，UserMatcher 按作者名匹配，这类身份也写成已学习身份，
+      Git 和 lookup 都先匹配 (作者名, 邮箱) 条目再匹配邮箱规则，与 UserMatcher 的优先级一致
+    
+    文件内容不变时不重写；版本为内容的哈希，用于区分缓存
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.enabled = bool(path)
+        self.email_rules = {}
+        self.learned = {}
+        self.version = None
+        self._learned_index = {}
+        self._user_emails = {}
+        
+        if self.enabled and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.parse(f.read())
+            except Exception as e:
+                print(f"读取 mailmap 失败: {e}，将重新生成")
+    
+    def parse(self, text):
+        """读取 mailmap 文本，替换当前条目"""
+        self.email_rules = {}
+        self.learned = {}
+        for line in text.splitlines():
+            if not line.strip() or line.startswith('#'):
+                continue
+            match = ENTRY_PATTERN.match(line.strip())
+            if match is None:
+                continue
+            if match.group('commit_name'):
+                self.learned[(match.group('commit_name'), match.group('commit_email'))] = match.group('name')
+            else:
+                self.email_rules[match.group('commit_email').lower()] = (match.group('name'), match.group('email'))
+    
+    def build(self, gitea_users, matcher):
+        """按当前用户表重建邮箱规则、重新验证已学习身份并写入文件，返回文件路径"""
+        self.email_rules = {}
+        for login, user_data in gitea_users.items():
+            email = (user_data.get('email') or '').lower()
+            # 多个用户使用同一邮箱时与 UserMatcher 一致，取第一个
+            if email and email not in self.email_rules and self._valid(login, email):
+                self.email_rules[email] = (login, user_data.get('email'))
+        
+        learned = self.learned
+        self.learned = {}
+        self.learn({identity: matcher.match(*identity) for identity in learned})
+        
+        return self.write()
+    
+    @staticmethod
+    def _valid(name, email):
+        """mailmap 无法表示含尖括号或换行的名字和邮箱"""
+        return not any(ch in f"{name}{email}" for ch in '<>\n')
+    
+    def learn(self, identities):
+        """加入本次解析到用户的作者身份 {(作者名, 邮箱): 用户名}，返回新增条数
+        
+        邮箱规则已经映射到同一用户、或没有邮箱规则且作者名就是用户名时不需要条目
+        """
+        added = 0
+        for (name, email), username in identities.items():
+            if not username or not name.strip() or not self._valid(name, email):
+                continue
+            rule = self.email_rules.get(email.lower())
+            if (rule[0] if rule else name) == username or (name, email) in self.learned:
+                continue
+            self.learned[(name, email)] = username
+            added += 1
+        return added
+    
+    def render(self):
+        """生成 mailmap 文本（条目排序，内容相同时版本相同）"""
+        lines = ["# 由 gitea_stats 自动生成，请勿手工修改"]
+        for commit_email, (login, email) in sorted(self.email_rules.items()):
+            lines.append(f"{login} <{email}> <{commit_email}>")
+        user_emails = {login: email for login, email in self.email_rules.values()}
+        for (name, email), username in sorted(self.learned.items()):
+            # 没有邮箱的用户沿用提交邮箱
+            lines.append(f"{username} <{user_emails.get(username, email)}> {name} <{email}>")
+        return "\n".join(lines) + "\n"
+    
+    def write(self):
+        """内容变化时写入文件，返回文件路径"""
+        text = self.render()
+        self.version = hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]
+        # Git 比较名字和邮箱时不区分大小写
+        self._learned_index = {(name.lower(), email.lower()): username for (name, email), username in self.learned.items()}
+        self._user_emails = {login: email for login, email in self.email_rules.values()}
+        
+        current = None
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                current = f.read()
+        
+        if current != text:
+            path_dir = os.path.dirname(self.path)
+            if path_dir and not os.path.exists(path_dir):
+                os.makedirs(path_dir, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, self.path)
+        
+        return self.path
+    
+    def lookup(self, name, email):
+        """按 Git 的规则查找规范身份：先匹配 (作者名, 邮箱)，再匹配邮箱，返回 (作者名, 邮箱)（需先调用 write）"""
+        username = self._learned_index.get(((name or '').lower(), (email or '').lower()))
+        if username is not None:
+            return username, self._user_emails.get(username, email)
+        rule = self.email_rules.get((email or '').lower())
+        if rule is not None:
+            return rule
+        return name, email
+    
+    def apply(self, records):
+        """把 mailmap 应用到非 git log 来源（提交 API）的提交记录，保证两种获取方式的作者一致
+        
+        与 git log 一样，作者有变化时在 author.raw 中保留原始作者
+        """
+        for record in records:
+            author = record['author']
+            raw = [author.get('name', ''), author.get('email', '')]
+            name, email = self.lookup(*raw)
+            if [name, email] != raw:
+                author['raw'] = raw
+            author['login'] = author['name'] = name
+            author['email'] = email
+        return records
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+提交行数缓存模块
+负责把每个提交的 git numstat 结果按提交 SHA 持久化到本地 SQLite；
+提交一旦存在其差异就不会再变化，缓存不过期，跨仓库（含 fork 和镜像）、跨统计窗口和跨运行共用
+"""
+
+import os
+import json
+import zlib
+import sqlite3
+import threading
+
+
+# 每条 SQL 语句最多查询的 SHA 数（低于 SQLite 的参数个数上限）
+LOOKUP_BATCH = 500
+
+
+class NumstatCache:
+    """按提交 SHA 缓存 numstat 结果的存储类"""
+    
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = None
+        self.enabled = False
+        # 大仓库按时间片并行扫描时多个线程共用同一个连接
+        self.lock = threading.Lock()
+        
+        if db_path:
+            self._connect()
+    
+    def _connect(self):
+        """打开 SQLite 数据库并建表"""
+        try:
+            db_dir = os.path.dirname(self.db_path)
+            if db_dir and not os.path.exists(db_dir):
+                os.makedirs(db_dir, exist_ok=True)
+            
+            # 进程池的各个工作进程和并行的运行同时写入时等待锁，而不是立即报错
+            self.conn = sqlite3.connect(self.db_path, timeout=60, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS commit_numstat (
+                    sha TEXT PRIMARY KEY,
+                    additions INTEGER NOT NULL,
+                    deletions INTEGER NOT NULL,
+                    files BLOB
+                );
+            """)
+            self.conn.commit()
+            self.enabled = True
+        except Exception as e:
+            print(f"提交行数缓存打开失败: {e}，将每次由 Git 计算差异")
+            self.enabled = False
+    
+    def get_many(self, shas):
+        """查询多个提交的缓存，返回 {sha: (新增, 删除, [[路径, 新增, 删除], ...])}，未缓存的提交不在结果中"""
+        if not self.enabled or not shas:
+            return {}
+        shas = list(shas)
+        result = {}
+        try:
+            with self.lock:
+                for start in range(0, len(shas), LOOKUP_BATCH):
+                    batch = shas[start:start + LOOKUP_BATCH]
+                    rows = self.conn.execute(
+                        f"SELECT sha, additions, deletions, files FROM commit_numstat WHERE sha IN ({','.join('?' * len(batch))})",
+                        batch
+                    ).fetchall()
+                    for sha, additions, deletions, files in rows:
+                        result[sha] = (additions, deletions, json.loads(zlib.decompress(files)) if files else [])
+        except Exception as e:
+            print(f"  提交行数缓存读取失败: {e}")
+        return result
+    
+    def put_many(self, entries):
+        """写入多个提交的 numstat 结果，entries 为 {sha: (新增, 删除, 文件列表)}；已存在的提交保持不变"""
+        if not self.enabled or not entries:
+            return
+        try:
+            with self.lock, self.conn:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO commit_numstat (sha, additions, deletions, files) VALUES (?, ?, ?, ?)",
+                    [
+                        (sha, additions, deletions, zlib.compress(json.dumps(files).encode('utf-8')))
+                        for sha, (additions, deletions, files) in entries.items()
+                    ]
+                )
+        except Exception as e:
+            print(f"  提交行数缓存写入失败: {e}")
+    
+    def close(self):
+        """关闭数据库连接"""
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+            self.enabled = False
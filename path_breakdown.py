@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+路径分布模块
+负责把 git numstat 输出中的文件路径按扩展名映射为语言、按第一级目录归类，
+路径按组件存放在前缀树中，同一路径只分类一次
+"""
+
+import re
+
+
+# 扩展名（小写）到语言
+LANGUAGE_BY_EXTENSION = {
+    'py': 'Python', 'pyi': 'Python',
+    'java': 'Java', 'kt': 'Kotlin', 'kts': 'Kotlin', 'scala': 'Scala', 'groovy': 'Groovy', 'gradle': 'Groovy',
+    'js': 'JavaScript', 'jsx': 'JavaScript', 'mjs': 'JavaScript', 'cjs': 'JavaScript',
+    'ts': 'TypeScript', 'tsx': 'TypeScript', 'vue': 'Vue', 'svelte': 'Svelte',
+    'html': 'HTML', 'htm': 'HTML', 'css': 'CSS', 'scss': 'CSS', 'sass': 'CSS', 'less': 'CSS',
+    'go': 'Go', 'rs': 'Rust', 'c': 'C', 'h': 'C', 'cc': 'C++', 'cpp': 'C++', 'cxx': 'C++', 'hpp': 'C++', 'hh': 'C++',
+    'cs': 'C#', 'swift': 'Swift', 'm': 'Objective-C', 'mm': 'Objective-C', 'dart': 'Dart',
+    'php': 'PHP', 'rb': 'Ruby', 'lua': 'Lua', 'pl': 'Perl', 'r': 'R',
+    'sh': 'Shell', 'bash': 'Shell', 'zsh': 'Shell', 'ps1': 'PowerShell', 'bat': 'Batch', 'cmd': 'Batch',
+    'sql': 'SQL', 'xml': 'XML', 'json': 'JSON', 'yaml': 'YAML', 'yml': 'YAML', 'toml': 'TOML',
+    'ini': 'INI', 'properties': 'INI', 'conf': 'INI', 'cfg': 'INI',
+    'md': 'Markdown', 'markdown': 'Markdown', 'rst': 'reStructuredText', 'txt': 'Text',
+    'proto': 'Protobuf', 'ipynb': 'Jupyter Notebook', 'tf': 'Terraform'
+}
+# 没有扩展名或需要按文件名识别的文件
+LANGUAGE_BY_FILENAME = {
+    'dockerfile': 'Dockerfile', 'makefile': 'Makefile', 'cmakelists.txt': 'CMake',
+    'jenkinsfile': 'Groovy', 'vagrantfile': 'Ruby', 'gemfile': 'Ruby'
+}
+OTHER_LANGUAGE = '其他'
+ROOT_DIRECTORY = '(根目录)'
+
+# 重命名的 numstat 路径：dir/{old => new}/file 或 old => new
+RENAME_BRACES = re.compile(r'\{([^{}]*) => ([^{}]*)\}')
+# 含特殊字符的路径由 Git 加上引号，重命名时新旧路径各自加引号："old" => "new"
+QUOTED_RENAME = re.compile(r'^"(?:[^"\\]|\\.)*" => (.*)$')
+# 引号内的 C 风格转义，非 ASCII 字符按 UTF-8 字节转义为 \ooo
+QUOTED_ESCAPE = re.compile(rb'\\([0-7]{3}|.)')
+C_ESCAPES = {b'a': b'\a', b'b': b'\b', b't': b'\t', b'n': b'\n', b'v': b'\v', b'f': b'\f', b'r': b'\r'}
+
+
+def unquote_path(path):
+    """去掉 Git 给路径加的引号并还原转义，没有引号的路径原样返回"""
+    if not (len(path) > 1 and path[0] == path[-1] == '"'):
+        return path
+    
+    def unescape(match):
+        code = match.group(1)
+        if len(code) == 3:
+            return bytes([int(code, 8)])
+        return C_ESCAPES.get(code, code)
+    
+    return QUOTED_ESCAPE.sub(unescape, path[1:-1].encode('utf-8')).decode('utf-8', 'replace')
+
+
+def resolve_path(path):
+    """把 numstat 的重命名路径解析为新路径，并去掉 Git 给含特殊字符的路径加的引号"""
+    match = QUOTED_RENAME.match(path)
+    if match:
+        return unquote_path(match.group(1))
+    if ' => ' in path:
+        if '{' in path:
+            path = RENAME_BRACES.sub(lambda match: match.group(2), path).replace('//', '/').lstrip('/')
+        else:
+            path = path.split(' => ', 1)[1]
+    return unquote_path(path)
+
+
+def paths_to_json(paths):
+    """把 {(语言, 第一级目录): 代码行数} 转换为 [[语言, 第一级目录, 代码行数], ...]"""
+    return [[language, top_dir, lines] for (language, top_dir), lines in paths.items()]
+
+
+def paths_from_json(data):
+    """paths_to_json 的逆转换"""
+    return {(language, top_dir): lines for language, top_dir, lines in data or []}
+
+
+def language_of(path):
+    """按文件名和扩展名识别语言，无法识别时返回 OTHER_LANGUAGE"""
+    filename = path.rsplit('/', 1)[-1].lower()
+    if filename in LANGUAGE_BY_FILENAME:
+        return LANGUAGE_BY_FILENAME[filename]
+    if filename.startswith('dockerfile'):
+        return 'Dockerfile'
+    _, dot, extension = filename.rpartition('.')
+    if not dot:
+        return OTHER_LANGUAGE
+    return LANGUAGE_BY_EXTENSION.get(extension, OTHER_LANGUAGE)
+
+
+class PathTrie:
+    """路径前缀树类
+    
+    每个节点是 {路径组件: 子节点} 的字典，叶子节点在 None 键下缓存 (语言, 第一级目录)；
+    同一仓库的大量提交反复修改相同目录下的文件，前缀只保存一份，分类结果也只计算一次
+    """
+    
+    def __init__(self):
+        self.root = {}
+    
+    def classify(self, path):
+        """返回路径的 (语言, 第一级目录)，根目录下的文件归入 ROOT_DIRECTORY"""
+        node = self.root
+        for part in path.split('/'):
+            child = node.get(part)
+            if child is None:
+                child = node[part] = {}
+            node = child
+        
+        label = node.get(None)
+        if label is None:
+            top_dir = path.split('/', 1)[0] if '/' in path else ROOT_DIRECTORY
+            label = node[None] = (language_of(path), top_dir)
+        return label
+    
+    def summarize(self, files):
+        """把一个提交的 [(路径, 新增, 删除), ...] 汇总为 [[语言, 第一级目录, 代码行数], ...]（不含 0 行的文件）"""
+        totals = {}
+        for path, additions, deletions in files:
+            lines = additions + deletions
+            if lines:
+                label = self.classify(resolve_path(path))
+                totals[label] = totals.get(label, 0) + lines
+        return [[language, top_dir, lines] for (language, top_dir), lines in totals.items()]
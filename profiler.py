@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能分析模块
+负责在 --profile 模式下按阶段收集 cProfile 和 tracemalloc 数据，并输出 pstats 文件和汇总
+"""
+
+import io
+import os
+import time
+import pstats
+import cProfile
+import functools
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+
+# 快照对比时排除分析工具自身的内存分配
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, pstats.__file__),
+)
+
+
+class PhaseProfiler:
+    """按阶段的 CPU / 内存分析类
+    
+    每个阶段一个 cProfile.Profile，多次进入同一阶段时累计；阶段可以嵌套，进入子阶段时暂停父阶段的
+    cProfile，因此各阶段的 pstats 只包含自身代码。只分析主线程，线程池/进程池中的调用不计入。
+    重复调用的阶段只对前 max_snapshots 次调用做 tracemalloc 快照对比，保留内存增长最多的一次
+    """
+    
+    def __init__(self, max_snapshots=5, top_n=15):
+        self.max_snapshots = max_snapshots
+        self.top_n = top_n
+        self.phases = {}
+        self.stack = []
+        self.started = time.perf_counter()
+        tracemalloc.start()
+    
+    @staticmethod
+    def _snapshot():
+        return tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+    
+    def _get(self, name):
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = {
+                'profile': cProfile.Profile(),
+                'calls': 0,
+                'seconds': 0.0,
+                'child_seconds': 0.0,
+                'memory_growth': 0,
+                'snapshot_calls': 0,
+                'top_growth': -1,
+                'top_allocations': []
+            }
+        return phase
+    
+    @contextmanager
+    def phase(self, name):
+        """统计一个阶段，可嵌套使用"""
+        if threading.current_thread() is not threading.main_thread() or name in self.stack:
+            yield
+            return
+        
+        phase = self._get(name)
+        if self.stack:
+            self.phases[self.stack[-1]]['profile'].disable()
+        self.stack.append(name)
+        
+        before = None
+        if phase['snapshot_calls'] < self.max_snapshots:
+            before = self._snapshot()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        phase['profile'].enable()
+        try:
+            yield
+        finally:
+            phase['profile'].disable()
+            elapsed = time.perf_counter() - start
+            phase['calls'] += 1
+            phase['seconds'] += elapsed
+            phase['memory_growth'] += max(0, tracemalloc.get_traced_memory()[0] - memory_before)
+            
+            if before is not None:
+                diff = self._snapshot().compare_to(before, 'lineno')
+                growth = sum(max(0, stat.size_diff) for stat in diff)
+                phase['snapshot_calls'] += 1
+                if growth > phase['top_growth']:
+                    phase['top_growth'] = growth
+                    phase['top_allocations'] = [str(stat) for stat in diff[:self.top_n]]
+            
+            self.stack.pop()
+            if self.stack:
+                parent = self.phases[self.stack[-1]]
+                parent['child_seconds'] += elapsed
+                parent['profile'].enable()
+    
+    def wrap(self, owner, attr, name):
+        """把对象（或模块）上的函数替换为带阶段统计的版本，只在 --profile 时调用，正常运行没有额外开销"""
+        func = getattr(owner, attr)
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.phase(name):
+                return func(*args, **kwargs)
+        
+        setattr(owner, attr, wrapper)
+    
+    def write(self, output_dir, prefix):
+        """写出每个阶段的 pstats 文件和汇总文本，返回汇总文件路径"""
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir, exist_ok=True)
+        
+        total_seconds = time.perf_counter() - self.started
+        current, peak = tracemalloc.get_traced_memory()
+        
+        lines = []
+        lines.append(f"总耗时: {total_seconds:.2f} 秒，Python 内存峰值: {peak / 1024 / 1024:.1f} MB，结束时: {current / 1024 / 1024:.1f} MB")
+        lines.append("")
+        lines.append("| 阶段 | 调用次数 | 总耗时(秒) | 自身耗时(秒) | 内存增长(MB) |")
+        lines.append("|------|----------|------------|--------------|--------------|")
+        for name, phase in sorted(self.phases.items(), key=lambda x: x[1]['seconds'], reverse=True):
+            self_seconds = phase['seconds'] - phase['child_seconds']
+            lines.append(f"| {name} | {phase['calls']} | {phase['seconds']:.2f} | {self_seconds:.2f} | {phase['memory_growth'] / 1024 / 1024:.1f} |")
+        
+        for name, phase in self.phases.items():
+            pstats_file = os.path.join(output_dir or '', f"{prefix}_profile_{name}.pstats")
+            phase['profile'].dump_stats(pstats_file)
+            
+            stream = io.StringIO()
+            stats = pstats.Stats(phase['profile'], stream=stream)
+            stats.sort_stats('cumulative').print_stats(self.top_n)
+            
+            lines.append("")
+            lines.append(f"## {name}（{pstats_file}）")
+            lines.append("")
+            lines.append("CPU 热点（按累计耗时）:")
+            lines.append(stream.getvalue().strip())
+            lines.append("")
+            lines.append(f"内存分配（{phase['snapshot_calls']} 次快照中增长最多的一次）:")
+            lines.extend(phase['top_allocations'] or ["无"])
+        
+        summary_file = os.path.join(output_dir or '', f"{prefix}_profile.txt")
+        with open(summary_file, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        
+        tracemalloc.stop()
+        print(f"性能分析结果已保存到: {summary_file}（{len(self.phases)} 个阶段的 pstats 文件在同一目录）")
+        return summary_file
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分位数草图模块
+负责用 KLL 草图在固定内存内近似统计单次提交代码行数的分布（中位数、p95 等），
+草图可以跨仓库、跨进程和跨运行合并，并可转换为 JSON 保存
+"""
+
+import math
+
+
+# 最高层的容量，越大越精确（秩误差约为 1.7 / k），保留的元素数约为 3k
+DEFAULT_K = 200
+# 最低几层的最小容量
+MIN_CAPACITY = 2
+
+
+class KLLSketch:
+    """KLL 分位数草图类
+    
+    第 h 层的每个元素代表 2^h 个原始值；某层超过容量时排序后隔一个取一个提升到上一层。
+    提交数不超过 k 时不会压缩，分位数是精确值（与 numpy.percentile 一样线性插值）
+    """
+    
+    def __init__(self, k=DEFAULT_K):
+        self.k = k
+        self.levels = [[]]
+        self.count = 0
+        self.min = None
+        self.max = None
+        self._size = 0
+        self._coin = False
+        self._max_size = self._total_capacity()
+    
+    def _capacity(self, level):
+        """第 level 层的容量：越低的层容量越小"""
+        depth = len(self.levels) - level - 1
+        return max(MIN_CAPACITY, int(math.ceil(self.k * (2 / 3) ** depth)))
+    
+    def _total_capacity(self):
+        """所有层的容量之和"""
+        return sum(self._capacity(level) for level in range(len(self.levels)))
+    
+    def update(self, value, weight=1):
+        """加入一个值，weight 为该值重复的次数（按二进制拆分后放入对应的层）"""
+        if weight <= 0:
+            return
+        self.count += weight
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        
+        level = 0
+        while weight:
+            if weight & 1:
+                if level >= len(self.levels):
+                    self.levels.extend([] for _ in range(level + 1 - len(self.levels)))
+                    self._max_size = self._total_capacity()
+                self.levels[level].append(value)
+                self._size += 1
+            weight >>= 1
+            level += 1
+        
+        if self._size > self._max_size:
+            self._compress()
+    
+    def merge(self, other):
+        """合并另一个草图，返回自身"""
+        if other is None or not other.count:
+            return self
+        if len(other.levels) > len(self.levels):
+            self.levels.extend([] for _ in range(len(other.levels) - len(self.levels)))
+            self._max_size = self._total_capacity()
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+            self._size += len(items)
+        
+        self.count += other.count
+        if self.min is None or other.min < self.min:
+            self.min = other.min
+        if self.max is None or other.max > self.max:
+            self.max = other.max
+        
+        if self._size > self._max_size:
+            self._compress()
+        return self
+    
+    def _compress(self):
+        """从最低层开始压缩超出容量的层，直到总元素数不超过总容量"""
+        while self._size > self._max_size:
+            for level in range(len(self.levels)):
+                if len(self.levels[level]) < self._capacity(level):
+                    continue
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                
+                items = sorted(self.levels[level])
+                # 奇数个时留下一个，保证每次提升的两个元素权重相加不变
+                keep = [items.pop()] if len(items) % 2 else []
+                # 交替取奇偶位置，避免系统性地偏向较大或较小的值
+                offset = 1 if self._coin else 0
+                self._coin = not self._coin
+                promoted = items[offset::2]
+                
+                self.levels[level + 1].extend(promoted)
+                self.levels[level] = keep
+                self._size -= len(items) - len(promoted)
+                self._max_size = self._total_capacity()
+                break
+    
+    def is_exact(self):
+        """是否仍保留全部原始值（没有发生过压缩）"""
+        return not any(self.levels[1:])
+    
+    def weighted_items(self):
+        """返回保留的 (值, 权重) 列表，权重之和等于 count"""
+        return [(value, 1 << level) for level, items in enumerate(self.levels) for value in items]
+    
+    def quantile(self, q):
+        """返回 q 分位数（0 <= q <= 1），空草图返回 None"""
+        if not self.count:
+            return None
+        
+        if self.is_exact():
+            values = sorted(self.levels[0])
+            pos = q * (len(values) - 1)
+            lo = math.floor(pos)
+            hi = math.ceil(pos)
+            return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+        
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        
+        target = q * self.count
+        cumulative = 0
+        for value, weight in sorted(self.weighted_items()):
+            cumulative += weight
+            if cumulative >= target:
+                return value
+        return self.max
+    
+    def to_dict(self):
+        """转换为可 JSON 序列化的形式"""
+        return {
+            'k': self.k,
+            'count': self.count,
+            'min': self.min,
+            'max': self.max,
+            'levels': self.levels
+        }
+    
+    @classmethod
+    def from_dict(cls, data):
+        """从 to_dict 的结果还原草图"""
+        sketch = cls(data.get('k', DEFAULT_K))
+        sketch.levels = [list(items) for items in data.get('levels', [[]])] or [[]]
+        sketch.count = data.get('count', 0)
+        sketch.min = data.get('min')
+        sketch.max = data.get('max')
+        sketch._size = sum(len(items) for items in sketch.levels)
+        sketch._max_size = sketch._total_capacity()
+        return sketch
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+统计排名模块
+负责基于代码行数、提交数、活跃天数、仓库数计算综合得分和排名置信区间
+"""
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+DEFAULT_WEIGHTS = {
+    'lines': 0.4,
+    'commits': 0.2,
+    'days': 0.25,
+    'repos': 0.15
+}
+
+
+class RankingEngine:
+    """综合排名计算类（基于 NumPy 向量化）"""
+    
+    def __init__(self, weights=None, cap_percentile=99.0, bootstrap_rounds=200, seed=None):
+        self.weights = dict(DEFAULT_WEIGHTS)
+        if weights:
+            self.weights.update(weights)
+        self.cap_percentile = cap_percentile
+        self.bootstrap_rounds = bootstrap_rounds
+        self.seed = seed
+        self.enabled = NUMPY_AVAILABLE
+        
+        if not NUMPY_AVAILABLE:
+            print("未安装 numpy，用户排行将按代码行数排序")
+    
+    @staticmethod
+    def parse_weights(weights_str):
+        """解析 RANK_WEIGHTS 配置，格式：lines:0.4,commits:0.2,days:0.25,repos:0.15"""
+        weights = {}
+        if not weights_str:
+            return weights
+        for item in weights_str.split(','):
+            parts = item.split(':')
+            if len(parts) == 2 and parts[0].strip() in DEFAULT_WEIGHTS:
+                try:
+                    weights[parts[0].strip()] = float(parts[1])
+                except ValueError:
+                    print(f"警告: 排名权重 '{item.strip()}' 不是数字，已忽略")
+        return weights
+    
+    def _zscore(self, values):
+        """沿最后一维计算 z-score，标准差为 0 时结果为 0"""
+        mean = values.mean(axis=-1, keepdims=True)
+        std = values.std(axis=-1, keepdims=True)
+        std = np.where(std > 0, std, 1.0)
+        return (values - mean) / std
+    
+    def _composite(self, lines, commits, days, repos):
+        """计算综合得分，输入可以是 (n,) 或 (B, n) 数组"""
+        return (
+            self.weights['lines'] * self._zscore(np.log1p(lines))
+            + self.weights['commits'] * self._zscore(np.log1p(commits))
+            + self.weights['days'] * self._zscore(days)
+            + self.weights['repos'] * self._zscore(repos)
+        )
+    
+    @staticmethod
+    def _ranks(scores):
+        """得分越高排名越靠前，沿最后一维返回从 1 开始的名次"""
+        order = np.argsort(-scores, axis=-1, kind='stable')
+        ranks = np.empty_like(order)
+        np.put_along_axis(ranks, order, np.arange(1, scores.shape[-1] + 1), axis=-1)
+        return ranks
+    
+    @staticmethod
+    def _percentiles(values):
+        """计算每个值的百分位排名（并列取平均）"""
+        sorted_values = np.sort(values)
+        below = np.searchsorted(sorted_values, values, side='left')
+        upto = np.searchsorted(sorted_values, values, side='right')
+        return (below + upto) / 2.0 / len(values) * 100.0
+    
+    @staticmethod
+    def _weighted_percentile(values, weights, q):
+        """带权重的百分位数；权重全为 1 时与 np.percentile 相同"""
+        if np.all(weights == 1):
+            return np.percentile(values, q)
+        order = np.argsort(values, kind='stable')
+        cumulative = np.cumsum(weights[order])
+        idx = np.searchsorted(cumulative, q / 100.0 * cumulative[-1], side='left')
+        return values[order][min(idx, len(values) - 1)]
+    
+    def rank(self, user_stats, size_sketches):
+        """计算所有有提交用户的综合得分、名次、名次置信区间和提交大小分布
+        
+        size_sketches 为 {用户名: KLLSketch}，草图中每个保留值带有权重（代表的提交数），提交数不超过草图容量时即为逐提交明细；
+        返回 {用户名: {'score', 'rank', 'rank_ci', 'capped_lines', 'median_commit_lines',
+        'p90_commit_lines', 'p95_commit_lines', 'percentiles'}}
+        """
+        if not self.enabled:
+            return {}
+        
+        users = [u for u, data in user_stats.items()
+                 if data.get('commits', 0) > 0 and size_sketches.get(u) is not None and size_sketches[u].count]
+        if not users:
+            return {}
+        
+        items = [size_sketches[u].weighted_items() for u in users]
+        lengths = np.array([len(user_items) for user_items in items], dtype=np.int64)
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        sizes = np.array([value for user_items in items for value, _ in user_items], dtype=np.float64)
+        weights = np.array([weight for user_items in items for _, weight in user_items], dtype=np.float64)
+        
+        # 按全局分位数截断单次提交大小，避免一次批量提交主导排名
+        cap = self._weighted_percentile(sizes, weights, self.cap_percentile)
+        capped = np.minimum(sizes, cap)
+        
+        lines = np.add.reduceat(capped * weights, starts)
+        commits = np.add.reduceat(weights, starts)
+        days = np.array([user_stats[u].get('active_days', 0) for u in users], dtype=np.float64)
+        repos = np.array([user_stats[u].get('repos_count', 0) for u in users], dtype=np.float64)
+        
+        scores = self._composite(lines, commits, days, repos)
+        ranks = self._ranks(scores)
+        
+        rank_lo, rank_hi = self._bootstrap_ci(capped, weights, starts, days, repos, ranks)
+        
+        percentiles = {
+            'lines': self._percentiles(lines),
+            'commits': self._percentiles(commits),
+            'days': self._percentiles(days),
+            'repos': self._percentiles(repos)
+        }
+        
+        result = {}
+        for i, username in enumerate(users):
+            result[username] = {
+                'score': round(float(scores[i]), 4),
+                'rank': int(ranks[i]),
+                'rank_ci': [int(rank_lo[i]), int(rank_hi[i])],
+                'capped_lines': int(round(lines[i])),
+                'median_commit_lines': round(float(size_sketches[username].quantile(0.5)), 1),
+                'p90_commit_lines': round(float(size_sketches[username].quantile(0.9)), 1),
+                'p95_commit_lines': round(float(size_sketches[username].quantile(0.95)), 1),
+                'percentiles': {name: round(float(values[i]), 1) for name, values in percentiles.items()}
+            }
+        
+        print(f"综合排名计算完成: {len(users)} 个用户, 单次提交截断阈值 {cap:.0f} 行, bootstrap {self.bootstrap_rounds} 轮")
+        return result
+    
+    def _bootstrap_ci(self, capped, weights, starts, days, repos, ranks, chunk_cells=4000000):
+        """对每个用户的提交做 Poisson bootstrap 重采样，返回名次的 95% 置信区间
+        
+        权重为 w 的草图值代表 w 次提交，w 个独立 Poisson(1) 之和即 Poisson(w)
+        """
+        if self.bootstrap_rounds <= 0:
+            return ranks, ranks
+        
+        rng = np.random.default_rng(self.seed)
+        rounds_per_chunk = max(1, chunk_cells // max(1, capped.size))
+        sampled_ranks = []
+        
+        remaining = self.bootstrap_rounds
+        while remaining > 0:
+            rounds = min(rounds_per_chunk, remaining)
+            sampled = rng.poisson(weights, size=(rounds, capped.size))
+            lines = np.add.reduceat(sampled * capped, starts, axis=1)
+            commits = np.add.reduceat(sampled, starts, axis=1).astype(np.float64)
+            sampled_ranks.append(self._ranks(self._composite(lines, commits, days, repos)))
+            remaining -= rounds
+        
+        sampled_ranks = np.concatenate(sampled_ranks, axis=0)
+        rank_lo = np.floor(np.percentile(sampled_ranks, 2.5, axis=0))
+        rank_hi = np.ceil(np.percentile(sampled_ranks, 97.5, axis=0))
+        return rank_lo, rank_hi
@@ -95,3 +95,37 @@ class RedisCache:
                 print(f"已删除 {len(keys)} 个匹配 '{pattern}' 的缓存")
         except Exception as e:
             print(f"删除缓存失败: {e}")
+    
+    def pfadd(self, key, values, expire_seconds=86400):
+        """把值加入 HyperLogLog 键（PFADD）并设置过期时间"""
+        if not self.enabled:
+            return
+        try:
+            pipe = self.client.pipeline()
+            pipe.pfadd(key, *values)
+            pipe.expire(key, expire_seconds)
+            pipe.execute()
+        except Exception as e:
+            print(f"HyperLogLog 写入失败: {e}")
+    
+    def pfmerge(self, dest, keys, expire_seconds=86400):
+        """把多个 HyperLogLog 键合并到 dest（PFMERGE）并设置过期时间"""
+        if not self.enabled:
+            return
+        try:
+            pipe = self.client.pipeline()
+            pipe.pfmerge(dest, *keys)
+            pipe.expire(dest, expire_seconds)
+            pipe.execute()
+        except Exception as e:
+            print(f"HyperLogLog 合并失败: {e}")
+    
+    def pfcount(self, keys):
+        """返回多个 HyperLogLog 键并集的去重数量估计（PFCOUNT），失败时返回 0"""
+        if not self.enabled:
+            return 0
+        try:
+            return self.client.pfcount(*keys)
+        except Exception as e:
+            print(f"HyperLogLog 计数失败: {e}")
+            return 0
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件锁模块
+负责多个统计进程共用同一个 CLONE_DIR 时的仓库锁（读共享、更新排他）和运行锁
+"""
+
+import os
+import time
+import fcntl
+from contextlib import contextmanager
+
+
+class LockTimeout(Exception):
+    """等待文件锁超时"""
+
+
+class FileLock:
+    """基于 flock 的文件锁类
+    
+    exclusive=False 为共享锁（多个进程可同时持有，用于读取），exclusive=True 为排他锁（用于更新/删除）；
+    锁随文件描述符释放，进程崩溃时由内核自动释放，不会留下死锁。锁文件内容可用来记录持有者信息
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+    
+    def acquire(self, exclusive=True, timeout=None, on_wait=None, poll_interval=0.5):
+        """获取锁，timeout=None 时一直等待，timeout=0 时不等待；超时返回 False
+        
+        需要等待时先调用一次 on_wait(持有者信息)
+        """
+        lock_dir = os.path.dirname(self.path)
+        if lock_dir and not os.path.exists(lock_dir):
+            os.makedirs(lock_dir, exist_ok=True)
+        
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        mode = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        deadline = None if timeout is None else time.monotonic() + timeout
+        waited = False
+        
+        while True:
+            try:
+                fcntl.flock(self.fd, mode | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                pass
+            
+            if deadline is not None and time.monotonic() >= deadline:
+                os.close(self.fd)
+                self.fd = None
+                return False
+            
+            if not waited:
+                waited = True
+                if on_wait is not None:
+                    on_wait(self.read())
+            time.sleep(poll_interval)
+    
+    def release(self):
+        """释放锁"""
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+    
+    def read(self):
+        """读取锁文件内容（持有者信息或更新时间）"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return f.read().strip()
+        except OSError:
+            return ''
+    
+    def write(self, text):
+        """改写锁文件内容（需持有排他锁）"""
+        os.ftruncate(self.fd, 0)
+        os.pwrite(self.fd, text.encode('utf-8'), 0)
+    
+    @contextmanager
+    def hold(self, exclusive=True, timeout=None, on_wait=None):
+        """在 with 块内持有锁，超时抛出 LockTimeout"""
+        if not self.acquire(exclusive, timeout, on_wait):
+            raise LockTimeout(f"等待文件锁超过 {timeout} 秒: {self.path}")
+        try:
+            yield self
+        finally:
+            self.release()
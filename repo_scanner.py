@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+仓库扫描模块
+负责把单个仓库的提交记录解析、匹配用户并预聚合为紧凑的部分结果，
+既可在主进程中直接调用，也可在进程池的工作进程中运行
+"""
+
+from datetime import timezone
+from git_operations import GitOperations, SliceScanError
+from quantile_sketch import KLLSketch
+from hyperloglog import HyperLogLog, distinct_to_json, distinct_from_json
+from path_breakdown import paths_to_json, paths_from_json
+from time_utils import parse_datetime, day_key
+
+
+class UserMatcher:
+    """Git 作者到 Gitea 用户的匹配类"""
+    
+    def __init__(self, gitea_users, user_aliases):
+        self.gitea_users = gitea_users
+        self.user_aliases = user_aliases
+    
+    def match(self, username, author_email):
+        """把 Git 作者名和邮箱匹配为 Gitea 用户名，匹配失败返回 None"""
+        author_email = (author_email or '').lower()
+        matched_user = None
+        
+        if username in self.user_aliases:
+            username = self.user_aliases[username]
+        
+        if username in self.gitea_users:
+            matched_user = username
+        elif author_email in [user_data.get('email', '').lower() for user_data in self.gitea_users.values()]:
+            for login, user_data in self.gitea_users.items():
+                if user_data.get('email', '').lower() == author_email:
+                    matched_user = login
+                    break
+        else:
+            for login, user_data in self.gitea_users.items():
+                login_lower = login.lower()
+                username_lower = username.lower().replace(' ', '')
+                if login_lower == username_lower or login_lower in username_lower or username_lower in login_lower:
+                    matched_user = login
+                    break
+        
+        return matched_user
+
+
+def aggregate_commits(commits, matcher, scanned_days=(), export_facts=False, distinct_precision=None):
+    """把一个仓库的提交列表预聚合为部分结果
+    
+    返回 {'users': {用户: {...}}, 'rollups': {(日期, 用户): {...}}, 'facts': [...],
+    'identities': {(作者名, 邮箱): 用户}, 'skipped_unknown': n, 'skipped_outside': n, 'failed': False}；
+    identities 只记录作者名与用户名不同的身份，供 mailmap 学习；
+    facts 为 (SHA, 用户, 作者时间, 提交时间, 新增, 删除)，提交日志按其中的提交时间选择窗口；
+    日汇总按提交时间（与 git log --since/--until 相同）归入 UTC 天，days 记录其中提交的作者日期（活跃天）；
+    用户和日汇总的 sketch 为单次提交代码行数的分位数草图，paths 为 {(语言, 第一级目录): 代码行数}
+    （通过 API 获取的提交没有文件路径，不计入 paths）；
+    指定 distinct_precision 时（DISTINCT_MODE=hll）days 为该精度的 HyperLogLog，否则为集合
+    """
+    def new_days():
+        return HyperLogLog(distinct_precision) if distinct_precision else set()
+    
+    partial = {
+        'users': {},
+        'rollups': {},
+        'facts': [],
+        'identities': {},
+        'skipped_unknown': 0,
+        'skipped_outside': 0,
+        'failed': False
+    }
+    users = partial['users']
+    
+    for commit in commits:
+        author = commit.get('author', {})
+        username = author.get('login') or author.get('name') or 'unknown'
+        
+        if username == 'unknown':
+            partial['skipped_unknown'] += 1
+            continue
+        
+        identity = (username, author.get('email', ''))
+        matched_user = matcher.match(*identity)
+        
+        raw = author.get('raw')
+        if raw:
+            # mailmap 的邮箱规则先于作者名生效，而 UserMatcher 先按别名和登录名匹配：结果不同时以原始作者为准，
+            # 并记下原始身份，mailmap 学习后生成优先于邮箱规则的 (作者名, 邮箱) 条目
+            raw_user = matcher.match(*raw)
+            if raw_user and raw_user != matched_user:
+                identity = tuple(raw)
+                matched_user = raw_user
+        
+        if not matched_user:
+            partial['skipped_outside'] += 1
+            continue
+        
+        if identity[0] != matched_user or identity != (username, author.get('email', '')):
+            partial['identities'][identity] = matched_user
+        
+        stats = commit.get('stats', {})
+        additions = stats.get('additions', 0) or 0
+        deletions = stats.get('deletions', 0) or 0
+        total = stats.get('total', 0) or additions + deletions
+        
+        commit_date_str = commit.get('commit', {}).get('committer', {}).get('date')
+        commit_dt = parse_datetime(commit_date_str) if commit_date_str else None
+        if not commit_dt:
+            continue
+        
+        commit_date_iso = commit_dt.isoformat()
+        day = day_key(commit_dt)
+        
+        entry = users.get(matched_user)
+        if entry is None:
+            entry = users[matched_user] = {
+                'commits': 0,
+                'additions': 0,
+                'deletions': 0,
+                'total_lines': 0,
+                'first_dt': commit_dt,
+                'last_dt': commit_dt,
+                'days': new_days(),
+                'sketch': KLLSketch(),
+                'paths': {}
+            }
+        entry['commits'] += 1
+        entry['additions'] += additions
+        entry['deletions'] += deletions
+        entry['total_lines'] += total
+        entry['days'].add(day)
+        entry['sketch'].update(total)
+        paths = stats.get('paths') or ()
+        for language, top_dir, lines in paths:
+            key = (language, top_dir)
+            entry['paths'][key] = entry['paths'].get(key, 0) + lines
+        if commit_dt < entry['first_dt']:
+            entry['first_dt'] = commit_dt
+        if commit_dt > entry['last_dt']:
+            entry['last_dt'] = commit_dt
+        
+        # 扫描范围按提交时间选择提交，日汇总必须按同一时间分天，否则作者时间早于扫描范围的提交
+        # （rebase、cherry-pick 等）会被统计但不写入日汇总；旧缓存中的记录没有提交时间时按作者时间
+        committed_dt = parse_datetime(commit.get('committed')) or commit_dt
+        
+        if export_facts:
+            partial['facts'].append((commit.get('sha', ''), matched_user, commit_date_iso, committed_dt.isoformat(),
+                                     additions, deletions))
+        
+        rollup_day = day_key(committed_dt)
+        if rollup_day in scanned_days:
+            # 日汇总统一用 UTC 时间，保证字符串比较即时间比较
+            utc_iso = commit_dt.astimezone(timezone.utc).isoformat()
+            rollup = partial['rollups'].setdefault((rollup_day, matched_user), {
+                'commits': 0,
+                'additions': 0,
+                'deletions': 0,
+                'first_commit': utc_iso,
+                'last_commit': utc_iso,
+                'sketch': KLLSketch(),
+                'paths': {},
+                'days': new_days()
+            })
+            rollup['commits'] += 1
+            rollup['days'].add(day)
+            rollup['sketch'].update(total)
+            for language, top_dir, lines in paths:
+                key = (language, top_dir)
+                rollup['paths'][key] = rollup['paths'].get(key, 0) + lines
+            rollup['additions'] += additions
+            rollup['deletions'] += deletions
+            if utc_iso < rollup['first_commit']:
+                rollup['first_commit'] = utc_iso
+            if utc_iso > rollup['last_commit']:
+                rollup['last_commit'] = utc_iso
+    
+    for entry in users.values():
+        entry['first_commit'] = entry.pop('first_dt').isoformat()
+        entry['last_commit'] = entry.pop('last_dt').isoformat()
+    
+    return partial
+
+
+def api_commits_to_records(commits, ranges):
+    """把 Gitea 提交 API 的结果转换为与 GitOperations.parse_log_lines 相同的提交记录
+    
+    多个分支的结果按 SHA 去重，只保留提交时间落在 ranges（[(since, until), ...]）内的提交；
+    作者取 Git 提交中的作者名和邮箱（而不是 Gitea 关联的账户），日期取作者时间，
+    合并提交的增删行数记为 0（git log --numstat 不输出合并提交的差异），保证两种方式的统计结果一致
+    """
+    windows = [(parse_datetime(since), parse_datetime(until)) for since, until in ranges]
+    records = []
+    seen = set()
+    
+    for commit in commits:
+        sha = commit.get('sha', '')
+        if sha in seen:
+            continue
+        seen.add(sha)
+        
+        detail = commit.get('commit') or {}
+        committed = parse_datetime((detail.get('committer') or {}).get('date'))
+        if committed is None:
+            continue
+        if not any((since is None or committed >= since) and (until is None or committed <= until)
+                   for since, until in windows):
+            continue
+        
+        author = detail.get('author') or {}
+        stats = commit.get('stats') or {}
+        additions = stats.get('additions', 0) or 0
+        deletions = stats.get('deletions', 0) or 0
+        if len(commit.get('parents') or []) > 1:
+            additions = deletions = 0
+        
+        records.append({
+            'sha': sha,
+            'author': {
+                'login': author.get('name', ''),
+                'name': author.get('name', ''),
+                'email': author.get('email', '')
+            },
+            'commit': {
+                'committer': {
+                    'date': author.get('date') or detail['committer']['date']
+                }
+            },
+            'committed': detail['committer']['date'],
+            'stats': {
+                'additions': additions,
+                'deletions': deletions,
+                'total': additions + deletions
+            }
+        })
+    
+    return records
+
+
+_worker_matcher = None
+_worker_git_ops = None
+
+
+def init_scan_worker(gitea_users, user_aliases, git_options=None):
+    """进程池工作进程初始化：用户表只传一次，避免每个任务重复序列化
+    
+    git_options 为工作进程中 GitOperations 的参数（CLONE_DIR、锁等待、时间片、mailmap 等），
+    读取缓存仓库期间同样持有共享锁
+    """
+    global _worker_matcher, _worker_git_ops
+    _worker_matcher = UserMatcher(gitea_users, user_aliases)
+    _worker_git_ops = GitOperations(**(git_options or {}))
+
+
+def scan_repo(job):
+    """工作进程入口：对已拉取到本地的仓库执行 git log、解析并预聚合
+    
+    job 为 {'repo_path', 'ranges': [(since, until), ...], 'scanned_days', 'export_facts', 'timeout', 'refs', 'distinct_precision'}；
+    部分时间片超时时合并其余时间片的结果并标记为失败（不写入日汇总）
+    """
+    commits = []
+    failed = False
+    try:
+        for since_date, until_date in job['ranges']:
+            try:
+                commits.extend(_worker_git_ops.get_commits_sliced(job['repo_path'], since_date, until_date,
+                                                                  job.get('timeout', 300), job.get('refs')))
+            except SliceScanError as e:
+                print(f"  {e}")
+                commits.extend(e.commits)
+                failed = True
+    finally:
+        _worker_git_ops.forget_ref_tips(job['repo_path'])
+    partial = aggregate_commits(commits, _worker_matcher, job['scanned_days'], job['export_facts'],
+                                job.get('distinct_precision'))
+    partial['commit_count'] = len(commits)
+    partial['failed'] = failed
+    return partial
+
+
+def partial_to_json(partial):
+    """把部分结果转换为可 JSON 序列化的形式（分布式模式下经 Redis 传输），活跃天为列表或 HyperLogLog 的 to_dict"""
+    data = dict(partial)
+    data['users'] = {
+        username: dict(entry, days=distinct_to_json(entry['days']), sketch=entry['sketch'].to_dict(),
+                       paths=paths_to_json(entry['paths']))
+        for username, entry in partial['users'].items()
+    }
+    data['rollups'] = [
+        [day, username, dict(rollup, sketch=rollup['sketch'].to_dict(), paths=paths_to_json(rollup['paths']),
+                             days=distinct_to_json(rollup['days']))]
+        for (day, username), rollup in partial['rollups'].items()
+    ]
+    data['facts'] = [list(fact) for fact in partial['facts']]
+    data['identities'] = [[name, email, username] for (name, email), username in partial.get('identities', {}).items()]
+    return data
+
+
+def partial_from_json(data):
+    """把 partial_to_json 的结果还原为部分结果"""
+    partial = dict(data)
+    partial['users'] = {
+        username: dict(entry, days=distinct_from_json(entry['days']), sketch=KLLSketch.from_dict(entry['sketch']),
+                       paths=paths_from_json(entry.get('paths')))
+        for username, entry in data['users'].items()
+    }
+    partial['rollups'] = {
+        (day, username): dict(rollup, sketch=KLLSketch.from_dict(rollup['sketch']),
+                              paths=paths_from_json(rollup.get('paths')), days=distinct_from_json(rollup.get('days', [day])))
+        for day, username, rollup in data['rollups']
+    }
+    partial['identities'] = {(name, email): username for name, email, username in data.get('identities', [])}
+    return partial
@@ -5,74 +5,39 @@
 负责生成文本和 JSON 格式的统计报告
 """
 
+import os
 import json
 from datetime import datetime
+from snapshot_store import SnapshotStore
 
 
 class ReportGenerator:
     """报告生成类"""
     
-    def __init__(self, gitea_users):
+    def __init__(self, gitea_users, base_url='', top_users=20):
         self.gitea_users = gitea_users
+        self.base_url = (base_url or '').rstrip('/')
+        self.top_users = top_users
     
-    def generate_text_report(self, stats, output_file=None, since_date=None, until_date=None):
-        """生成文本格式的统计报告"""
-        report = []
-        report.append("-" * 80)
-        report.append("Gitea 代码贡献度统计报告")
-        report.append(f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    def _time_range_line(self, since_date=None, until_date=None):
+        """生成报告头部的统计时间行，没有时间范围时返回 None"""
+        def fmt(date_str):
+            date_part = date_str.split('T')[0] if 'T' in date_str else date_str
+            # 添加时间部分，精确到分钟
+            if 'T' in date_str:
+                date_part = f"{date_part} {date_str.split('T')[1][:5]}"  # 取 HH:MM
+            return date_part
         
         if since_date and until_date:
-            since_str = since_date.split('T')[0] if 'T' in since_date else since_date
-            until_str = until_date.split('T')[0] if 'T' in until_date else until_date
-            
-            # 添加时间部分，精确到分钟
-            if 'T' in since_date:
-                since_time = since_date.split('T')[1][:5]  # 取 HH:MM
-                since_str = f"{since_str} {since_time}"
-            
-            if 'T' in until_date:
-                until_time = until_date.split('T')[1][:5]  # 取 HH:MM
-                until_str = f"{until_str} {until_time}"
-            
-            report.append(f"统计时间: {since_str} 至 {until_str}")
+            return f"统计时间: {fmt(since_date)} 至 {fmt(until_date)}"
         elif since_date:
-            since_str = since_date.split('T')[0] if 'T' in since_date else since_date
-            
-            # 添加时间部分，精确到分钟
-            if 'T' in since_date:
-                since_time = since_date.split('T')[1][:5]  # 取 HH:MM
-                since_str = f"{since_str} {since_time}"
-            
-            report.append(f"统计时间: {since_str} 至今")
+            return f"统计时间: {fmt(since_date)} 至今"
         elif until_date:
-            until_str = until_date.split('T')[0] if 'T' in until_date else until_date
-            
-            # 添加时间部分，精确到分钟
-            if 'T' in until_date:
-                until_time = until_date.split('T')[1][:5]  # 取 HH:MM
-                until_str = f"{until_str} {until_time}"
-            
-            report.append(f"统计时间: 至 {until_str}")
-        
-        report.append("-" * 80)
-        report.append("")
-        
-        report.append("📊 总体统计")
-        report.append("-" * 80)
-        report.append(f"总仓库数: {stats['total_repos']}")
-        report.append(f"总提交数: {stats['total_commits']}")
-        report.append(f"总新增行数: {stats['total_additions']:,}")
-        report.append(f"总删除行数: {stats['total_deletions']:,}")
-        report.append(f"总代码行数: {stats['total_lines']:,}")
-        report.append(f"总贡献人数: {len(stats['user_stats'])}")
-        report.append(f"Gitea 用户数: {len(self.gitea_users)}")
-        report.append("")
-        
-        report.append("👥 用户贡献排行 (按代码行数)")
-        report.append("-" * 80)
-        
-        # 合并所有用户，包括没有提交记录的用户
+            return f"统计时间: 至 {fmt(until_date)}"
+        return None
+    
+    def _sort_users(self, stats):
+        """合并所有 Gitea 用户（包括没有提交记录的用户）并按代码行数排序"""
         all_users = {}
         for username in self.gitea_users:
             if username in stats['user_stats']:
@@ -86,37 +51,185 @@ class ReportGenerator:
                     'repos_count': 0
                 }
         
-        sorted_users = sorted(
+        rankings = stats.get('rankings')
+        if rankings:
+            # 有综合排名时按名次排序，没有提交的用户排在最后
+            return sorted(
+                all_users.items(),
+                key=lambda x: (rankings[x[0]]['rank'] if x[0] in rankings else len(rankings) + 1, -x[1]['total_lines'])
+            )
+        
+        return sorted(
             all_users.items(),
             key=lambda x: x[1]['total_lines'],
             reverse=True
         )
+    
+    def _sort_repos(self, repo_stats):
+        """按代码行数排序仓库"""
+        return sorted(
+            repo_stats,
+            key=lambda x: x['total_lines'],
+            reverse=True
+        )
+    
+    @staticmethod
+    def compute_deltas(stats, previous):
+        """与上次快照在内存中按用户关联，计算名次变化和指标增减，previous 为 None 时返回 None
+        
+        名次变化为正表示上升，上次没有提交的用户 rank_change 为 None
+        """
+        if not previous:
+            return None
         
-        report.append("| 排名 | 用户名 | 真实姓名 | 代码行数 | 新增 | 删除 | 提交数 | 仓库数 | 贡献度 |")
-        report.append("|------|--------|----------|----------|------|------|--------|--------|--------|")
+        ranks = SnapshotStore.user_ranks(stats)
+        users = {}
+        for username, rank in ranks.items():
+            data = stats['user_stats'][username]
+            before = previous['users'].get(username)
+            if before is None:
+                users[username] = {'rank_change': None, 'total_lines': data['total_lines'],
+                                   'commits': data['commits'], 'active_days': data.get('active_days', 0)}
+            else:
+                users[username] = {
+                    'rank_change': before['rank'] - rank,
+                    'total_lines': data['total_lines'] - before['total_lines'],
+                    'commits': data['commits'] - before['commits'],
+                    'active_days': data.get('active_days', 0) - before['active_days']
+                }
         
-        for idx, (username, user_data) in enumerate(sorted_users[:20], 1):
+        previous_totals = previous['totals']
+        return {
+            'previous': {
+                'created_at': previous['created_at'],
+                'since': previous['since'],
+                'until': previous['until']
+            },
+            'totals': {
+                'total_repos': stats['total_repos'] - previous_totals['total_repos'],
+                'total_commits': stats['total_commits'] - previous_totals['total_commits'],
+                'total_lines': stats['total_lines'] - previous_totals['total_lines'],
+                'total_contributors': len(ranks) - previous_totals['total_contributors']
+            },
+            'users': users,
+            'dropped_users': sorted(set(previous['users']) - set(ranks))
+        }
+    
+    @staticmethod
+    def _rank_change_str(user_delta):
+        """名次变化显示：↑n / ↓n / - / 新"""
+        if user_delta is None:
+            return '-'
+        change = user_delta['rank_change']
+        if change is None:
+            return '新'
+        if change > 0:
+            return f"↑{change}"
+        if change < 0:
+            return f"↓{-change}"
+        return '-'
+    
+    @staticmethod
+    def _size_str(value):
+        """单次提交代码行数分位数的显示（视图中没有分布数据时显示 -）"""
+        return f"{value:.1f}" if value is not None else '-'
+    
+    def _render(self, title, totals, sorted_users, sorted_repos, since_date=None, until_date=None, rankings=None, deltas=None,
+                incomplete=None):
+        """根据已排序的用户和仓库列表渲染 Markdown 报告，传入 rankings 时显示综合得分列，传入 deltas 时显示与上次运行的变化，
+        incomplete 为获取失败的仓库列表地址（非空时在标题下提示统计不完整）
+        """
+        report = []
+        report.append("-" * 80)
+        report.append(title)
+        report.append(f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        
+        time_range_line = self._time_range_line(since_date, until_date)
+        if time_range_line:
+            report.append(time_range_line)
+        if incomplete:
+            report.append(f"⚠️ 统计不完整: {len(incomplete)} 个仓库列表重试后仍然获取失败，报告可能缺少仓库")
+        
+        report.append("-" * 80)
+        report.append("")
+        
+        report.append("📊 总体统计")
+        report.append("-" * 80)
+        report.append(f"总仓库数: {totals['total_repos']}")
+        report.append(f"总提交数: {totals['total_commits']}")
+        report.append(f"总新增行数: {totals['total_additions']:,}")
+        report.append(f"总删除行数: {totals['total_deletions']:,}")
+        report.append(f"总代码行数: {totals['total_lines']:,}")
+        report.append(f"总贡献人数: {totals['total_contributors']}")
+        report.append(f"Gitea 用户数: {totals['total_users']}")
+        if deltas and deltas.get('totals'):
+            previous_time = deltas['previous']['created_at'][:16].replace('T', ' ')
+            total_deltas = deltas['totals']
+            report.append(
+                f"较上次运行（{previous_time} UTC）: 仓库 {total_deltas['total_repos']:+d}，提交 {total_deltas['total_commits']:+d}，"
+                f"代码行数 {total_deltas['total_lines']:+,}，贡献人数 {total_deltas['total_contributors']:+d}"
+            )
+        report.append("")
+        
+        if rankings:
+            report.append("👥 用户贡献排行 (按综合得分)")
+            report.append("-" * 80)
+            report.append("综合得分 = 代码行数(单次提交截断后取对数)、提交数、活跃天数、仓库数的加权 z-score；排名区间为 bootstrap 95% 置信区间")
+            report.append("")
+            header = "| 排名 | 用户名 | 真实姓名 | 综合得分 | 排名区间 | 代码行数 | 新增 | 删除 | 提交数 | 仓库数 | 活跃天数 | 提交中位行数 | 提交 P95 行数 |"
+            separator = "|------|--------|----------|----------|----------|----------|------|------|--------|--------|----------|--------------|---------------|"
+        else:
+            report.append("👥 用户贡献排行 (按代码行数)")
+            report.append("-" * 80)
+            header = "| 排名 | 用户名 | 真实姓名 | 代码行数 | 新增 | 删除 | 提交数 | 仓库数 | 贡献度 | 提交中位行数 | 提交 P95 行数 |"
+            separator = "|------|--------|----------|----------|------|------|--------|--------|--------|--------------|---------------|"
+        if deltas:
+            header += " 排名变化 | 行数变化 |"
+            separator += "----------|----------|"
+        report.append(header)
+        report.append(separator)
+        
+        for idx, (username, user_data) in enumerate(sorted_users[:self.top_users], 1):
             contribution_rate = user_data['total_lines'] / user_data['commits'] if user_data['commits'] > 0 else 0
             user_info = self.gitea_users.get(username, {})
             if isinstance(user_info, dict):
                 real_name = user_info.get('full_name', '')
             else:
                 real_name = ''
-            report.append(f"| {idx:2d} | {username:30s} | {real_name:10s} | {user_data['total_lines']:10,} | {user_data['additions']:7,} | {user_data['deletions']:7,} | {user_data['commits']:4d} | {user_data['repos_count']:3d} | {contribution_rate:.1f} |")
+            median_str = self._size_str(user_data.get('median_commit_lines'))
+            p95_str = self._size_str(user_data.get('p95_commit_lines'))
+            if rankings:
+                ranking = rankings.get(username)
+                if ranking:
+                    score_str = f"{ranking['score']:.2f}"
+                    ci_str = f"{ranking['rank_ci'][0]}-{ranking['rank_ci'][1]}"
+                else:
+                    score_str, ci_str = '-', '-'
+                row = f"| {idx:2d} | {username:30s} | {real_name:10s} | {score_str:>6s} | {ci_str:7s} | {user_data['total_lines']:10,} | {user_data['additions']:7,} | {user_data['deletions']:7,} | {user_data['commits']:4d} | {user_data['repos_count']:3d} | {user_data.get('active_days', 0):3d} | {median_str} | {p95_str} |"
+            else:
+                row = f"| {idx:2d} | {username:30s} | {real_name:10s} | {user_data['total_lines']:10,} | {user_data['additions']:7,} | {user_data['deletions']:7,} | {user_data['commits']:4d} | {user_data['repos_count']:3d} | {contribution_rate:.1f} | {median_str} | {p95_str} |"
+            if deltas:
+                user_delta = deltas['users'].get(username)
+                lines_delta_str = f"{user_delta['total_lines']:+,}" if user_delta else '-'
+                row += f" {self._rank_change_str(user_delta):4s} | {lines_delta_str:>8s} |"
+            report.append(row)
         
         report.append("")
         
+        breakdown_lines = self._breakdown_lines(sorted_users[:self.top_users])
+        if breakdown_lines:
+            report.append("🗂️ 语言与目录分布 (按代码行数)")
+            report.append("-" * 80)
+            report.append("| 用户名 | 主要语言 | 主要目录 |")
+            report.append("|--------|----------|----------|")
+            report.extend(breakdown_lines)
+            report.append("")
+        
         report.append("📁 仓库活跃度排行 (按代码行数)")
         report.append("-" * 80)
         
-        sorted_repos = sorted(
-            stats['repo_stats'],
-            key=lambda x: x['total_lines'],
-            reverse=True
-        )
-        
-        report.append("| 排名 | 仓库 | 代码行数 | 新增 | 删除 | 提交数 | 贡献者数 | 贡献者 |")
-        report.append("|------|--------|----------|------|------|--------|----------|--------|")
+        report.append("| 排名 | 仓库 | 代码行数 | 新增 | 删除 | 提交数 | 提交中位/P95 行数 | 贡献者数 | 贡献者 |")
+        report.append("|------|--------|----------|------|------|--------|-------------------|----------|--------|")
         
         for idx, repo in enumerate(sorted_repos, 1):
             contributors_with_names = []
@@ -139,21 +252,224 @@ class ReportGenerator:
                 repo_display = repo['name']
             
             repo_name = repo['name']
-            repo_link = f"[{repo_display}](https://git.smartcrec.com/{repo_name})"
-            report.append(f"| {idx:2d} | {repo_link:70s} | {repo['total_lines']:10,} | {repo['additions']:7,} | {repo['deletions']:7,} | {repo['commits']:4d} | {repo['contributors_count']:3d} | {contributors_str} |")
+            repo_link = f"[{repo_display}]({self.base_url}/{repo_name})"
+            size_str = f"{self._size_str(repo.get('median_commit_lines'))} / {self._size_str(repo.get('p95_commit_lines'))}"
+            report.append(f"| {idx:2d} | {repo_link:70s} | {repo['total_lines']:10,} | {repo['additions']:7,} | {repo['deletions']:7,} | {repo['commits']:4d} | {size_str} | {repo['contributors_count']:3d} | {contributors_str} |")
         
         report.append("")
         report.append("-" * 80)
         
-        report_text = "\n".join(report)
+        return "\n".join(report)
+    
+    @staticmethod
+    def _share_str(items, limit=3):
+        """{名称: 代码行数} 中最多的几项及其占比，如 Python 62.0%, Shell 20.1%"""
+        total = sum(items.values())
+        top = list(items.items())[:limit]
+        return ', '.join(f"{name} {lines / total * 100:.1f}%" for name, lines in top)
+    
+    def _breakdown_lines(self, users):
+        """排行用户的语言与目录分布表格行（没有路径分布的用户不列出，如通过 API 获取提交的仓库）"""
+        lines = []
+        for username, user_data in users:
+            languages = user_data.get('languages')
+            if not languages:
+                continue
+            lines.append(f"| {username:30s} | {self._share_str(languages)} | {self._share_str(user_data['directories'])} |")
+        return lines
+    
+    def _write(self, report_text, output_file):
+        """保存报告文本"""
+        with open(output_file, 'w', encoding='utf-8') as f:
+            f.write(report_text)
+        print(f"\n报告已保存到: {output_file}")
+    
+    def generate_text_report(self, stats, output_file=None, since_date=None, until_date=None):
+        """生成文本格式的统计报告"""
+        totals = {
+            'total_repos': stats['total_repos'],
+            'total_commits': stats['total_commits'],
+            'total_additions': stats['total_additions'],
+            'total_deletions': stats['total_deletions'],
+            'total_lines': stats['total_lines'],
+            'total_contributors': len(stats['user_stats']),
+            'total_users': len(self.gitea_users)
+        }
+        
+        report_text = self._render(
+            "Gitea 代码贡献度统计报告",
+            totals,
+            self._sort_users(stats),
+            self._sort_repos(stats['repo_stats']),
+            since_date,
+            until_date,
+            stats.get('rankings'),
+            stats.get('deltas'),
+            stats.get('run_metrics', {}).get('discovery_failures')
+        )
         
         if output_file:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(report_text)
-            print(f"\n报告已保存到: {output_file}")
+            self._write(report_text, output_file)
         
         return report_text
     
+    @staticmethod
+    def parse_views(views_str):
+        """解析 REPORT_VIEWS 配置，返回 [(类型, 名称), ...]
+        
+        格式：org:组织名,team:组织名/团队名,user:用户名，名称为 * 表示该类型的全部对象
+        """
+        views = []
+        if not views_str:
+            return views
+        for item in views_str.split(','):
+            parts = item.split(':', 1)
+            if len(parts) == 2 and parts[0].strip() in ('org', 'team', 'user') and parts[1].strip():
+                views.append((parts[0].strip(), parts[1].strip()))
+            elif item.strip():
+                print(f"警告: 无法识别的报告视图 '{item.strip()}'，已忽略")
+        return views
+    
+    def _build_index(self, stats):
+        """一次遍历全局聚合，建立各视图共用的排序结果和索引"""
+        sorted_users = self._sort_users(stats)
+        sorted_repos = self._sort_repos(stats['repo_stats'])
+        
+        # 按全局排序顺序分组，视图按组取出即保持有序，无需重新排序
+        repos_by_org = {}
+        repos_by_user = {}
+        for repo in sorted_repos:
+            org = repo['name'].split('/', 1)[0]
+            repos_by_org.setdefault(org, []).append(repo)
+            for username, cell in repo.get('contributor_stats', {}).items():
+                repos_by_user.setdefault(username, []).append((repo, cell))
+        
+        return {
+            'rankings': stats.get('rankings'),
+            'deltas': stats.get('deltas'),
+            'incomplete': stats.get('run_metrics', {}).get('discovery_failures'),
+            'sorted_users': sorted_users,
+            'user_rank': {username: idx for idx, (username, _) in enumerate(sorted_users)},
+            'sorted_repos': sorted_repos,
+            'repos_by_org': repos_by_org,
+            'repos_by_user': repos_by_user
+        }
+    
+    def _totals(self, repo_rows, contributors, users_count):
+        """汇总视图的总体统计"""
+        return {
+            'total_repos': len(repo_rows),
+            'total_commits': sum(r['commits'] for r in repo_rows),
+            'total_additions': sum(r['additions'] for r in repo_rows),
+            'total_deletions': sum(r['deletions'] for r in repo_rows),
+            'total_lines': sum(r['total_lines'] for r in repo_rows),
+            'total_contributors': contributors,
+            'total_users': users_count
+        }
+    
+    def _org_view(self, index, org):
+        """组织视图：仓库沿用全局顺序，用户按该组织内的贡献重新累计"""
+        repo_rows = index['repos_by_org'].get(org, [])
+        
+        user_totals = {}
+        for repo in repo_rows:
+            for username, cell in repo.get('contributor_stats', {}).items():
+                entry = user_totals.setdefault(username, {
+                    'total_lines': 0, 'additions': 0, 'deletions': 0, 'commits': 0, 'repos_count': 0
+                })
+                entry['total_lines'] += cell['total_lines']
+                entry['additions'] += cell['additions']
+                entry['deletions'] += cell['deletions']
+                entry['commits'] += cell['commits']
+                entry['repos_count'] += 1
+        
+        user_rows = sorted(user_totals.items(), key=lambda x: x[1]['total_lines'], reverse=True)
+        return self._totals(repo_rows, len(user_rows), len(user_rows)), user_rows, repo_rows
+    
+    def _members_view(self, index, members):
+        """团队/个人视图：用户沿用全局排名，仓库只统计成员在其中的贡献"""
+        members = set(members)
+        user_rows = [item for item in index['sorted_users'] if item[0] in members]
+        
+        repo_cells = {}
+        for username in members:
+            for repo, cell in index['repos_by_user'].get(username, []):
+                entry = repo_cells.get(repo['name'])
+                if entry is None:
+                    entry = repo_cells[repo['name']] = {
+                        'name': repo['name'],
+                        'description': repo.get('description', ''),
+                        'commits': 0,
+                        'additions': 0,
+                        'deletions': 0,
+                        'total_lines': 0,
+                        'contributors': []
+                    }
+                entry['commits'] += cell['commits']
+                entry['additions'] += cell['additions']
+                entry['deletions'] += cell['deletions']
+                entry['total_lines'] += cell['total_lines']
+                entry['contributors'].append(username)
+        
+        for entry in repo_cells.values():
+            entry['contributors'].sort(key=lambda u: index['user_rank'].get(u, len(index['user_rank'])))
+            entry['contributors_count'] = len(entry['contributors'])
+        
+        repo_rows = self._sort_repos(repo_cells.values())
+        contributors = sum(1 for _, data in user_rows if data['commits'] > 0)
+        return self._totals(repo_rows, contributors, len(user_rows)), user_rows, repo_rows
+    
+    def generate_view_reports(self, stats, views, output_dir, timestamp, teams=None, since_date=None, until_date=None, prefix='report'):
+        """基于同一份聚合数据一次性生成多个按组织/团队/用户过滤的报告，返回生成的文件列表"""
+        if not views:
+            return []
+        
+        teams = teams or {}
+        index = self._build_index(stats)
+        
+        expanded = []
+        for kind, name in views:
+            if name != '*':
+                expanded.append((kind, name))
+            elif kind == 'org':
+                expanded.extend(('org', org) for org in index['repos_by_org'])
+            elif kind == 'team':
+                expanded.extend(('team', team) for team in teams)
+            elif kind == 'user':
+                expanded.extend(('user', username) for username, data in index['sorted_users'] if data['commits'] > 0)
+        
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir, exist_ok=True)
+        
+        output_files = []
+        for kind, name in expanded:
+            if kind == 'org':
+                title = f"Gitea 代码贡献度统计报告 - 组织 {name}"
+                totals, user_rows, repo_rows = self._org_view(index, name)
+            elif kind == 'team':
+                if name not in teams:
+                    print(f"警告: 团队 {name} 不存在，跳过该视图")
+                    continue
+                title = f"Gitea 代码贡献度统计报告 - 团队 {name}"
+                totals, user_rows, repo_rows = self._members_view(index, teams[name])
+            else:
+                title = f"Gitea 代码贡献度统计报告 - 用户 {name}"
+                totals, user_rows, repo_rows = self._members_view(index, [name])
+            
+            # 组织视图按组织内代码行数排序，不显示全局综合排名和全局变化
+            rankings = index['rankings'] if kind != 'org' else None
+            # 团队/个人视图的总体统计只覆盖成员，不显示全局总量的变化
+            deltas = dict(index['deltas'], totals=None) if index['deltas'] and kind != 'org' else None
+            report_text = self._render(title, totals, user_rows, repo_rows, since_date, until_date, rankings, deltas,
+                                       index['incomplete'])
+            safe_name = name.replace('/', '_')
+            output_file = os.path.join(output_dir or '', f"{prefix}_{kind}-{safe_name}_{timestamp}.md")
+            self._write(report_text, output_file)
+            output_files.append(output_file)
+        
+        print(f"共生成 {len(output_files)} 个视图报告")
+        return output_files
+    
     def export_json(self, stats, output_file):
         """导出 JSON 格式数据"""
         with open(output_file, 'w', encoding='utf-8') as f:
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+报告发布模块
+负责通过 Gitea 文件内容 API 把生成的报告一次性提交到文档仓库，无需本地工作副本
+"""
+
+import os
+import base64
+
+
+class ReportPublisher:
+    """报告发布类（批量、原子、可幂等重试）"""
+    
+    def __init__(self, gitea_api, repo, branch=None, directory='', max_attempts=3):
+        self.gitea_api = gitea_api
+        self.owner, self.repo_name = repo.split('/', 1)
+        self.branch = branch or None
+        self.directory = directory.strip('/')
+        self.max_attempts = max_attempts
+    
+    def _remote_path(self, local_file):
+        """本地文件在文档仓库中的路径"""
+        name = os.path.basename(local_file)
+        return f"{self.directory}/{name}" if self.directory else name
+    
+    def _plan(self, contents):
+        """对比仓库中的当前内容，只为新增或有变化的文件生成操作"""
+        operations = []
+        for path, content in contents.items():
+            existing = self.gitea_api.get_file(self.owner, self.repo_name, path, self.branch)
+            if existing is None:
+                operations.append({
+                    'operation': 'create',
+                    'path': path,
+                    'content': base64.b64encode(content).decode('ascii')
+                })
+            elif existing[1] != content:
+                operations.append({
+                    'operation': 'update',
+                    'path': path,
+                    'sha': existing[0],
+                    'content': base64.b64encode(content).decode('ascii')
+                })
+        return operations
+    
+    def publish(self, files, message):
+        """把本地文件作为一次提交发布到文档仓库，返回是否成功
+        
+        每次尝试都先读取仓库当前内容再提交：上一次提交其实已成功（例如响应丢失）时，
+        重试会发现内容一致而直接结束；文件被并发修改导致 sha 冲突时，按新内容重新提交
+        """
+        contents = {}
+        for local_file in files:
+            if local_file and os.path.exists(local_file):
+                with open(local_file, 'rb') as f:
+                    contents[self._remote_path(local_file)] = f.read()
+        
+        if not contents:
+            print("没有需要发布的报告文件")
+            return True
+        
+        repo = f"{self.owner}/{self.repo_name}@{self.branch or '默认分支'}"
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                operations = self._plan(contents)
+            except Exception as e:
+                print(f"读取文档仓库 {repo} 失败: {e}")
+                return False
+            
+            if not operations:
+                print(f"报告已是最新，无需提交: {repo}")
+                return True
+            
+            print(f"提交 {len(operations)} 个文件到 {repo}（第 {attempt} 次）")
+            try:
+                status_code = self.gitea_api.change_files(self.owner, self.repo_name, self.branch, message, operations)
+            except Exception as e:
+                print(f"提交报告失败: {e}")
+                continue
+            
+            if status_code in (200, 201):
+                for operation in operations:
+                    print(f"  已发布: {operation['path']}")
+                return True
+            if status_code not in (409, 422):
+                # 409/422 多为 sha 冲突（并发修改或上次提交已生效），重新读取后重试；其他错误直接放弃
+                return False
+        
+        print(f"提交报告失败: 已尝试 {self.max_attempts} 次")
+        return False
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日汇总存储模块
+负责把每天 × 用户 × 仓库的提交汇总持久化到本地 SQLite，供长时间范围报告复用
+"""
+
+import os
+import json
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from quantile_sketch import KLLSketch
+from hyperloglog import merge_distinct, distinct_to_json, distinct_from_json
+from path_breakdown import paths_to_json, paths_from_json
+
+
+class RollupStore:
+    """每日汇总存储类
+    
+    结束不足 settle_days 天的日期不汇总，每次运行重新扫描（之后推送或合并的提交仍可能带有这些天的提交时间）；
+    attribution 为影响提交归属的输入（分支选择、用户表、别名、mailmap）和活跃天保存格式（集合或 HyperLogLog）的版本，
+    只有以相同版本汇总的天才算已覆盖，输入变化后这些天重新扫描
+    """
+    
+    def __init__(self, db_path, settle_days=0):
+        self.db_path = db_path
+        self.settle_days = settle_days
+        self.attribution = None
+        self.conn = None
+        self.enabled = False
+        
+        if db_path:
+            self._connect()
+    
+    def _connect(self):
+        """打开 SQLite 数据库并建表"""
+        try:
+            db_dir = os.path.dirname(self.db_path)
+            if db_dir and not os.path.exists(db_dir):
+                os.makedirs(db_dir, exist_ok=True)
+            
+            self.conn = sqlite3.connect(self.db_path)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS daily_rollup (
+                    day TEXT NOT NULL,
+                    repo TEXT NOT NULL,
+                    user TEXT NOT NULL,
+                    commits INTEGER NOT NULL,
+                    additions INTEGER NOT NULL,
+                    deletions INTEGER NOT NULL,
+                    first_commit TEXT,
+                    last_commit TEXT,
+                    sizes TEXT,
+                    paths TEXT,
+                    active_days TEXT,
+                    PRIMARY KEY (repo, day, user)
+                );
+                CREATE INDEX IF NOT EXISTS idx_daily_rollup_day ON daily_rollup (day);
+                CREATE TABLE IF NOT EXISTS covered_day (
+                    repo TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    attribution TEXT,
+                    logged INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (repo, day)
+                );
+            """)
+            # 旧版本创建的表没有单次提交大小的草图列、路径分布列和活跃天列
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(daily_rollup)")}
+            if 'sizes' not in columns:
+                self.conn.execute("ALTER TABLE daily_rollup ADD COLUMN sizes TEXT")
+            if 'paths' not in columns:
+                self.conn.execute("ALTER TABLE daily_rollup ADD COLUMN paths TEXT")
+            if 'active_days' not in columns:
+                self.conn.execute("ALTER TABLE daily_rollup ADD COLUMN active_days TEXT")
+            # 旧版本没有归属版本，已覆盖的天全部重新汇总一次；也没有记录这些天的提交是否写入了提交日志
+            covered_columns = {row[1] for row in self.conn.execute("PRAGMA table_info(covered_day)")}
+            if 'attribution' not in covered_columns:
+                self.conn.execute("ALTER TABLE covered_day ADD COLUMN attribution TEXT")
+            if 'logged' not in covered_columns:
+                self.conn.execute("ALTER TABLE covered_day ADD COLUMN logged INTEGER NOT NULL DEFAULT 0")
+            self.conn.commit()
+            self.enabled = True
+            print(f"日汇总存储已启用: {self.db_path}")
+        except Exception as e:
+            print(f"日汇总存储打开失败: {e}，将每次完整扫描")
+            self.enabled = False
+    
+    @staticmethod
+    def day_key(dt):
+        """返回 datetime 对应的 UTC 日期字符串"""
+        return dt.astimezone(timezone.utc).strftime('%Y-%m-%d')
+    
+    @staticmethod
+    def split_window(since_dt, until_dt, settle_days=0):
+        """把时间窗口拆成 (头部残段, 完整天列表, 尾部残段)
+        
+        只有结束超过 settle_days 天的完整 UTC 天才会进入完整天列表，之后的时间并入尾部残段；
+        残段返回 (start, end) 或 None
+        """
+        now = datetime.now(timezone.utc)
+        until_dt = min(until_dt or now, now)
+        settled_dt = min(until_dt, now - timedelta(days=settle_days))
+        
+        first_day = since_dt.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        if first_day < since_dt:
+            first_day += timedelta(days=1)
+        last_day_end = settled_dt.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        
+        if first_day >= last_day_end:
+            return (since_dt, until_dt), [], None
+        
+        days = []
+        day = first_day
+        while day < last_day_end:
+            days.append(day)
+            day += timedelta(days=1)
+        
+        head = (since_dt, first_day) if since_dt < first_day else None
+        tail = (last_day_end, until_dt) if last_day_end < until_dt else None
+        return head, days, tail
+    
+    def covered_days(self, repo, day_keys, logged_only=False):
+        """返回仓库在给定日期中以当前归属版本完整汇总过的日期集合，logged_only 时只返回提交已写入提交日志的日期"""
+        if not self.enabled or not day_keys:
+            return set()
+        rows = self.conn.execute(
+            "SELECT day FROM covered_day WHERE repo = ? AND day BETWEEN ? AND ? AND attribution IS ?"
+            + (" AND logged = 1" if logged_only else ""),
+            (repo, min(day_keys), max(day_keys), self.attribution)
+        ).fetchall()
+        wanted = set(day_keys)
+        return {row[0] for row in rows if row[0] in wanted}
+    
+    def plan(self, repo, since_dt, until_dt, reuse=True, logged_only=False):
+        """规划仓库在时间窗口内需要扫描的时间段
+        
+        返回 {'scan_ranges': [(start, end), ...], 'scanned_days': 本次扫描后写入汇总的天, 'covered_days': 直接读取汇总的天}；
+        reuse=False 时不读取已有汇总，整个窗口重新扫描（完整的天仍然写入汇总）；
+        logged_only 时只复用提交已写入提交日志的天，其余的天重新扫描，补齐提交日志
+        """
+        head, days, tail = self.split_window(since_dt, until_dt, self.settle_days)
+        
+        day_keys = [self.day_key(day) for day in days]
+        covered = self.covered_days(repo, day_keys, logged_only) if reuse else set()
+        
+        segments = []
+        if head:
+            segments.append(head)
+        for day, key in zip(days, day_keys):
+            if key not in covered:
+                segments.append((day, day + timedelta(days=1)))
+        if tail:
+            segments.append(tail)
+        
+        # 合并相邻时间段，减少 git log 调用次数
+        scan_ranges = []
+        for start, end in segments:
+            if scan_ranges and scan_ranges[-1][1] >= start:
+                scan_ranges[-1] = (scan_ranges[-1][0], max(scan_ranges[-1][1], end))
+            else:
+                scan_ranges.append((start, end))
+        
+        return {
+            'scan_ranges': scan_ranges,
+            'scanned_days': {key for key in day_keys if key not in covered},
+            'covered_days': sorted(covered)
+        }
+    
+    def load(self, repo, day_keys):
+        """按用户汇总读取仓库在给定日期中的数据
+        
+        日期为提交时间的 UTC 天（与 git log --since/--until 一致），days 为其中提交的作者日期（活跃天），
+        DISTINCT_MODE=hll 时保存和合并的是 HyperLogLog，否则为集合；旧数据没有作者日期时按汇总的日期；
+        sketch 为合并后的单次提交代码行数草图；旧数据没有草图时按当天平均提交大小近似；
+        paths 为 {(语言, 第一级目录): 代码行数}，旧数据没有路径分布
+        """
+        if not self.enabled or not day_keys:
+            return {}
+        result = {}
+        wanted = set(day_keys)
+        rows = self.conn.execute(
+            "SELECT day, user, commits, additions, deletions, first_commit, last_commit, sizes, paths, active_days "
+            "FROM daily_rollup WHERE repo = ? AND day BETWEEN ? AND ?",
+            (repo, min(day_keys), max(day_keys))
+        ).fetchall()
+        for day, user, commits, additions, deletions, first_commit, last_commit, sizes, paths, active_days in rows:
+            if day not in wanted:
+                continue
+            entry = result.setdefault(user, {
+                'commits': 0,
+                'additions': 0,
+                'deletions': 0,
+                'first_commit': None,
+                'last_commit': None,
+                'days': set(),
+                'sketch': KLLSketch(),
+                'paths': {}
+            })
+            entry['days'] = merge_distinct(entry['days'], distinct_from_json(json.loads(active_days)) if active_days else {day})
+            if sizes:
+                entry['sketch'].merge(KLLSketch.from_dict(json.loads(sizes)))
+            elif commits:
+                entry['sketch'].update((additions + deletions) / commits, commits)
+            for key, lines in paths_from_json(json.loads(paths) if paths else None).items():
+                entry['paths'][key] = entry['paths'].get(key, 0) + lines
+            entry['commits'] += commits
+            entry['additions'] += additions
+            entry['deletions'] += deletions
+            if first_commit and (entry['first_commit'] is None or first_commit < entry['first_commit']):
+                entry['first_commit'] = first_commit
+            if last_commit and (entry['last_commit'] is None or last_commit > entry['last_commit']):
+                entry['last_commit'] = last_commit
+        return result
+    
+    def save(self, repo, day_keys, rollups):
+        """写入仓库若干完整天的汇总，并标记这些天已覆盖
+        
+        rollups 为 {(day, user): {'commits', 'additions', 'deletions', 'first_commit', 'last_commit', 'sketch', 'paths', 'days'}}，
+        同一天的旧数据会先被删除，保证重复运行不会重复累计
+        """
+        if not self.enabled or not day_keys:
+            return
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "DELETE FROM daily_rollup WHERE repo = ? AND day = ?",
+                    [(repo, day) for day in day_keys]
+                )
+                self.conn.executemany(
+                    "INSERT INTO daily_rollup (day, repo, user, commits, additions, deletions, first_commit, last_commit, sizes, paths, active_days) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (day, repo, user, data['commits'], data['additions'], data['deletions'],
+                         data['first_commit'], data['last_commit'],
+                         json.dumps(data['sketch'].to_dict()) if data.get('sketch') else None,
+                         json.dumps(paths_to_json(data['paths'])) if data.get('paths') else None,
+                         json.dumps(distinct_to_json(data['days'])) if data.get('days') else None)
+                        for (day, user), data in rollups.items()
+                        if day in day_keys
+                    ]
+                )
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO covered_day (repo, day, attribution, logged) VALUES (?, ?, ?, 0)",
+                    [(repo, day, self.attribution) for day in day_keys]
+                )
+        except Exception as e:
+            print(f"  日汇总写入失败: {e}")
+    
+    def mark_logged(self, repo, day_keys):
+        """标记仓库这些已汇总的天的提交已经写入提交日志"""
+        if not self.enabled or not day_keys:
+            return
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "UPDATE covered_day SET logged = 1 WHERE repo = ? AND day = ? AND attribution IS ?",
+                    [(repo, day, self.attribution) for day in day_keys]
+                )
+        except Exception as e:
+            print(f"  日汇总写入失败: {e}")
+    
+    def close(self):
+        """关闭数据库连接"""
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+            self.enabled = False
@@ -24,6 +24,15 @@ if [ "$1" = "manual" ]; then
     exit $exit_code
 fi
 
+# 日间预取：更新活跃仓库的本地克隆并预先计算提交快照（到 PREFETCH_STOP 前结束）
+if [ "$1" = "prefetch" ]; then
+    echo "$(date '+%Y-%m-%d %H:%M:%S'): 日间预取开始执行" >> /home/gitea/statics/cron.log 2>&1
+    /usr/bin/python3 gitea_prefetch.py >> /home/gitea/statics/gitea_prefetch.log 2>&1
+    exit_code=$?
+    echo "$(date '+%Y-%m-%d %H:%M:%S'): 日间预取执行结束，退出码: $exit_code" >> /home/gitea/statics/cron.log 2>&1
+    exit $exit_code
+fi
+
 # 定时任务执行
 echo "$(date '+%Y-%m-%d %H:%M:%S'): 定时任务开始执行" >> /home/gitea/statics/cron.log 2>&1
 
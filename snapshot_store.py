@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+运行快照存储模块
+负责把每次运行的用户聚合结果压缩保存到本地 SQLite，供下次报告计算排名变化和指标增减
+"""
+
+import os
+import json
+import zlib
+import sqlite3
+from datetime import datetime, timezone
+from time_utils import parse_datetime
+
+
+# 每个用户在快照中按固定顺序保存为数组，避免重复存储字段名
+SNAPSHOT_FIELDS = ('rank', 'commits', 'total_lines', 'additions', 'deletions', 'active_days', 'repos_count', 'score')
+
+
+class SnapshotStore:
+    """运行快照存储类"""
+    
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = None
+        self.enabled = False
+        
+        if db_path:
+            self._connect()
+    
+    def _connect(self):
+        """打开 SQLite 数据库并建表"""
+        try:
+            db_dir = os.path.dirname(self.db_path)
+            if db_dir and not os.path.exists(db_dir):
+                os.makedirs(db_dir, exist_ok=True)
+            
+            self.conn = sqlite3.connect(self.db_path)
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS run_snapshot (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created_at TEXT NOT NULL,
+                    since TEXT,
+                    until TEXT,
+                    window_days INTEGER,
+                    totals TEXT NOT NULL,
+                    users BLOB NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_run_snapshot_window ON run_snapshot (window_days, id);
+            """)
+            self.conn.commit()
+            self.enabled = True
+            print(f"运行快照存储已启用: {self.db_path}")
+        except Exception as e:
+            print(f"运行快照存储打开失败: {e}，报告将不显示环比变化")
+            self.enabled = False
+    
+    @staticmethod
+    def window_days(since_date, until_date):
+        """统计窗口的天数（四舍五入），没有起始日期时返回 None，只和相同窗口的快照比较"""
+        if not since_date:
+            return None
+        until_dt = parse_datetime(until_date) if until_date else datetime.now(timezone.utc)
+        return round((until_dt - parse_datetime(since_date)).total_seconds() / 86400)
+    
+    @staticmethod
+    def user_ranks(stats):
+        """按报告的排序规则计算有提交用户的名次（有综合排名时用综合排名，否则按代码行数）"""
+        rankings = stats.get('rankings') or {}
+        users = [u for u, data in stats['user_stats'].items() if data.get('commits', 0) > 0]
+        users.sort(key=lambda u: (rankings[u]['rank'] if u in rankings else len(rankings) + 1,
+                                  -stats['user_stats'][u]['total_lines']))
+        return {username: idx for idx, username in enumerate(users, 1)}
+    
+    def previous(self, window_days):
+        """读取相同窗口天数的最近一次快照，没有时返回 None"""
+        if not self.enabled:
+            return None
+        
+        row = self.conn.execute(
+            "SELECT id, created_at, since, until, totals, users FROM run_snapshot "
+            "WHERE window_days IS ? ORDER BY id DESC LIMIT 1",
+            (window_days,)
+        ).fetchone()
+        if row is None:
+            return None
+        
+        snapshot_id, created_at, since_date, until_date, totals, users = row
+        return {
+            'id': snapshot_id,
+            'created_at': created_at,
+            'since': since_date,
+            'until': until_date,
+            'totals': json.loads(totals),
+            'users': {
+                username: dict(zip(SNAPSHOT_FIELDS, values))
+                for username, values in json.loads(zlib.decompress(users)).items()
+            }
+        }
+    
+    def save(self, stats, since_date, until_date):
+        """保存本次运行的用户聚合快照"""
+        if not self.enabled:
+            return
+        
+        ranks = self.user_ranks(stats)
+        rankings = stats.get('rankings') or {}
+        users = {}
+        for username, rank in ranks.items():
+            data = stats['user_stats'][username]
+            values = dict(data, rank=rank, score=rankings.get(username, {}).get('score'))
+            users[username] = [values.get(field, 0) for field in SNAPSHOT_FIELDS]
+        
+        totals = {
+            'total_repos': stats['total_repos'],
+            'total_commits': stats['total_commits'],
+            'total_lines': stats['total_lines'],
+            'total_contributors': len(ranks)
+        }
+        
+        self.conn.execute(
+            "INSERT INTO run_snapshot (created_at, since, until, window_days, totals, users) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                datetime.now(timezone.utc).isoformat(),
+                since_date,
+                until_date,
+                self.window_days(since_date, until_date),
+                json.dumps(totals),
+                zlib.compress(json.dumps(users, separators=(',', ':')).encode('utf-8'))
+            )
+        )
+        self.conn.commit()
+        print(f"运行快照已保存: {len(users)} 个用户")
+    
+    def close(self):
+        """关闭数据库连接"""
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
@@ -5,11 +5,34 @@
 负责收集和统计所有仓库和用户的代码贡献数据
 """
 
-from datetime import datetime, timedelta, timezone
+import os
+import json
+import time
+import queue
+import socket
+import shutil
+import fnmatch
+import hashlib
+import tempfile
+import itertools
+import threading
+from datetime import datetime, timezone
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, as_completed, FIRST_COMPLETED
 from redis_cache import RedisCache
-from gitea_api import GiteaAPI
-from git_operations import GitOperations
+from config import window_id
+from gitea_api import GiteaAPI, ListingError
+from git_operations import GitOperations, SliceScanError
+from rollup_store import RollupStore
+from commit_log import CommitLog
+from throttle import AdaptiveLimiter, RetryPolicy
+from work_queue import RedisWorkQueue
+from mailmap import Mailmap
+from quantile_sketch import KLLSketch
+from hyperloglog import HyperLogLog, RedisHyperLogLog, merge_distinct
+from repo_scanner import (UserMatcher, aggregate_commits, api_commits_to_records, init_scan_worker,
+                          scan_repo, partial_to_json, partial_from_json)
+from time_utils import parse_datetime
 
 
 class StatsCollector:
@@ -22,9 +45,6 @@ class StatsCollector:
         self.password = config.get('GITEA_PASSWORD')
         self.clone_dir = config.get('CLONE_DIR')
         
-        self.gitea_api = GiteaAPI(self.base_url, self.token, self.username, self.password)
-        self.git_ops = GitOperations(self.token, self.username, self.password, self.clone_dir)
-        
         self.redis_cache = None
         if config.get('REDIS_HOST'):
             self.redis_cache = RedisCache(
@@ -34,7 +54,86 @@ class StatsCollector:
                 password=config.get('REDIS_PASSWORD')
             )
         
+        # HTTP 请求和 Git 拉取共用一组退避状态，任一方被限流时双方一起放慢
+        self.retry_policy = RetryPolicy(
+            max_retries=int(config.get('MAX_RETRIES') or 4),
+            base_delay=float(config.get('RETRY_BASE_DELAY') or 1.0)
+        )
+        self.http_limiter = AdaptiveLimiter('http', max_limit=int(config.get('HTTP_MAX_CONCURRENCY') or 8))
+        self.git_limiter = AdaptiveLimiter('git', max_limit=int(config.get('GIT_MAX_CONCURRENCY') or 4),
+                                           group=self.http_limiter.group)
+        
+        self.gitea_api = GiteaAPI(self.base_url, self.token, self.username, self.password, cache=self.redis_cache,
+                                  limiter=self.http_limiter, retry_policy=self.retry_policy)
+        self.git_ops = GitOperations(self.token, self.username, self.password, self.clone_dir,
+                                     limiter=self.git_limiter, retry_policy=self.retry_policy,
+                                     lock_timeout=int(config.get('REPO_LOCK_TIMEOUT') or 600),
+                                     fresh_seconds=int(config.get('REPO_FRESH_SECONDS') or 300),
+                                     slice_days=int(config.get('SLICE_DAYS') or 30),
+                                     slice_min_size_kb=int(config.get('SLICE_MIN_SIZE_KB') or 1048576),
+                                     slice_workers=int(config.get('SLICE_WORKERS') or 4),
+                                     numstat_db=config.get('NUMSTAT_DB'))
+        if self.git_ops.numstat_cache.enabled:
+            print(f"提交行数缓存已启用: {config.get('NUMSTAT_DB')}")
+        
+        self.rollup_store = RollupStore(config.get('ROLLUP_DB'), int(config.get('ROLLUP_SETTLE_DAYS') or 3))
+        # 导出提交明细的运行不读取日汇总（汇总中没有逐提交的明细），整个窗口重新扫描
+        self.exporting_commits = False
+        # 统计过的每个提交追加到二进制提交日志，供 gitea_history.py 生成历史报告
+        self.commit_log = CommitLog(config.get('COMMIT_LOG'), lock_timeout=int(config.get('REPO_LOCK_TIMEOUT') or 600))
+        
+        self.repo_sources = tuple(
+            source.strip() for source in (config.get('REPO_SOURCES') or 'orgs,users,search').split(',') if source.strip()
+        )
+        self.discovery_workers = int(config.get('DISCOVERY_WORKERS') or 4)
+        
+        # 用户和仓库列表优先读缓存：未超过 METADATA_FRESH_SECONDS 直接使用，超过后先用缓存再后台刷新
+        self.metadata_fresh_seconds = int(config.get('METADATA_FRESH_SECONDS') or 3600)
+        self.metadata_max_stale_seconds = int(config.get('METADATA_MAX_STALE_SECONDS') or 7 * 86400)
+        self.metadata_refreshes = []
+        # 本次运行没有缓存可以兜底、重试后仍然失败的仓库列表地址，非空时本次统计不完整
+        self.discovery_failures = []
+        
+        # serial=主进程逐个仓库扫描；process=线程池拉取、进程池解析聚合，利用多核；
+        # distributed=通过 Redis 队列分发给多台机器上的 gitea_worker.py
+        self.scan_mode = (config.get('SCAN_MODE') or 'serial').lower()
+        self.scan_workers = int(config.get('SCAN_WORKERS') or os.cpu_count() or 1)
+        self.lease_seconds = int(config.get('WORK_LEASE_SECONDS') or 900)
+        self.window_id = window_id(config)
+        self.coordinator_scan = (config.get('COORDINATOR_SCAN') or 'true').lower() == 'true'
+        self.worker_idle_exit = int(config.get('WORKER_IDLE_EXIT') or 300)
+        
+        # 统计哪些分支：all=所有引用（--all）；default=默认分支；protected=受保护分支；其他项按分支通配符处理
+        self.ref_policy = [
+            item.strip() for item in (config.get('REF_POLICY') or 'all').split(',') if item.strip()
+        ] or ['all']
+        
+        # 提交获取方式：git=全部 clone 后 git log；api=通过 Gitea 提交 API 获取；
+        # auto=体积小且预计提交量少的仓库用 API，避免为几行改动克隆整个仓库，其余用 Git
+        self.commit_engine = (config.get('COMMIT_ENGINE') or 'auto').lower()
+        self.api_max_size_kb = int(config.get('API_ENGINE_MAX_SIZE_KB') or 20480)
+        self.api_max_commits = int(config.get('API_ENGINE_MAX_COMMITS') or 200)
+        self.engine_counts = defaultdict(int)
+        
+        # 预取（gitea_prefetch.py）：每轮最多预取的仓库数（0 表示不限）和并发数
+        self.prefetch_max_repos = int(config.get('PREFETCH_MAX_REPOS') or 0)
+        self.prefetch_workers = int(config.get('PREFETCH_WORKERS') or 2)
+        
+        # 配置 MAILMAP_FILE 时生成 Git mailmap，git log 直接输出规范化的作者
+        self.mailmap = Mailmap(config.get('MAILMAP_FILE'))
+        
+        # 用户的仓库数和活跃天数、仓库的贡献者数的去重计数：exact=集合，精确；hll=HyperLogLog 近似计数（精度为 HLL_PRECISION）。
+        # 活跃天由各工作进程/工作节点按仓库生成草图，随部分结果传输、写入日汇总，由主进程合并；
+        # 用户的仓库数只在主进程中累加，启用 Redis 时使用 PFADD/PFCOUNT
+        self.distinct_mode = (config.get('DISTINCT_MODE') or 'exact').lower()
+        self.hll_precision = int(config.get('HLL_PRECISION') or 14)
+        self.distinct_precision = self.hll_precision if self.distinct_mode == 'hll' else None
+        self.distinct_prefix = 'gitea:hll'
+        self.distinct_ids = itertools.count()
+        
         self.gitea_users = {}
+        self.size_sketches = defaultdict(KLLSketch)
+        self.path_stats = defaultdict(dict)
         
         self.user_aliases = {}
         if config.get('USER_ALIASES'):
@@ -56,58 +155,278 @@ class StatsCollector:
             return
         self.redis_cache.set(key, value, expire_seconds)
     
-    def get_gitea_users(self):
-        """获取 Gitea 中所有用户列表"""
-        cache_key = "gitea:users"
-        
-        users = self.gitea_api.get_users()
+    def _report_not_modified(self, not_modified_before):
+        """输出本次列表请求中命中 304 缓存的页数"""
+        not_modified = self.gitea_api.not_modified_count - not_modified_before
+        if not_modified:
+            print(f"  其中 {not_modified} 页未变化（HTTP 304），直接使用缓存")
+    
+    def get_run_metrics(self):
+        """返回本次运行的并发控制指标和各提交获取方式处理的仓库数"""
+        return {
+            'throttle': {
+                'http': self.http_limiter.metrics(),
+                'git': self.git_limiter.metrics()
+            },
+            'engines': dict(self.engine_counts),
+            'discovery_failures': list(self.discovery_failures)
+        }
+    
+    def _cached_metadata(self, cache_key):
+        """读取带时间戳的元数据缓存，返回 (数据, 已缓存秒数)，没有缓存时返回 (None, None)"""
+        entry = self.cache_get(cache_key)
+        if not isinstance(entry, dict) or 'fetched_at' not in entry:
+            return None, None
+        return entry['data'], time.time() - entry['fetched_at']
+    
+    def _store_metadata(self, cache_key, data):
+        """写入带时间戳的元数据缓存"""
+        self.cache_set(cache_key, {'fetched_at': time.time(), 'data': data},
+                       expire_seconds=self.metadata_max_stale_seconds)
+    
+    def _refresh_in_background(self, target):
+        """在后台线程中刷新元数据缓存，收集结束前等待完成"""
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        self.metadata_refreshes.append(thread)
+    
+    def wait_metadata_refreshes(self):
+        """等待后台元数据刷新完成，保证缓存在进程退出前写入"""
+        while self.metadata_refreshes:
+            self.metadata_refreshes.pop().join()
+    
+    def _fetch_gitea_users(self):
+        """从 API 获取用户列表并写入缓存，失败时返回 None"""
+        not_modified_before = self.gitea_api.not_modified_count
+        try:
+            users = self.gitea_api.get_users()
+        except Exception as e:
+            print(f"获取用户列表失败: {e}")
+            users = None
         
         if users:
             print(f"共找到 {len(users)} 个 Gitea 用户")
-            self.cache_set(cache_key, users, expire_seconds=86400)
+            self._report_not_modified(not_modified_before)
+            self._store_metadata("gitea:users", users)
+        
+        return users
+    
+    def get_gitea_users(self):
+        """获取 Gitea 中所有用户列表（优先使用缓存，过期后先用缓存再后台刷新）"""
+        cached_users, age = self._cached_metadata("gitea:users")
         
+        if cached_users:
+            if age > self.metadata_fresh_seconds:
+                print(f"使用缓存的用户列表: {len(cached_users)} 个（{age / 60:.0f} 分钟前），后台刷新")
+                self._refresh_in_background(self._fetch_gitea_users)
+            else:
+                print(f"使用缓存的用户列表: {len(cached_users)} 个（{age / 60:.0f} 分钟前）")
+            return cached_users
+        
+        users = self._fetch_gitea_users()
+        if not users:
+            print("警告: 未能获取 Gitea 用户列表，所有提交都将被视为外部用户")
         return users if users else {}
     
     def get_all_repos(self):
         """获取所有仓库列表，排除 fork 的仓库和 fork/ 开头的仓库"""
-        cache_key = "gitea:repos"
+        return list(self.iter_all_repos())
+    
+    def _discover_repos(self, has_fallback=False):
+        """边发现边返回仓库（组织、用户、全站搜索合并去重），发现结束后写入缓存
         
-        repos = self.gitea_api.get_repos()
+        任一列表重试后仍然失败时不写入缓存（避免把不完整的列表当作最新列表）；
+        没有缓存兜底（has_fallback=False）时记入 discovery_failures，本次运行标记为不完整
+        """
+        not_modified_before = self.gitea_api.not_modified_count
+        repos = []
+        failures = []
+        for repo in self.gitea_api.iter_repos(self.repo_sources, list(self.gitea_users.keys()) or None,
+                                              self.discovery_workers, failures):
+            repos.append(repo)
+            yield repo
         
-        if repos:
+        if failures:
+            print(f"警告: {len(failures)} 个仓库列表获取失败，仓库列表不完整（找到 {len(repos)} 个），本次不更新仓库列表缓存")
+            if not has_fallback:
+                self.discovery_failures.extend(failures)
+        elif repos:
             print(f"共找到 {len(repos)} 个仓库（已排除 fork 仓库和 fork/ 开头的仓库）")
-            self.cache_set(cache_key, repos, expire_seconds=3600)
+            self._report_not_modified(not_modified_before)
+            self._store_metadata("gitea:repos", repos)
+    
+    def iter_all_repos(self):
+        """返回所有仓库：缓存新鲜时直接使用；缓存过期时先返回缓存中的仓库，
+        同时后台重新发现，再补上缓存中没有的新仓库；没有缓存时边发现边返回
+        """
+        cached_repos, age = self._cached_metadata("gitea:repos")
+        
+        if not cached_repos:
+            yield from self._discover_repos()
+            return
+        
+        if age <= self.metadata_fresh_seconds:
+            print(f"使用缓存的仓库列表: {len(cached_repos)} 个（{age / 60:.0f} 分钟前）")
+            yield from cached_repos
+            return
+        
+        print(f"先使用缓存的仓库列表: {len(cached_repos)} 个（{age / 60:.0f} 分钟前），同时后台重新发现")
+        found = queue.Queue()
+        finished = object()
+        
+        def discover():
+            try:
+                for repo in self._discover_repos(has_fallback=True):
+                    found.put(repo)
+            except Exception as e:
+                print(f"重新发现仓库失败: {e}，继续使用缓存的仓库列表")
+            finally:
+                found.put(finished)
+        
+        self._refresh_in_background(discover)
+        
+        seen = set()
+        for repo in cached_repos:
+            seen.add(repo.get('id'))
+            yield repo
         
-        return repos if repos else []
+        new_count = 0
+        while True:
+            repo = found.get()
+            if repo is finished:
+                break
+            if repo.get('id') not in seen:
+                seen.add(repo.get('id'))
+                new_count += 1
+                yield repo
+        
+        if new_count:
+            print(f"重新发现补充了 {new_count} 个新仓库")
+    
+    def get_teams(self):
+        """获取所有团队及成员，用于按团队拆分报告"""
+        cache_key = "gitea:teams"
+        
+        try:
+            teams = self.gitea_api.get_teams()
+        except ListingError as e:
+            print(f"获取团队失败: {e}，不生成团队视图")
+            return {}
+        
+        if teams:
+            print(f"共找到 {len(teams)} 个团队")
+            self.cache_set(cache_key, teams, expire_seconds=86400)
+        
+        return teams if teams else {}
     
     def parse_datetime(self, dt_str):
         """解析 datetime 字符串，返回带时区的 datetime 对象"""
-        if not dt_str:
+        return parse_datetime(dt_str)
+    
+    def get_ref_patterns(self, repo, full_name):
+        """按 REF_POLICY 返回仓库需要统计的分支名/通配符列表，REF_POLICY=all 时返回 None（遍历所有引用）"""
+        if 'all' in self.ref_policy:
             return None
         
-        if isinstance(dt_str, str):
-            dt_str = dt_str.replace('Z', '+00:00')
-            dt = datetime.fromisoformat(dt_str)
-            
-            if dt.tzinfo is None:
-                dt = dt.replace(tzinfo=timezone.utc)
-            
-            return dt
+        cache_key = f"gitea:refs:{full_name}:{','.join(self.ref_policy)}"
+        cached_patterns = self.cache_get(cache_key)
+        if cached_patterns:
+            return cached_patterns
+        
+        patterns = set()
+        for item in self.ref_policy:
+            if item == 'default':
+                patterns.add(repo.get('default_branch') or 'main')
+            elif item == 'protected':
+                owner, repo_name = full_name.split('/', 1)
+                rules = self.gitea_api.get_branch_protections(owner, repo_name)
+                if rules is None:
+                    # 规则获取失败时不缓存，退回默认分支，下次运行再取
+                    patterns.add(repo.get('default_branch') or 'main')
+                    return sorted(patterns)
+                patterns.update(rules)
+                # 没有保护规则的仓库至少统计默认分支
+                if not rules:
+                    patterns.add(repo.get('default_branch') or 'main')
+            else:
+                patterns.add(item)
+        
+        patterns = sorted(patterns)
+        self.cache_set(cache_key, patterns, expire_seconds=86400)
+        return patterns
+    
+    def prepare_mailmap(self):
+        """按当前用户表和别名生成 mailmap，之后的 git log 输出规范化的作者"""
+        if not self.mailmap.enabled:
+            return
+        
+        try:
+            self.git_ops.mailmap_file = self.mailmap.build(self.gitea_users, UserMatcher(self.gitea_users, self.user_aliases))
+        except Exception as e:
+            print(f"生成 mailmap 失败: {e}，git log 输出原始作者")
+            self.git_ops.mailmap_file = None
+            return
+        print(f"mailmap: {len(self.mailmap.email_rules)} 条邮箱规则，{len(self.mailmap.learned)} 条已学习身份（版本 {self.mailmap.version}）")
+    
+    def attribution_version(self):
+        """影响提交归属的输入（REF_POLICY、用户表、USER_ALIASES、mailmap 邮箱规则）的哈希，用作日汇总的归属版本
         
-        if dt_str.tzinfo is None:
-            return dt_str.replace(tzinfo=timezone.utc)
+        mailmap 中的已学习身份不计入：它们每次运行都按同一用户表和别名重新验证，只记录匹配本来就会得到的结果；
+        hll 模式的日汇总保存活跃天的 HyperLogLog 草图，精度一并计入，与集合格式或其他精度的日汇总互不复用
+        """
+        inputs = {
+            'refs': self.ref_policy,
+            'users': [[login, (user_data.get('email') or '').lower()] for login, user_data in self.gitea_users.items()],
+            'aliases': sorted(self.user_aliases.items()),
+            # 邮箱规则与作者名冲突时按原始作者匹配，与此前按邮箱规则归属的日汇总不复用
+            'mailmap': {'precedence': 'alias,login,email', 'email_rules': sorted(self.mailmap.email_rules)}
+            if self.git_ops.mailmap_file else None
+        }
+        if self.distinct_precision:
+            inputs['distinct'] = f"hll:{self.distinct_precision}"
+        payload = json.dumps(inputs, ensure_ascii=False)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:12]
+    
+    def adopt_mailmap(self, text, run_id):
+        """工作节点：使用协调者发布的 mailmap，未配置 MAILMAP_FILE 时写到临时目录"""
+        if not text:
+            self.git_ops.mailmap_file = None
+            return
         
-        return dt_str
+        if not self.mailmap.enabled:
+            self.mailmap = Mailmap(os.path.join(tempfile.gettempdir(), f"gitea_stats_{run_id}.mailmap"))
+        self.mailmap.parse(text)
+        self.git_ops.mailmap_file = self.mailmap.write()
     
-    def get_repo_commits(self, repo_url, since_date=None, until_date=None):
+    def save_mailmap(self, identities):
+        """把本次解析到用户的作者身份加入 mailmap，下次运行由 git 直接规范化"""
+        if not self.mailmap.enabled or self.git_ops.mailmap_file is None:
+            return
+        
+        added = self.mailmap.learn(identities)
+        if added:
+            self.mailmap.write()
+            print(f"  - mailmap 新增 {added} 条已学习身份（版本 {self.mailmap.version}）")
+    
+    def get_repo_commits(self, repo_url, since_date=None, until_date=None, refs=None):
         """获取仓库的提交记录（优先使用 Git 命令）"""
         cache_key = f"gitea:commits:{repo_url}:{since_date}:{until_date}"
+        if refs is not None:
+            cache_key = f"{cache_key}:{','.join(refs)}"
+        if self.git_ops.mailmap_file:
+            # 带原始作者（RAW: 行）的提交记录，与旧版本缓存的记录区分
+            cache_key = f"{cache_key}:mailmap-raw-{self.mailmap.version}"
         cached_commits = self.cache_get(cache_key)
         if cached_commits:
             print(f"  从缓存读取提交记录: {len(cached_commits)} 个提交")
             return cached_commits
         
-        commits = self.git_ops.get_repo_commits(repo_url, since_date, until_date)
+        try:
+            commits = self.git_ops.get_repo_commits(repo_url, since_date, until_date, refs=refs)
+        except SliceScanError as e:
+            # 不完整的结果只用于本次统计，不写入缓存
+            print(f"  {e}，只统计其余时间片的 {len(e.commits)} 个提交")
+            return e.commits
         
         if commits:
             print(f"  从 Git 获取到 {len(commits)} 个提交")
@@ -115,11 +434,646 @@ class StatsCollector:
         
         return commits
     
-    def collect_all_stats(self, since_date=None, until_date=None):
-        """收集所有仓库和用户的统计数据"""
+    def get_repo_commits_in_ranges(self, repo_url, ranges, refs=None):
+        """获取仓库在多个时间段内的提交记录（只克隆/更新一次）"""
+        commits = self.git_ops.get_repo_commits_in_ranges(
+            repo_url,
+            [(start.isoformat(), end.isoformat()) for start, end in ranges],
+            refs=refs
+        )
+        
+        if commits:
+            print(f"  从 Git 获取到 {len(commits)} 个提交（{len(ranges)} 个未汇总时间段）")
+        
+        return commits
+    
+    def _scan_ranges(self, rollup_plan, since_date, until_date):
+        """返回仓库需要扫描的时间段 [(since, until), ...]（ISO 字符串）"""
+        if rollup_plan is None:
+            return [(since_date, until_date)]
+        return [(start.isoformat(), end.isoformat()) for start, end in rollup_plan['scan_ranges']]
+    
+    def _window_days(self, ranges):
+        """扫描时间段的总天数，有不限起始日期的时间段时返回 None"""
+        total = 0.0
+        for since_date, until_date in ranges:
+            if not since_date:
+                return None
+            until_dt = self.parse_datetime(until_date) if until_date else datetime.now(timezone.utc)
+            total += (until_dt - self.parse_datetime(since_date)).total_seconds() / 86400
+        return total
+    
+    def choose_commit_engine(self, repo, full_name, clone_url, ranges):
+        """按 COMMIT_ENGINE 为仓库选择提交获取方式，返回 'api' 或 'git'
+        
+        auto 时以下情况用 Git：本地已有克隆（增量 fetch 代价很小）、仓库体积超过 API_ENGINE_MAX_SIZE_KB、
+        按上次扫描的每天提交数估算本次提交数超过 API_ENGINE_MAX_COMMITS
+        """
+        if self.commit_engine in ('git', 'api'):
+            return self.commit_engine
+        
+        if self.clone_dir and os.path.exists(os.path.join(self.clone_dir, self.git_ops._extract_repo_name(clone_url))):
+            return 'git'
+        
+        if (repo.get('size') or 0) > self.api_max_size_kb:
+            return 'git'
+        
+        window_days = self._window_days(ranges)
+        daily_commits = self.cache_get(f"gitea:volume:{full_name}")
+        if daily_commits is not None and window_days is not None and daily_commits * window_days > self.api_max_commits:
+            return 'git'
+        
+        return 'api'
+    
+    def get_repo_commits_via_api(self, full_name, ranges, refs=None):
+        """通过 Gitea 提交 API 获取仓库在各时间段内的提交记录（不克隆仓库）
+        
+        refs 为 None 时遍历所有分支，否则只取匹配的分支（没有匹配时取默认分支），各分支边获取边按 SHA 去重；
+        请求失败或不重复的提交数超过 API_ENGINE_MAX_COMMITS 时返回 None，由调用方改用 Git
+        """
+        owner, repo_name = full_name.split('/', 1)
+        branches = self.gitea_api.get_branches(owner, repo_name)
+        if branches is None:
+            return None
+        if not branches:
+            return []
+        
+        if refs is not None:
+            branches = [branch for branch in branches if any(fnmatch.fnmatchcase(branch, pattern) for pattern in refs)]
+            if not branches:
+                print(f"  没有分支匹配 {', '.join(refs)}，改为只统计默认分支")
+                branches = [None]
+        
+        # 各时间段合并为一个外包区间请求，再在本地按时间段过滤
+        since_date = None if any(not since for since, _ in ranges) else min(ranges, key=lambda r: self.parse_datetime(r[0]))[0]
+        until_date = None if any(not until for _, until in ranges) else max(ranges, key=lambda r: self.parse_datetime(r[1]))[1]
+        
+        # 各分支共用已获取的 SHA 集合，共同的历史只获取一次，提交数上限按不重复的提交计算
+        commits = []
+        seen = set()
+        for branch in branches:
+            branch_commits = self.gitea_api.get_repo_commits(
+                owner, repo_name, sha=branch, since=since_date, until=until_date,
+                max_commits=self.api_max_commits, seen=seen
+            )
+            if branch_commits is None:
+                return None
+            commits.extend(branch_commits)
+        
+        records = api_commits_to_records(commits, ranges)
+        if self.git_ops.mailmap_file:
+            self.mailmap.apply(records)
+        print(f"  通过 API 获取到 {len(records)} 个提交（{len(branches)} 个分支）")
+        return records
+    
+    def _fetch_commits_via_api(self, full_name, ranges, refs):
+        """用 API 获取提交，失败或超过提交数上限时返回 None（调用方改用 Git）"""
+        try:
+            commits = self.get_repo_commits_via_api(full_name, ranges, refs)
+        except Exception as e:
+            print(f"  API 获取提交失败: {e}")
+            commits = None
+        
+        if commits is None:
+            print(f"  改用 Git 获取提交: {full_name}")
+        return commits
+    
+    def _record_volume(self, full_name, ranges, partial):
+        """记录仓库每天的提交数，供下次选择提交获取方式时估算提交量（时间段不足一天时不记录）"""
+        if partial['failed']:
+            return
+        
+        window_days = self._window_days(ranges)
+        if window_days is None or window_days < 1:
+            return
+        
+        self.cache_set(f"gitea:volume:{full_name}", round(partial['commit_count'] / window_days, 3),
+                       expire_seconds=30 * 86400)
+    
+    def _plan_rollup(self, full_name, since_date, until_date):
+        """根据日汇总存储规划需要扫描的时间段，未启用或无起始日期时返回 None"""
+        if not self.rollup_store.enabled or not since_date:
+            return None
+        
+        # 启用提交日志时，提交尚未写入日志的天即使已汇总也重新扫描，保证日志覆盖统计过的全部提交
+        return self.rollup_store.plan(full_name, self.parse_datetime(since_date), self.parse_datetime(until_date),
+                                      reuse=not self.exporting_commits, logged_only=self.commit_log.enabled)
+    
+    def match_user(self, username, author_email):
+        """把 Git 作者名和邮箱匹配为 Gitea 用户名，匹配失败返回 None"""
+        return UserMatcher(self.gitea_users, self.user_aliases).match(username, author_email)
+    
+    def _accumulate(self, user_stats, repo_stat, matched_user, full_name, commits,
+                    additions, deletions, total, first_commit, last_commit, days=()):
+        """把一组提交的统计累加到用户统计和仓库统计中"""
+        user_stat = user_stats[matched_user]
+        user_stat['commits'] += commits
+        user_stat['active_days'] = merge_distinct(user_stat['active_days'], days)
+        user_stat['repos'].add(full_name)
+        user_stat['additions'] += additions
+        user_stat['deletions'] += deletions
+        user_stat['total_lines'] += total
+        repo_stat['contributors'].add(matched_user)
+        repo_stat['commits'] += commits
+        repo_stat['additions'] += additions
+        repo_stat['deletions'] += deletions
+        repo_stat['total_lines'] += total
+        
+        contributor_stat = repo_stat['contributor_stats'].setdefault(matched_user, {
+            'commits': 0,
+            'additions': 0,
+            'deletions': 0,
+            'total_lines': 0
+        })
+        contributor_stat['commits'] += commits
+        contributor_stat['additions'] += additions
+        contributor_stat['deletions'] += deletions
+        contributor_stat['total_lines'] += total
+        
+        if first_commit:
+            if user_stat['first_commit'] is None:
+                user_stat['first_commit'] = first_commit
+            else:
+                first_dt = self.parse_datetime(user_stat['first_commit'])
+                if first_dt and self.parse_datetime(first_commit) < first_dt:
+                    user_stat['first_commit'] = first_commit
+        
+        if last_commit:
+            if user_stat['last_commit'] is None:
+                user_stat['last_commit'] = last_commit
+            else:
+                last_dt = self.parse_datetime(user_stat['last_commit'])
+                if last_dt and self.parse_datetime(last_commit) > last_dt:
+                    user_stat['last_commit'] = last_commit
+    
+    def _merge_partial(self, user_stats, repo_stat, full_name, partial, commit_exporter=None):
+        """把单个仓库的部分结果合并到全局统计中"""
+        for username, data in partial['users'].items():
+            self._accumulate(user_stats, repo_stat, username, full_name, data['commits'],
+                             data['additions'], data['deletions'], data['total_lines'],
+                             data['first_commit'], data['last_commit'], data['days'])
+            self.size_sketches[username].merge(data['sketch'])
+            repo_stat['sketch'].merge(data['sketch'])
+            self._merge_paths(username, full_name, data['paths'])
+        
+        if commit_exporter is not None:
+            for sha, username, commit_date_iso, committed_iso, additions, deletions in partial['facts']:
+                commit_exporter.write(sha, full_name, username, commit_date_iso, additions, deletions, committed_iso)
+        if self.commit_log.enabled:
+            for sha, username, commit_date_iso, committed_iso, additions, deletions in partial['facts']:
+                self.commit_log.append(sha, full_name, username, commit_date_iso, committed_iso, additions, deletions)
+    
+    def _merge_paths(self, username, full_name, paths):
+        """把仓库内 {(语言, 第一级目录): 代码行数} 累计到用户的路径分布，目录前加上仓库全名"""
+        user_paths = self.path_stats[username]
+        for (language, top_dir), lines in paths.items():
+            key = (language, f"{full_name}/{top_dir}")
+            user_paths[key] = user_paths.get(key, 0) + lines
+    
+    @staticmethod
+    def path_breakdown(paths):
+        """用户的语言和目录分布（按代码行数降序），breakdown 为 [[语言, 目录, 代码行数], ...]"""
+        languages = defaultdict(int)
+        directories = defaultdict(int)
+        for (language, directory), lines in (paths or {}).items():
+            languages[language] += lines
+            directories[directory] += lines
+        return {
+            'languages': dict(sorted(languages.items(), key=lambda x: x[1], reverse=True)),
+            'directories': dict(sorted(directories.items(), key=lambda x: x[1], reverse=True)),
+            'breakdown': [
+                [language, directory, lines]
+                for (language, directory), lines in sorted((paths or {}).items(), key=lambda x: x[1], reverse=True)
+            ]
+        }
+    
+    @staticmethod
+    def size_quantiles(sketch):
+        """单次提交代码行数的中位数和 p95（没有提交时为 None）"""
+        if sketch is None or not sketch.count:
+            return {'median_commit_lines': None, 'p95_commit_lines': None}
+        return {
+            'median_commit_lines': round(float(sketch.quantile(0.5)), 1),
+            'p95_commit_lines': round(float(sketch.quantile(0.95)), 1)
+        }
+    
+    def _new_distinct(self):
+        """新建一个只在主进程中累加的去重计数器：exact 模式为集合，hll 模式为 HyperLogLog（启用 Redis 时存放在本次运行的 Redis 键中）"""
+        if self.distinct_mode != 'hll':
+            return set()
+        if self.redis_cache and self.redis_cache.enabled:
+            return RedisHyperLogLog(self.redis_cache, f"{self.distinct_prefix}:{next(self.distinct_ids)}")
+        return HyperLogLog(self.hll_precision)
+    
+    def _new_sketch(self):
+        """新建一个可与部分结果、日汇总中的草图合并的去重计数器：exact 模式为集合，hll 模式为纯 Python 的 HyperLogLog"""
+        if self.distinct_precision:
+            return HyperLogLog(self.distinct_precision)
+        return set()
+    
+    def _repo_names(self, repo):
+        """返回仓库的 (全名, clone 地址)"""
+        owner = repo.get('owner', {}).get('login', 'unknown')
+        repo_name = repo.get('name', 'unknown')
+        full_name = f"{owner}/{repo_name}"
+        clone_url = repo.get('clone_url', f"{self.base_url}/{owner}/{repo_name}.git")
+        return full_name, clone_url
+    
+    def _empty_partial(self, failed=False):
+        """没有需要扫描的提交时使用的空部分结果"""
+        return {
+            'users': {},
+            'rollups': {},
+            'facts': [],
+            'identities': {},
+            'skipped_unknown': 0,
+            'skipped_outside': 0,
+            'commit_count': 0,
+            'failed': failed
+        }
+    
+    def _scan_repos_serial(self, since_date, until_date, export_facts):
+        """在主进程中逐个仓库拉取、解析和预聚合，产出 (仓库, 全名, 日汇总计划, 部分结果)"""
+        matcher = UserMatcher(self.gitea_users, self.user_aliases)
+        
+        # 仓库边发现边分析，无需等待全部列表获取完成
+        for idx, repo in enumerate(self.iter_all_repos(), 1):
+            full_name, clone_url = self._repo_names(repo)
+            print(f"[{idx}] 正在分析仓库: {full_name}")
+            
+            rollup_plan = self._plan_rollup(full_name, since_date, until_date)
+            failed = False
+            engine = None
+            
+            if rollup_plan is not None and not rollup_plan['scan_ranges']:
+                print(f"  {len(rollup_plan['covered_days'])} 天均已汇总，跳过 Git 扫描")
+                commits = []
+            else:
+                ranges = self._scan_ranges(rollup_plan, since_date, until_date)
+                refs = self.get_ref_patterns(repo, full_name)
+                commits = None
+                if self.choose_commit_engine(repo, full_name, clone_url, ranges) == 'api':
+                    commits = self._fetch_commits_via_api(full_name, ranges, refs)
+                    engine = 'api'
+                
+                if commits is None:
+                    engine = 'git'
+                    if rollup_plan is None:
+                        commits = self.get_repo_commits(clone_url, since_date, until_date, refs)
+                    else:
+                        try:
+                            commits = self.get_repo_commits_in_ranges(clone_url, rollup_plan['scan_ranges'], refs)
+                        except SliceScanError as e:
+                            print(f"  {e}，只统计其余时间片的 {len(e.commits)} 个提交，不写入日汇总")
+                            commits = e.commits
+                            failed = True
+                        if commits is None:
+                            failed = True
+                            commits = []
+            
+            scanned_days = rollup_plan['scanned_days'] if rollup_plan is not None else ()
+            partial = aggregate_commits(commits or [], matcher, scanned_days, export_facts, self.distinct_precision)
+            partial['commit_count'] = len(commits or [])
+            partial['failed'] = failed
+            if engine:
+                partial['engine'] = engine
+                self._record_volume(full_name, ranges, partial)
+            yield repo, full_name, rollup_plan, partial
+    
+    def _worker_git_options(self):
+        """工作进程中 GitOperations 的参数（只负责读取已拉取的仓库，不需要认证和并发控制）"""
+        return {
+            'clone_dir': self.clone_dir,
+            'lock_timeout': self.git_ops.lock_timeout,
+            'slice_days': self.git_ops.slice_days,
+            'slice_min_size_kb': self.git_ops.slice_min_size_kb,
+            'slice_workers': self.git_ops.slice_workers,
+            'mailmap_file': self.git_ops.mailmap_file,
+            'numstat_db': self.git_ops.numstat_cache.db_path
+        }
+    
+    def _fetch_repo(self, clone_url):
+        """拉取仓库到本地（在线程池中运行），返回本地路径"""
+        return self.git_ops.clone_repo(clone_url)
+    
+    def _scan_repos_parallel(self, since_date, until_date, export_facts):
+        """线程池拉取仓库、进程池解析和预聚合，按完成顺序产出 (仓库, 全名, 日汇总计划, 部分结果)"""
+        fetch_pool = ThreadPoolExecutor(max_workers=self.git_limiter.max_limit)
+        scan_pool = ProcessPoolExecutor(
+            max_workers=self.scan_workers,
+            initializer=init_scan_worker,
+            initargs=(self.gitea_users, self.user_aliases, self._worker_git_options())
+        )
+        # API 获取的仓库提交量小，在主进程中直接聚合
+        matcher = UserMatcher(self.gitea_users, self.user_aliases)
+        pending = {}
+        
+        def finish(future):
+            stage, repo, full_name, rollup_plan, ranges, repo_path = pending.pop(future)
+            if stage == 'api':
+                commits = future.result()
+                if commits is None:
+                    clone_url = self._repo_names(repo)[1]
+                    pending[fetch_pool.submit(self._fetch_repo, clone_url)] = ('fetch', repo, full_name, rollup_plan, ranges, None)
+                    return []
+                scanned_days = rollup_plan['scanned_days'] if rollup_plan is not None else ()
+                partial = aggregate_commits(commits, matcher, scanned_days, export_facts, self.distinct_precision)
+                partial['commit_count'] = len(commits)
+                partial['engine'] = 'api'
+                self._record_volume(full_name, ranges, partial)
+                print(f"  完成仓库: {full_name}（API，{len(commits)} 个提交）")
+                return [(repo, full_name, rollup_plan, partial)]
+            
+            if stage == 'fetch':
+                try:
+                    repo_path = future.result()
+                except Exception as e:
+                    print(f"  Git 操作失败: {e}，跳过仓库: {full_name}")
+                    return [(repo, full_name, rollup_plan, self._empty_partial(failed=True))]
+                job = {
+                    'repo_path': repo_path,
+                    'ranges': ranges,
+                    'scanned_days': rollup_plan['scanned_days'] if rollup_plan is not None else set(),
+                    'export_facts': export_facts,
+                    'refs': self.get_ref_patterns(repo, full_name),
+                    'distinct_precision': self.distinct_precision
+                }
+                pending[scan_pool.submit(scan_repo, job)] = ('scan', repo, full_name, rollup_plan, ranges, repo_path)
+                return []
+            
+            try:
+                partial = future.result()
+            except Exception as e:
+                print(f"  Git 操作失败: {e}，跳过仓库: {full_name}")
+                partial = self._empty_partial(failed=True)
+            finally:
+                if repo_path and not self.git_ops.is_cached_path(repo_path) and os.path.exists(repo_path):
+                    shutil.rmtree(repo_path)
+            partial['engine'] = 'git'
+            self._record_volume(full_name, ranges, partial)
+            print(f"  完成仓库: {full_name}（{partial.get('commit_count', 0)} 个提交）")
+            return [(repo, full_name, rollup_plan, partial)]
+        
+        def drain(block):
+            if not pending:
+                return []
+            done, _ = wait(list(pending), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+            results = []
+            for future in done:
+                results.extend(finish(future))
+            return results
+        
+        try:
+            for idx, repo in enumerate(self.iter_all_repos(), 1):
+                full_name, clone_url = self._repo_names(repo)
+                print(f"[{idx}] 正在分析仓库: {full_name}")
+                
+                rollup_plan = self._plan_rollup(full_name, since_date, until_date)
+                if rollup_plan is not None and not rollup_plan['scan_ranges']:
+                    print(f"  {len(rollup_plan['covered_days'])} 天均已汇总，跳过 Git 扫描")
+                    yield repo, full_name, rollup_plan, self._empty_partial()
+                    continue
+                
+                ranges = self._scan_ranges(rollup_plan, since_date, until_date)
+                if self.choose_commit_engine(repo, full_name, clone_url, ranges) == 'api':
+                    # API 请求同样在线程池中执行，失败时再提交 Git 拉取
+                    future = fetch_pool.submit(self._fetch_commits_via_api, full_name, ranges,
+                                               self.get_ref_patterns(repo, full_name))
+                    pending[future] = ('api', repo, full_name, rollup_plan, ranges, None)
+                else:
+                    pending[fetch_pool.submit(self._fetch_repo, clone_url)] = ('fetch', repo, full_name, rollup_plan, ranges, None)
+                yield from drain(block=False)
+            
+            while pending:
+                yield from drain(block=True)
+        finally:
+            fetch_pool.shutdown(wait=True)
+            scan_pool.shutdown(wait=True)
+    
+    def _scan_job(self, job, matcher):
+        """执行一个分布式任务：通过 API 或拉取仓库获取提交、解析并预聚合，返回部分结果"""
+        commits = None
+        failed = False
+        engine = 'api'
+        if job.get('engine') == 'api':
+            commits = self._fetch_commits_via_api(job['full_name'], job['ranges'], job.get('refs'))
+        if commits is None:
+            engine = 'git'
+            try:
+                commits = self.git_ops.get_repo_commits_in_ranges(job['clone_url'], job['ranges'], refs=job.get('refs'))
+            except SliceScanError as e:
+                print(f"  {e}，只统计其余时间片的 {len(e.commits)} 个提交，不写入日汇总")
+                commits = e.commits
+                failed = True
+        partial = aggregate_commits(commits or [], matcher, set(job['scanned_days']), job['export_facts'],
+                                    job.get('distinct_precision'))
+        partial['commit_count'] = len(commits or [])
+        partial['failed'] = failed or commits is None
+        partial['engine'] = engine
+        partial['worker'] = socket.gethostname()
+        return partial
+    
+    def _work_one(self, work_queue, matcher):
+        """从队列领取并处理一个任务，没有可领取的任务时返回 False"""
+        job_id, job = work_queue.claim()
+        if job_id is None:
+            return False
+        
+        if job is None:
+            work_queue.complete(job_id, partial_to_json(self._empty_partial(failed=True)))
+            return True
+        
+        print(f"领取仓库任务: {job['full_name']}")
+        with work_queue.keep_alive(job_id):
+            try:
+                partial = self._scan_job(job, matcher)
+            except Exception as e:
+                print(f"  Git 操作失败: {e}，跳过仓库: {job['full_name']}")
+                partial = self._empty_partial(failed=True)
+        
+        if work_queue.complete(job_id, partial_to_json(partial)):
+            print(f"  完成仓库: {job['full_name']}（{partial['commit_count']} 个提交）")
+        else:
+            print(f"  仓库 {job['full_name']} 已由其他节点完成，丢弃本次结果")
+        return True
+    
+    def _scan_repos_distributed(self, since_date, until_date, export_facts):
+        """协调者：把仓库任务推送到 Redis 队列，由各节点的工作进程领取，按完成顺序产出 (仓库, 全名, 日汇总计划, 部分结果)"""
+        if not self.redis_cache or not self.redis_cache.enabled:
+            print("分布式扫描需要可用的 Redis，改为主进程逐个扫描")
+            yield from self._scan_repos_serial(since_date, until_date, export_facts)
+            return
+        
+        work_queue = RedisWorkQueue(self.redis_cache, lease_seconds=self.lease_seconds, namespace=self.window_id)
+        work_queue.start({
+            'gitea_users': self.gitea_users,
+            'user_aliases': self.user_aliases,
+            'mailmap': self.mailmap.render() if self.git_ops.mailmap_file else None
+        })
+        matcher = UserMatcher(self.gitea_users, self.user_aliases)
+        jobs = {}
+        
+        def collect(timeout):
+            job_id, data = work_queue.next_result(timeout)
+            if job_id is None or job_id not in jobs:
+                return []
+            repo, full_name, rollup_plan, ranges = jobs.pop(job_id)
+            partial = partial_from_json(data) if data else self._empty_partial(failed=True)
+            self._record_volume(full_name, ranges, partial)
+            print(f"  收到仓库结果: {full_name}（{partial.get('worker', '?')}，{partial['commit_count']} 个提交）")
+            return [(repo, full_name, rollup_plan, partial)]
+        
+        try:
+            for idx, repo in enumerate(self.iter_all_repos(), 1):
+                full_name, clone_url = self._repo_names(repo)
+                
+                rollup_plan = self._plan_rollup(full_name, since_date, until_date)
+                if rollup_plan is not None and not rollup_plan['scan_ranges']:
+                    print(f"[{idx}] {full_name}: {len(rollup_plan['covered_days'])} 天均已汇总，跳过 Git 扫描")
+                    yield repo, full_name, rollup_plan, self._empty_partial()
+                    continue
+                
+                ranges = self._scan_ranges(rollup_plan, since_date, until_date)
+                job_id = str(idx)
+                jobs[job_id] = (repo, full_name, rollup_plan, ranges)
+                work_queue.push(job_id, {
+                    'full_name': full_name,
+                    'clone_url': clone_url,
+                    'engine': self.choose_commit_engine(repo, full_name, clone_url, ranges),
+                    'ranges': ranges,
+                    'scanned_days': sorted(rollup_plan['scanned_days']) if rollup_plan is not None else [],
+                    'export_facts': export_facts,
+                    'refs': self.get_ref_patterns(repo, full_name),
+                    'distinct_precision': self.distinct_precision
+                })
+                print(f"[{idx}] 已推送仓库任务: {full_name}")
+                yield from collect(timeout=0)
+            
+            work_queue.finish_discovery()
+            print(f"仓库任务推送完毕，等待 {len(jobs)} 个仓库完成")
+            
+            last_progress = time.monotonic()
+            while jobs:
+                results = collect(timeout=0)
+                if not results:
+                    work_queue.requeue_expired()
+                    # 协调者空闲时也领取任务，没有工作节点时同样能完成
+                    if not (self.coordinator_scan and self._work_one(work_queue, matcher)):
+                        results = collect(timeout=5)
+                yield from results
+                
+                if time.monotonic() - last_progress > 60:
+                    done, total, leased, pending = work_queue.progress()
+                    print(f"  进度: {done}/{total} 完成，{leased} 个处理中，{pending} 个待领取")
+                    last_progress = time.monotonic()
+        finally:
+            work_queue.close()
+    
+    def prefetch(self, since_date=None, until_date=None):
+        """预取一轮：按最近推送时间从新到旧更新窗口内有推送的仓库克隆并生成提交快照，返回预取的仓库数
+        
+        只处理会用 Git 获取提交的仓库；上次预取后没有新推送的仓库跳过。统计运行时有快照的仓库只扫描快照之后的新提交
+        """
+        if not self.clone_dir:
+            print("错误: 预取需要配置 CLONE_DIR")
+            return 0
+        
+        self.gitea_users = self.get_gitea_users()
+        self.prepare_mailmap()
+        since_dt = self.parse_datetime(since_date) if since_date else None
+        
+        candidates = []
+        for repo in self.iter_all_repos():
+            full_name, clone_url = self._repo_names(repo)
+            pushed_dt = self.parse_datetime(repo['updated_at']) if repo.get('updated_at') else None
+            if since_dt and pushed_dt and pushed_dt < since_dt:
+                continue
+            if self.choose_commit_engine(repo, full_name, clone_url, [(since_date, until_date)]) != 'git':
+                continue
+            candidates.append((pushed_dt.timestamp() if pushed_dt else 0, repo, full_name, clone_url))
+        
+        candidates.sort(key=lambda item: item[0], reverse=True)
+        if self.prefetch_max_repos:
+            candidates = candidates[:self.prefetch_max_repos]
+        print(f"预取 {len(candidates)} 个窗口内有推送的仓库（按最近推送时间排序）")
+        
+        fetched = unchanged = failed = 0
+        with ThreadPoolExecutor(max_workers=self.prefetch_workers) as pool:
+            futures = {}
+            for pushed_at, repo, full_name, clone_url in candidates:
+                refs = self.get_ref_patterns(repo, full_name)
+                future = pool.submit(self.git_ops.prefetch_repo, clone_url, since_date, refs, pushed_at or None)
+                futures[future] = full_name
+            
+            for future in as_completed(futures):
+                full_name = futures[future]
+                try:
+                    commit_count = future.result()
+                except Exception as e:
+                    print(f"  预取失败: {full_name}: {e}")
+                    failed += 1
+                    continue
+                if commit_count is None:
+                    unchanged += 1
+                else:
+                    fetched += 1
+                    print(f"  预取完成: {full_name}（窗口内 {commit_count} 个提交）")
+        
+        print(f"本轮预取完成: 更新 {fetched} 个仓库，{unchanged} 个无新推送，{failed} 个失败")
+        return fetched
+    
+    def run_worker(self):
+        """工作节点：循环领取协调者发布的仓库任务并写回部分结果，空闲超过 WORKER_IDLE_EXIT 秒后退出"""
+        if not self.redis_cache or not self.redis_cache.enabled:
+            print("错误: 工作节点需要可用的 Redis")
+            return 0
+        
+        work_queue = None
+        matcher = None
+        processed = 0
+        idle_since = time.monotonic()
+        
+        while True:
+            if work_queue is None:
+                work_queue = RedisWorkQueue.current(self.redis_cache, self.lease_seconds)
+                if work_queue is not None:
+                    # 用户表和别名以协调者发布的为准，保证各节点匹配结果一致
+                    context = work_queue.context()
+                    self.gitea_users = context.get('gitea_users', {})
+                    self.user_aliases = context.get('user_aliases', self.user_aliases)
+                    self.adopt_mailmap(context.get('mailmap'), work_queue.run_id)
+                    matcher = UserMatcher(self.gitea_users, self.user_aliases)
+                    print(f"加入分布式运行: {work_queue.run_id}（{len(self.gitea_users)} 个用户）")
+            
+            if work_queue is not None:
+                work_queue.requeue_expired()
+                if self._work_one(work_queue, matcher):
+                    processed += 1
+                    idle_since = time.monotonic()
+                    continue
+                
+                if work_queue.is_finished() or not work_queue.is_current():
+                    print(f"分布式运行 {work_queue.run_id} 已结束")
+                    work_queue = None
+                else:
+                    # 运行仍在进行（任务由其他节点处理中），继续等待可能过期的租约
+                    idle_since = time.monotonic()
+            
+            if time.monotonic() - idle_since > self.worker_idle_exit:
+                print(f"空闲超过 {self.worker_idle_exit} 秒，工作节点退出，本次共处理 {processed} 个仓库")
+                return processed
+            time.sleep(2)
+    
+    def collect_all_stats(self, since_date=None, until_date=None, commit_exporter=None):
+        """收集所有仓库和用户的统计数据，传入 commit_exporter 时同时逐条导出提交明细"""
         print("开始收集统计数据...")
         
         self.gitea_users = self.get_gitea_users()
+        self.prepare_mailmap()
+        self.rollup_store.attribution = self.attribution_version()
+        self.exporting_commits = commit_exporter is not None
+        if self.exporting_commits and self.rollup_store.enabled:
+            print("导出提交明细：本次不读取日汇总，整个时间窗口重新扫描（完整的天仍写入日汇总）")
         
         time_range_str = ""
         if since_date and until_date:
@@ -130,37 +1084,65 @@ class StatsCollector:
             time_range_str = f"至 {until_date}"
         
         print(f"统计时间范围: {time_range_str}" if time_range_str else "统计所有时间")
+        self.discovery_failures = []
         
-        repos = self.get_all_repos()
+        if self.distinct_mode == 'hll':
+            self.distinct_prefix = f"gitea:hll:{socket.gethostname()}:{os.getpid()}:{int(time.time())}"
+            backend = '，用户仓库数使用 Redis' if self.redis_cache and self.redis_cache.enabled else ''
+            print(f"用户仓库数、活跃天数和仓库贡献者数使用 HyperLogLog 近似计数（精度 {self.hll_precision}{backend}）")
         
         user_stats = defaultdict(lambda: {
             'commits': 0,
-            'repos': set(),
+            'repos': self._new_distinct(),
             'additions': 0,
             'deletions': 0,
             'total_lines': 0,
             'first_commit': None,
-            'last_commit': None
+            'last_commit': None,
+            'active_days': self._new_sketch()
         })
+        # 每个用户单次提交代码行数的分位数草图（固定内存，可跨仓库合并），供排名引擎和报告计算分布，不写入 JSON
+        self.size_sketches = defaultdict(KLLSketch)
+        # 每个用户 {(语言, 仓库/第一级目录): 代码行数}，取自 git numstat 的路径列（API 获取的提交没有路径）
+        self.path_stats = defaultdict(dict)
+        self.engine_counts = defaultdict(int)
         
         repo_stats = []
         skipped_unknown_count = 0
         skipped_outside_count = 0
         skipped_repos_count = 0
+        identities = {}
+        # 本次扫描并写入日汇总的天，提交日志写入后标记为已记录
+        logged_days = []
+        
+        export_facts = commit_exporter is not None or self.commit_log.enabled
+        if self.scan_mode == 'process':
+            print(f"使用进程池扫描仓库: {self.scan_workers} 个工作进程")
+            scanned = self._scan_repos_parallel(since_date, until_date, export_facts)
+        elif self.scan_mode == 'distributed':
+            print("使用分布式扫描：仓库任务通过 Redis 队列分发给各节点的 gitea_worker.py")
+            scanned = self._scan_repos_distributed(since_date, until_date, export_facts)
+        else:
+            scanned = self._scan_repos_serial(since_date, until_date, export_facts)
         
-        for idx, repo in enumerate(repos, 1):
-            owner = repo.get('owner', {}).get('login', 'unknown')
-            repo_name = repo.get('name', 'unknown')
-            full_name = f"{owner}/{repo_name}"
-            clone_url = repo.get('clone_url', f"{self.base_url}/{owner}/{repo_name}.git")
+        for repo, full_name, rollup_plan, partial in scanned:
+            if partial.get('engine'):
+                self.engine_counts[partial['engine']] += 1
             
-            print(f"[{idx}/{len(repos)}] 正在分析仓库: {full_name}")
+            if partial['failed'] and rollup_plan is not None:
+                # 扫描失败时不能把这些天标记为已汇总
+                rollup_plan['scanned_days'] = set()
             
-            commits = self.get_repo_commits(clone_url, since_date, until_date)
+            skipped_unknown_count += partial['skipped_unknown']
+            skipped_outside_count += partial['skipped_outside']
+            identities.update(partial.get('identities', {}))
             
-            if not commits:
+            if not partial.get('commit_count') and not (rollup_plan and rollup_plan['covered_days']):
                 print(f"  跳过仓库: {full_name} (在指定时间内无提交)")
                 skipped_repos_count += 1
+                if rollup_plan is not None:
+                    self.rollup_store.save(full_name, rollup_plan['scanned_days'], {})
+                    logged_days.append((full_name, rollup_plan['scanned_days']))
                 continue
             
             repo_stat = {
@@ -170,85 +1152,29 @@ class StatsCollector:
                 'additions': 0,
                 'deletions': 0,
                 'total_lines': 0,
-                'contributors': set()
+                'contributors': self._new_sketch(),
+                'contributor_stats': {},
+                'sketch': KLLSketch()
             }
             
-            for commit in commits:
-                author = commit.get('author', {})
-                username = author.get('login') or author.get('name') or 'unknown'
-                
-                if username == 'unknown':
-                    skipped_unknown_count += 1
-                    continue
-                
-                author_email = author.get('email', '').lower()
-                matched_user = None
-                
-                if username in self.user_aliases:
-                    username = self.user_aliases[username]
-                
-                if username in self.gitea_users:
-                    matched_user = username
-                elif author_email in [user_data.get('email', '').lower() for user_data in self.gitea_users.values()]:
-                    for login, user_data in self.gitea_users.items():
-                        if user_data.get('email', '').lower() == author_email:
-                            matched_user = login
-                            break
-                else:
-                    for login, user_data in self.gitea_users.items():
-                        login_lower = login.lower()
-                        username_lower = username.lower().replace(' ', '')
-                        if login_lower == username_lower or login_lower in username_lower or username_lower in login_lower:
-                            matched_user = login
-                            break
-                
-                if not matched_user:
-                    skipped_outside_count += 1
-                    continue
-                
-                stats = commit.get('stats', {})
-                additions = stats.get('additions', 0) or 0
-                deletions = stats.get('deletions', 0) or 0
-                total = stats.get('total', 0) or additions + deletions
-                
-                commit_info = commit.get('commit', {})
-                committer_info = commit_info.get('committer', {})
-                commit_date_str = committer_info.get('date')
-                
-                if commit_date_str:
-                    commit_dt = self.parse_datetime(commit_date_str)
-                    
-                    if commit_dt:
-                        commit_date_iso = commit_dt.isoformat()
-                        
-                        user_stats[matched_user]['commits'] += 1
-                        user_stats[matched_user]['repos'].add(full_name)
-                        user_stats[matched_user]['additions'] += additions
-                        user_stats[matched_user]['deletions'] += deletions
-                        user_stats[matched_user]['total_lines'] += total
-                        repo_stat['contributors'].add(matched_user)
-                        repo_stat['commits'] += 1
-                        repo_stat['additions'] += additions
-                        repo_stat['deletions'] += deletions
-                        repo_stat['total_lines'] += total
-                        
-                        if user_stats[matched_user]['first_commit'] is None:
-                            user_stats[matched_user]['first_commit'] = commit_date_iso
-                        else:
-                            first_dt = self.parse_datetime(user_stats[matched_user]['first_commit'])
-                            if first_dt and commit_dt < first_dt:
-                                user_stats[matched_user]['first_commit'] = commit_date_iso
-                        
-                        if user_stats[matched_user]['last_commit'] is None:
-                            user_stats[matched_user]['last_commit'] = commit_date_iso
-                        else:
-                            last_dt = self.parse_datetime(user_stats[matched_user]['last_commit'])
-                            if last_dt and commit_dt > last_dt:
-                                user_stats[matched_user]['last_commit'] = commit_date_iso
+            self._merge_partial(user_stats, repo_stat, full_name, partial, commit_exporter)
+            
+            if rollup_plan is not None:
+                self.rollup_store.save(full_name, rollup_plan['scanned_days'], partial['rollups'])
+                logged_days.append((full_name, rollup_plan['scanned_days']))
+                for username, data in self.rollup_store.load(full_name, rollup_plan['covered_days']).items():
+                    self._accumulate(user_stats, repo_stat, username, full_name, data['commits'],
+                                     data['additions'], data['deletions'], data['additions'] + data['deletions'],
+                                     data['first_commit'], data['last_commit'], data['days'])
+                    self.size_sketches[username].merge(data['sketch'])
+                    repo_stat['sketch'].merge(data['sketch'])
+                    self._merge_paths(username, full_name, data['paths'])
             
+            repo_stat.update(self.size_quantiles(repo_stat.pop('sketch')))
             if repo_stat['commits'] > 0:
-                repo_stat['contributors'] = list(repo_stat['contributors'])
                 repo_stat['contributors_count'] = len(repo_stat['contributors'])
+                # 近似计数只给出贡献者数，贡献者名单取自按用户保存的贡献者明细
+                repo_stat['contributors'] = list(repo_stat['contributor_stats'])
                 repo_stats.append(repo_stat)
                 if full_name == 'pca/pc_attendance_back':
                     print(f"  调试: 添加仓库到列表 - {full_name}, 提交数: {repo_stat['commits']}, 代码行数: {repo_stat['total_lines']}")
@@ -261,9 +1187,36 @@ class StatsCollector:
         print(f"  - unknown 用户: {skipped_unknown_count} 个提交")
         print(f"  - 外部用户（非 Gitea 账户）: {skipped_outside_count} 个提交")
         
+        # 后台刷新的用户/仓库列表写入缓存后供下次运行使用
+        self.wait_metadata_refreshes()
+        
+        run_metrics = self.get_run_metrics()
+        for kind, metrics in run_metrics['throttle'].items():
+            print(f"  - {kind} 并发上限: {metrics['limit']}/{metrics['max_limit']}，限流 {metrics['throttled']} 次，重试 {metrics['retries']} 次")
+        if self.engine_counts:
+            print(f"  - 提交获取方式: API {self.engine_counts.get('api', 0)} 个仓库，Git {self.engine_counts.get('git', 0)} 个仓库")
+        if self.discovery_failures:
+            print(f"  - 警告: {len(self.discovery_failures)} 个仓库列表获取失败，本次统计不完整")
+        self.save_mailmap(identities)
+        if self.commit_log.enabled:
+            self.commit_log.flush()
+            # 写入日志之后才标记，写入失败时这些天下次重新扫描
+            for full_name, day_keys in logged_days:
+                self.rollup_store.mark_logged(full_name, day_keys)
+        
         for username in user_stats:
-            user_stats[username]['repos'] = list(user_stats[username]['repos'])
             user_stats[username]['repos_count'] = len(user_stats[username]['repos'])
+            user_stats[username]['active_days'] = len(user_stats[username]['active_days'])
+            if self.distinct_mode == 'hll':
+                # 近似计数不保留仓库名单，JSON 中只有 repos_count
+                del user_stats[username]['repos']
+            else:
+                user_stats[username]['repos'] = list(user_stats[username]['repos'])
+            user_stats[username].update(self.size_quantiles(self.size_sketches.get(username)))
+            user_stats[username].update(self.path_breakdown(self.path_stats.get(username)))
+        
+        if self.distinct_mode == 'hll' and self.redis_cache and self.redis_cache.enabled:
+            self.redis_cache.delete_pattern(f"{self.distinct_prefix}:*")
         
         return {
             'user_stats': dict(user_stats),
@@ -272,5 +1225,7 @@ class StatsCollector:
             'total_commits': sum(r['commits'] for r in repo_stats),
             'total_additions': sum(r['additions'] for r in repo_stats),
             'total_deletions': sum(r['deletions'] for r in repo_stats),
-            'total_lines': sum(r['total_lines'] for r in repo_stats)
+            'total_lines': sum(r['total_lines'] for r in repo_stats),
+            'incomplete': bool(self.discovery_failures),
+            'run_metrics': run_metrics
         }
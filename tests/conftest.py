@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试公共配置：模块都在仓库根目录，按脚本方式导入
+"""
+
+import os
+import sys
+import subprocess
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class GitRepo:
+    """测试用的本地 Git 仓库，提交时可以分别指定作者时间和提交时间"""
+    
+    def __init__(self, path):
+        self.path = str(path)
+        os.makedirs(self.path, exist_ok=True)
+        self.run('init', '-q')
+    
+    def run(self, *args, env=None):
+        return subprocess.run(['git', '-C', self.path] + list(args), check=True, capture_output=True, text=True,
+                              env=dict(os.environ, **(env or {}))).stdout
+    
+    def commit(self, filename, lines, author, email, authored, committed=None):
+        """追加 lines 行到 filename 并提交，返回提交 SHA"""
+        file_path = os.path.join(self.path, filename)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'a', encoding='utf-8') as f:
+            f.write(''.join(f"{author} {authored} {i}\n" for i in range(lines)))
+        self.run('add', filename)
+        self.run('commit', '-q', '-m', f"{author} {authored}", env={
+            'GIT_AUTHOR_NAME': author,
+            'GIT_AUTHOR_EMAIL': email,
+            'GIT_AUTHOR_DATE': authored,
+            'GIT_COMMITTER_NAME': author,
+            'GIT_COMMITTER_EMAIL': email,
+            'GIT_COMMITTER_DATE': committed or authored
+        })
+        return self.run('rev-parse', 'HEAD').strip()
+
+
+@pytest.fixture
+def git_repo(tmp_path):
+    return GitRepo(tmp_path / 'repo')
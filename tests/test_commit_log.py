@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+提交日志测试：追加、去重、分段、按提交时间的窗口查询和旧格式转换
+"""
+
+import json
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from commit_log import CommitLog, LEGACY_RECORD_FIELDS, LEGACY_RECORDS_FILE, RECORDS_FILE
+
+
+SHA_A = 'a' * 40
+SHA_B = 'b' * 40
+SHA_C = 'c' * 40
+
+
+def make_log(tmp_path):
+    log = CommitLog(str(tmp_path / 'log'))
+    assert log.enabled
+    return log
+
+
+def test_append_and_build_stats(tmp_path):
+    log = make_log(tmp_path)
+    log.append(SHA_A, 'o/r1', 'alice', '2025-10-02T10:00:00+00:00', '2025-10-02T10:00:00+00:00', 3, 1)
+    log.append(SHA_B, 'o/r1', 'bob', '2025-10-03T10:00:00+00:00', '2025-10-03T10:00:00+00:00', 5, 0)
+    log.append(SHA_C, 'o/r2', 'alice', '2025-10-04T10:00:00+08:00', '2025-10-04T10:00:00+08:00', 2, 2)
+    assert log.flush() == 3
+    
+    stats = log.build_stats('2025-10-01T00:00:00+00:00', '2025-10-05T00:00:00+00:00')
+    assert stats['total_commits'] == 3
+    assert stats['total_lines'] == 13
+    alice = stats['user_stats']['alice']
+    assert (alice['commits'], alice['additions'], alice['deletions'], alice['active_days']) == (2, 5, 3, 2)
+    assert sorted(alice['repos']) == ['o/r1', 'o/r2']
+    assert {repo['name']: repo['commits'] for repo in stats['repo_stats']} == {'o/r1': 2, 'o/r2': 1}
+
+
+def test_rerun_does_not_duplicate(tmp_path):
+    log = make_log(tmp_path)
+    log.append(SHA_A, 'o/r1', 'alice', '2025-10-02T10:00:00+00:00', '2025-10-02T10:00:00+00:00', 3, 1)
+    log.append(SHA_A, 'o/r1', 'alice', '2025-10-02T10:00:00+00:00', '2025-10-02T10:00:00+00:00', 3, 1)
+    assert log.flush() == 1
+    
+    log.append(SHA_A, 'o/r1', 'alice', '2025-10-02T10:00:00+00:00', '2025-10-02T10:00:00+00:00', 3, 1)
+    assert log.flush() == 0
+    assert make_log(tmp_path).build_stats()['total_commits'] == 1
+
+
+def test_same_commit_in_two_repos_counts_twice(tmp_path):
+    log = make_log(tmp_path)
+    log.append(SHA_A, 'o/r1', 'alice', '2025-10-02T10:00:00+00:00', '2025-10-02T10:00:00+00:00', 3, 1)
+    log.append(SHA_A, 'fork/r1', 'alice', '2025-10-02T10:00:00+00:00', '2025-10-02T10:00:00+00:00', 3, 1)
+    assert log.flush() == 2
+    
+    log.append(SHA_A, 'fork/r1', 'alice', '2025-10-02T10:00:00+00:00', '2025-10-02T10:00:00+00:00', 3, 1)
+    assert log.flush() == 0
+    stats = log.build_stats()
+    assert stats['total_commits'] == 2
+    assert stats['user_stats']['alice']['repos_count'] == 2
+
+
+def test_out_of_order_runs_add_segments(tmp_path):
+    log = make_log(tmp_path)
+    log.append(SHA_B, 'o/r1', 'bob', '2025-10-05T10:00:00+00:00', '2025-10-05T10:00:00+00:00', 1, 0)
+    log.flush()
+    log.append(SHA_C, 'o/r1', 'bob', '2025-10-06T10:00:00+00:00', '2025-10-06T10:00:00+00:00', 1, 0)
+    log.flush()
+    assert log.segments == [[0, 2]]
+    
+    # 补跑更早的窗口：时间早于上一段的结尾，另起一段
+    log.append(SHA_A, 'o/r1', 'alice', '2025-10-01T10:00:00+00:00', '2025-10-01T10:00:00+00:00', 4, 0)
+    log.flush()
+    assert log.segments == [[0, 2], [2, 3]]
+    assert log.earliest() == 1759312800
+    
+    stats = log.build_stats('2025-10-01T00:00:00+00:00', '2025-10-05T23:59:59+00:00')
+    assert stats['total_commits'] == 2
+    assert set(stats['user_stats']) == {'alice', 'bob'}
+    assert log.build_stats('2025-10-06T00:00:00+00:00')['total_commits'] == 1
+
+
+def test_truncates_uncommitted_tail(tmp_path):
+    log = make_log(tmp_path)
+    log.append(SHA_A, 'o/r1', 'alice', '2025-10-02T10:00:00+00:00', '2025-10-02T10:00:00+00:00', 3, 1)
+    log.flush()
+    # 模拟崩溃：记录写了一半，没有进入分段索引
+    with open(tmp_path / 'log' / RECORDS_FILE, 'ab') as f:
+        f.write(b'\x01' * 20)
+    
+    log.append(SHA_B, 'o/r1', 'bob', '2025-10-03T10:00:00+00:00', '2025-10-03T10:00:00+00:00', 5, 0)
+    assert log.flush() == 1
+    assert log.build_stats()['total_commits'] == 2
+
+
+def test_window_uses_committer_time(tmp_path):
+    log = make_log(tmp_path)
+    # rebase 后的提交：作者时间在窗口之前，提交时间在窗口内，与日汇总一样按提交时间计入窗口
+    log.append(SHA_A, 'o/r1', 'alice', '2025-09-20T10:00:00+00:00', '2025-10-02T10:00:00+00:00', 3, 1)
+    log.append(SHA_B, 'o/r1', 'bob', '2025-10-02T10:00:00+00:00', '2025-10-06T10:00:00+00:00', 5, 0)
+    assert log.flush() == 2
+    
+    stats = log.build_stats('2025-10-01T00:00:00+00:00', '2025-10-05T23:59:59+00:00')
+    assert set(stats['user_stats']) == {'alice'}
+    # 首次/最近提交仍是作者时间，与实时报告相同
+    assert stats['user_stats']['alice']['first_commit'] == '2025-09-20T10:00:00+00:00'
+    assert log.earliest() == 1759399200
+    
+    # 重复运行按提交时间查找已写入的记录
+    log.append(SHA_A, 'o/r1', 'alice', '2025-09-20T10:00:00+00:00', '2025-10-02T10:00:00+00:00', 3, 1)
+    assert log.flush() == 0
+
+
+def test_legacy_records_are_converted(tmp_path):
+    path = tmp_path / 'log'
+    path.mkdir()
+    legacy = np.zeros(2, dtype=np.dtype(LEGACY_RECORD_FIELDS))
+    legacy['timestamp'] = [1759399200, 1759485600]
+    legacy['sha'] = [int(SHA_A[:16], 16), int(SHA_B[:16], 16)]
+    legacy['user'] = [0, 0]
+    legacy['additions'] = [3, 5]
+    # 最后一条没有进入分段索引，转换时丢弃
+    (path / LEGACY_RECORDS_FILE).write_bytes(legacy.tobytes())
+    (path / 'users.txt').write_text('alice\n', encoding='utf-8')
+    (path / 'repos.txt').write_text('o/r1\n', encoding='utf-8')
+    (path / 'segments.json').write_text(json.dumps([[0, 1]]), encoding='utf-8')
+    
+    log = make_log(tmp_path)
+    assert not (path / LEGACY_RECORDS_FILE).exists()
+    stats = log.build_stats()
+    assert stats['total_commits'] == 1
+    assert stats['user_stats']['alice']['first_commit'] == '2025-10-02T10:00:00+00:00'
+    
+    log.append(SHA_A, 'o/r1', 'alice', '2025-10-02T10:00:00+00:00', '2025-10-02T10:00:00+00:00', 3, 0)
+    log.append(SHA_B, 'o/r1', 'alice', '2025-10-03T10:00:00+00:00', '2025-10-03T10:00:00+00:00', 5, 0)
+    assert log.flush() == 1
+    assert log.segments == [[0, 2]]
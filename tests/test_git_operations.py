@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Git 操作测试：numstat 解析、网络命令的超时重试和预取快照的增量扫描
+"""
+
+import json
+import os
+import subprocess
+
+import pytest
+
+from git_operations import GitOperations, SNAPSHOT_FORMAT
+from conftest import GitRepo
+from throttle import RetryPolicy
+
+
+class FakeRun:
+    """记录每次调用的超时时间，前 failures 次抛出超时"""
+    
+    def __init__(self, failures):
+        self.failures = failures
+        self.timeouts = []
+    
+    def __call__(self, cmd, timeout=None, **kwargs):
+        self.timeouts.append(timeout)
+        if len(self.timeouts) <= self.failures:
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        return subprocess.CompletedProcess(cmd, 0, '', '')
+
+
+@pytest.fixture
+def git_ops():
+    return GitOperations(retry_policy=RetryPolicy(max_retries=3, base_delay=0))
+
+
+def test_clone_timeout_is_not_retried(git_ops, monkeypatch, tmp_path):
+    fake = FakeRun(failures=10)
+    monkeypatch.setattr(subprocess, 'run', fake)
+    with pytest.raises(subprocess.TimeoutExpired):
+        git_ops._run_network_git(['git', 'clone', 'url', str(tmp_path / 'r')], 300,
+                                 cleanup_dir=str(tmp_path / 'r'), retry_timeout=False)
+    assert fake.timeouts == [300]
+
+
+def test_fetch_timeout_retries_with_longer_timeout(git_ops, monkeypatch):
+    fake = FakeRun(failures=2)
+    monkeypatch.setattr(subprocess, 'run', fake)
+    git_ops._run_network_git(['git', 'fetch', '--all'], 300)
+    assert fake.timeouts == [300, 600, 1200]
+
+
+def test_parse_log_lines_reads_author_and_commit_dates():
+    lines = [
+        'AUTHOR:' + 'a' * 40 + ' alice<a@x.com> 2025-09-28T10:00:00+00:00 2025-10-05T10:00:00+00:00',
+        '',
+        '3\t1\tsrc/app/main.py',
+        '-\t-\tlogo.png',
+        'AUTHOR:' + 'b' * 40 + ' bob<b@x.com> 2025-10-06T10:00:00+00:00',
+        '2\t0\tREADME.md'
+    ]
+    first, second = GitOperations.parse_log_lines(lines)
+    assert first['commit']['committer']['date'] == '2025-09-28T10:00:00+00:00'
+    assert first['committed'] == '2025-10-05T10:00:00+00:00'
+    assert (first['stats']['additions'], first['stats']['deletions']) == (3, 1)
+    assert first['stats']['paths'] == [['Python', 'src', 4]]
+    # 旧格式（只有作者时间）的提交时间按作者时间
+    assert second['committed'] == '2025-10-06T10:00:00+00:00'
+
+
+def write_snapshot(git_ops, repo_path, since):
+    """按预取的方式把仓库当前的提交写入快照"""
+    tips = git_ops._current_tips(repo_path, None)
+    snapshot = {
+        'format': SNAPSHOT_FORMAT,
+        'since': since,
+        'refs': None,
+        'mailmap': None,
+        'fetched_at': 0,
+        'tips': tips,
+        'times': git_ops._commit_times(repo_path, since, tips),
+        'commits': git_ops.get_commits_with_stats(repo_path, since)
+    }
+    path = git_ops.snapshot_path(repo_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f)
+
+
+def test_snapshot_drops_commits_of_deleted_branches(tmp_path, monkeypatch, capsys):
+    git_ops = GitOperations(clone_dir=str(tmp_path / 'clones'))
+    repo = GitRepo(tmp_path / 'clones' / 'o' / 'r')
+    since = '2025-10-01T00:00:00+00:00'
+    kept = repo.commit('a.txt', 1, 'alice', 'a@x.com', '2025-10-02T10:00:00+00:00')
+    repo.run('checkout', '-q', '-b', 'feature')
+    dropped = repo.commit('b.txt', 2, 'bob', 'b@x.com', '2025-10-03T10:00:00+00:00')
+    repo.run('checkout', '-q', '-')
+    write_snapshot(git_ops, repo.path, since)
+    
+    # 快照之后功能分支被删除，主分支有新提交
+    repo.run('branch', '-q', '-D', 'feature')
+    added = repo.commit('a.txt', 1, 'alice', 'a@x.com', '2025-10-04T10:00:00+00:00')
+    
+    reads = []
+    read_snapshot = git_ops._read_snapshot
+    monkeypatch.setattr(git_ops, '_read_snapshot', lambda path: reads.append(path) or read_snapshot(path))
+    first = git_ops.get_commits_sliced(repo.path, since, '2025-10-03T12:00:00+00:00')
+    second = git_ops.get_commits_sliced(repo.path, '2025-10-03T12:00:00+00:00', None)
+    assert [commit['sha'] for commit in first] == [kept]
+    assert [commit['sha'] for commit in second] == [added]
+    assert dropped not in {commit['sha'] for commit in first + second}
+    output = capsys.readouterr().out
+    assert '快照中 1 个提交不再可达' in output
+    assert '改为完整扫描' not in output
+    # 同一个仓库的多个时间段只读取一次快照，扫描结束后失效
+    assert len(reads) == 1
+    git_ops.forget_ref_tips(repo.path)
+    git_ops.get_commits_sliced(repo.path, since, None)
+    assert len(reads) == 2
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HyperLogLog 测试：精度、合并和 JSON 往返
+"""
+
+import json
+
+import pytest
+
+from hyperloglog import HyperLogLog, RedisHyperLogLog, merge_distinct, distinct_to_json, distinct_from_json
+
+
+def test_sparse_count_is_exact():
+    counter = HyperLogLog()
+    counter.update(f"user{i}" for i in range(200))
+    counter.update(f"user{i}" for i in range(100))
+    assert counter.registers is None
+    assert counter.count() == 200
+
+
+@pytest.mark.parametrize('cardinality', [1000, 50000])
+def test_dense_estimate_within_error(cardinality):
+    counter = HyperLogLog(precision=12)
+    counter.update(range(cardinality))
+    assert counter.registers is not None
+    # 精度 12 的标准误差约 1.6%，允许 4 倍标准误差
+    assert abs(counter.count() - cardinality) <= cardinality * 0.065
+
+
+def test_merge_matches_union():
+    left, right, union = HyperLogLog(12), HyperLogLog(12), HyperLogLog(12)
+    left.update(range(0, 30000))
+    right.update(range(20000, 50000))
+    union.update(range(0, 50000))
+    assert left.merge(right).count() == union.count()
+
+
+def test_merge_sparse_into_dense_and_back():
+    sparse, dense = HyperLogLog(12), HyperLogLog(12)
+    sparse.update(range(10))
+    dense.update(range(5, 5000))
+    expected = HyperLogLog(12)
+    expected.update(range(0, 5000))
+    assert HyperLogLog(12).merge(sparse).merge(dense).count() == expected.count()
+    assert dense.merge(sparse).count() == expected.count()
+
+
+def test_merge_rejects_different_precision():
+    with pytest.raises(ValueError):
+        HyperLogLog(12).merge(HyperLogLog(14))
+
+
+@pytest.mark.parametrize('size', [50, 5000])
+def test_json_round_trip(size):
+    counter = HyperLogLog(12)
+    counter.update(range(size))
+    restored = HyperLogLog.from_dict(counter.to_dict())
+    assert restored.count() == counter.count()
+    restored.add(size + 1)
+    assert restored.count() >= counter.count()
+
+
+def test_legacy_hashes_format_still_loads():
+    counter = HyperLogLog(12)
+    counter.update(range(50))
+    legacy = {'precision': 12, 'hashes': sorted(counter.hashes)}
+    assert HyperLogLog.from_dict(legacy).count() == 50
+    assert 'sparse' in counter.to_dict()
+
+
+def test_merge_distinct_promotes_sets_to_sketch():
+    days = {'2025-10-01', '2025-10-02'}
+    assert merge_distinct(days, {'2025-10-03'}) == {'2025-10-01', '2025-10-02', '2025-10-03'}
+    
+    sketch = HyperLogLog(12)
+    sketch.update(['2025-10-02', '2025-10-04'])
+    merged = merge_distinct({'2025-10-01', '2025-10-02'}, sketch)
+    assert isinstance(merged, HyperLogLog)
+    assert merged.count() == 3
+    assert merge_distinct(merged, {'2025-10-05'}).count() == 4
+
+
+@pytest.mark.parametrize('values', [{'2025-10-01', '2025-10-02'}, HyperLogLog(12)])
+def test_distinct_json_round_trip(values):
+    if isinstance(values, HyperLogLog):
+        values.update(range(3000))
+    restored = distinct_from_json(json.loads(json.dumps(distinct_to_json(values))))
+    assert type(restored) is type(values)
+    assert len(restored) == len(values)
+
+
+def test_partial_json_round_trip_keeps_day_sketches():
+    from repo_scanner import UserMatcher, aggregate_commits, partial_to_json, partial_from_json
+    commits = [
+        {'sha': str(i), 'author': {'login': 'alice', 'email': 'a@x.com'},
+         'commit': {'committer': {'date': f"2025-10-{i:02d}T10:00:00+00:00"}},
+         'stats': {'additions': 1, 'deletions': 0, 'total': 1}}
+        for i in range(1, 11)
+    ]
+    matcher = UserMatcher({'alice': {'email': 'a@x.com'}}, {})
+    partial = aggregate_commits(commits, matcher, {'2025-10-01'}, distinct_precision=12)
+    restored = partial_from_json(json.loads(json.dumps(partial_to_json(partial))))
+    assert isinstance(restored['users']['alice']['days'], HyperLogLog)
+    assert restored['users']['alice']['days'].count() == 10
+    assert restored['rollups'][('2025-10-01', 'alice')]['days'].count() == 1
+
+
+class FakeRedis:
+    """只实现 PFADD / PFMERGE / PFCOUNT，用纯 Python 计数器模拟"""
+    
+    def __init__(self):
+        self.keys = {}
+    
+    def pfadd(self, key, values, expire_seconds):
+        self.keys.setdefault(key, HyperLogLog()).update(values)
+    
+    def pfmerge(self, dest, keys, expire_seconds):
+        merged = HyperLogLog()
+        for key in keys:
+            merged.merge(self.keys.get(key, HyperLogLog()))
+        self.keys[dest] = merged
+    
+    def pfcount(self, keys):
+        merged = HyperLogLog()
+        for key in keys:
+            merged.merge(self.keys.get(key, HyperLogLog()))
+        return merged.count()
+
+
+def test_redis_counter_buffers_and_merges():
+    cache = FakeRedis()
+    left, right = RedisHyperLogLog(cache, 'a'), RedisHyperLogLog(cache, 'b')
+    left.update(range(1500))
+    assert 'a' in cache.keys and len(left.pending) == 500
+    right.update(range(1000, 2000))
+    # 精度 14 的标准误差约 0.8%
+    assert abs(left.merge(right).count() - 2000) <= 2000 * 0.035
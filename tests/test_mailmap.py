@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Mailmap 测试：生成、写入、重新读取的往返，已学习身份的重新验证，与 git 的映射结果一致，
+以及别名/登录名与邮箱冲突时与 UserMatcher 的优先级一致
+"""
+
+import subprocess
+
+from git_operations import GitOperations
+from mailmap import Mailmap
+from repo_scanner import UserMatcher, aggregate_commits
+
+
+USERS = {
+    'alice': {'email': 'Alice@X.com'},
+    'bob': {'email': 'bob@x.com'},
+    'carol': {'email': ''},
+}
+ALIASES = {'Robert': 'bob', 'cc': 'carol'}
+
+
+def build(path, users=USERS, aliases=ALIASES, learned=None):
+    mailmap = Mailmap(str(path))
+    if learned:
+        mailmap.learn(learned)
+    mailmap.build(users, UserMatcher(users, aliases))
+    return mailmap
+
+
+def test_round_trip_preserves_entries_and_version(tmp_path):
+    path = tmp_path / 'users.mailmap'
+    first = build(path, learned={('Robert', 'robert@home.org'): 'bob', ('cc', 'cc@home.org'): 'carol'})
+    assert first.email_rules == {'alice@x.com': ('alice', 'Alice@X.com'), 'bob@x.com': ('bob', 'bob@x.com')}
+    
+    loaded = Mailmap(str(path))
+    assert loaded.email_rules == first.email_rules
+    assert loaded.learned == first.learned
+    assert loaded.render() == path.read_text(encoding='utf-8')
+    
+    # 内容不变时不重写文件，版本不变
+    mtime = path.stat().st_mtime_ns
+    second = build(path)
+    assert second.version == first.version
+    assert path.stat().st_mtime_ns == mtime
+
+
+def test_build_revalidates_learned_identities(tmp_path):
+    path = tmp_path / 'users.mailmap'
+    build(path, learned={('Robert', 'robert@home.org'): 'bob'})
+    
+    # 别名撤销后，已学习身份不再匹配到用户，下次生成时移除
+    rebuilt = build(path, aliases={})
+    assert rebuilt.learned == {}
+    assert Mailmap(str(path)).learned == {}
+
+
+def test_learn_skips_identities_covered_or_unrepresentable(tmp_path):
+    mailmap = build(tmp_path / 'users.mailmap')
+    assert mailmap.learn({
+        ('alice', 'alice@other.org'): 'alice',
+        ('Alice Smith', 'alice@x.com'): 'alice',
+        ('Evil <x>', 'e@x.com'): 'bob',
+        ('Unknown', 'u@x.com'): None,
+        ('Bobby', 'bobby@home.org'): 'bob',
+    }) == 1
+    assert mailmap.learned == {('Bobby', 'bobby@home.org'): 'bob'}
+
+
+def test_lookup_matches_git_check_mailmap(tmp_path, git_repo):
+    path = tmp_path / 'users.mailmap'
+    mailmap = build(path, learned={('Robert', 'robert@home.org'): 'bob', ('cc', 'cc@home.org'): 'carol'})
+    
+    identities = [
+        ('Alice Smith', 'ALICE@x.com'),
+        ('robert', 'Robert@Home.org'),
+        ('cc', 'cc@home.org'),
+        ('Robert', 'robert@work.org'),
+        ('Stranger', 's@x.com'),
+    ]
+    contacts = [f"{name} <{email}>" for name, email in identities]
+    output = git_repo.run('-c', f"mailmap.file={path}", 'check-mailmap', *contacts)
+    
+    expected = [f"{name} <{email}>" for name, email in (mailmap.lookup(*identity) for identity in identities)]
+    assert output.splitlines() == expected
+    assert expected[:3] == ['alice <Alice@X.com>', 'bob <bob@x.com>', 'carol <cc@home.org>']
+
+
+def test_alias_and_login_take_precedence_over_email_rules(tmp_path, git_repo):
+    path = tmp_path / 'users.mailmap'
+    mailmap = build(path)
+    matcher = UserMatcher(USERS, ALIASES)
+    # 作者名是 bob 的别名或登录名，邮箱却是 alice 的：UserMatcher 按作者名匹配
+    conflicts = [('Robert', 'alice@x.com'), ('bob', 'Alice@X.com')]
+    assert [matcher.match(*identity) for identity in conflicts] == ['bob', 'bob']
+    for identity in conflicts:
+        git_repo.commit('a.txt', 1, *identity, '2025-10-02T10:00:00+00:00')
+    
+    # git log 按邮箱规则输出 alice，同时带出原始作者，统计时以原始作者为准并学习该身份
+    git_ops = GitOperations(mailmap_file=str(path))
+    commits = git_ops.get_commits_with_stats(git_repo.path)
+    assert {commit['author']['name'] for commit in commits} == {'alice'}
+    partial = aggregate_commits(commits, matcher)
+    assert set(partial['users']) == {'bob'}
+    assert mailmap.learn(partial['identities']) == 2
+    mailmap.write()
+    
+    # 学习后 git、lookup 和 UserMatcher 三者一致
+    contacts = [f"{name} <{email}>" for name, email in conflicts]
+    output = git_repo.run('-c', f"mailmap.file={path}", 'check-mailmap', *contacts)
+    assert output.splitlines() == ['bob <bob@x.com>'] * 2
+    assert [mailmap.lookup(*identity) for identity in conflicts] == [('bob', 'bob@x.com')] * 2
+    commits = git_ops.get_commits_with_stats(git_repo.path)
+    assert {commit['author']['name'] for commit in commits} == {'bob'}
+    partial = aggregate_commits(commits, matcher)
+    assert set(partial['users']) == {'bob'} and partial['identities'] == {}
+    
+    # 重新生成时已学习的冲突身份通过验证，保留下来
+    assert set(build(path).learned) == set(conflicts)
+    
+    # 提交 API 的记录经 apply 后同样保留原始作者
+    records = [{'author': {'name': 'cc', 'email': 'bob@x.com'}, 'commit': {'committer': {'date': '2025-10-02T10:00:00+00:00'}}}]
+    mailmap.apply(records)
+    assert records[0]['author']['raw'] == ['cc', 'bob@x.com']
+    assert set(aggregate_commits(records, matcher)['users']) == {'carol'}
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+路径分布测试：numstat 重命名路径和带引号路径的解析、语言识别和按提交汇总
+"""
+
+import pytest
+
+from path_breakdown import ROOT_DIRECTORY, OTHER_LANGUAGE, PathTrie, language_of, resolve_path
+
+
+@pytest.mark.parametrize('raw, expected', [
+    ('src/app.py', 'src/app.py'),
+    ('src/{old => new}/app.py', 'src/new/app.py'),
+    ('src/{ => new}/app.py', 'src/new/app.py'),
+    ('src/{old => }/app.py', 'src/app.py'),
+    ('{a => b}/{c => d}.py', 'b/d.py'),
+    ('old.py => new/app.py', 'new/app.py'),
+    # 含特殊字符的路径带引号，重命名时新旧路径各自加引号
+    ('"a\\"b.py"', 'a"b.py'),
+    ('"tab\\tx.py" => "tab\\ty.py"', 'tab\ty.py'),
+    ('"d/\\344\\270\\255.py" => "e/\\346\\226\\207.py"', 'e/文.py'),
+    ('"x \\" => y.py" => "z.py"', 'z.py'),
+    ('plain.py => "tab\\tz.py"', 'tab\tz.py'),
+])
+def test_resolve_path(raw, expected):
+    assert resolve_path(raw) == expected
+
+
+@pytest.mark.parametrize('path, language', [
+    ('src/app.py', 'Python'),
+    ('web/App.TSX', 'TypeScript'),
+    ('Dockerfile', 'Dockerfile'),
+    ('deploy/Dockerfile.prod', 'Dockerfile'),
+    ('CMakeLists.txt', 'CMake'),
+    ('LICENSE', OTHER_LANGUAGE),
+    ('data.unknown', OTHER_LANGUAGE),
+])
+def test_language_of(path, language):
+    assert language_of(path) == language
+
+
+def test_summarize_groups_by_language_and_top_dir():
+    trie = PathTrie()
+    summary = trie.summarize([
+        ('src/a.py', 3, 1),
+        ('src/{old => new}/b.py', 2, 0),
+        ('setup.py', 1, 1),
+        ('"docs/\\344\\270\\255.md"', 5, 0),
+        ('logo.png', 0, 0),
+    ])
+    assert sorted(summary) == [
+        ['Markdown', 'docs', 5],
+        ['Python', ROOT_DIRECTORY, 2],
+        ['Python', 'src', 6],
+    ]
+    assert trie.classify('src/new/b.py') == ('Python', 'src')
+
+
+def test_git_numstat_renames_resolve_to_new_paths(git_repo):
+    """用真实的 git log --numstat 输出检查重命名和带引号的路径"""
+    git_repo.commit('src/old/m.py', 3, 'alice', 'a@x.com', '2025-10-01T10:00:00+00:00')
+    git_repo.commit('d/中.py', 2, 'alice', 'a@x.com', '2025-10-01T11:00:00+00:00')
+    git_repo.run('mv', 'src/old', 'src/new')
+    git_repo.run('mv', 'd/中.py', 'd/文.py')
+    # commit 只 add 指定文件，已暂存的两个重命名一起提交
+    git_repo.commit('src/new/m.py', 1, 'alice', 'a@x.com', '2025-10-02T10:00:00+00:00')
+    
+    output = git_repo.run('-c', 'core.quotepath=on', 'log', '-1', '-M', '--numstat', '--format=')
+    assert '"d/\\344\\270\\255.py" => "d/\\346\\226\\207.py"' in output
+    paths = sorted(resolve_path(line.split('\t', 2)[2]) for line in output.splitlines() if line)
+    assert paths == ['d/文.py', 'src/new/m.py']
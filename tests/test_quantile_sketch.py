@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+KLL 分位数草图测试：精确模式、秩误差、合并和 JSON 往返
+"""
+
+import json
+import random
+
+import pytest
+
+from quantile_sketch import KLLSketch
+
+
+QUANTILES = [0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99]
+
+
+def shuffled(n, seed=7):
+    values = list(range(n))
+    random.Random(seed).shuffle(values)
+    return values
+
+
+def assert_rank_error(sketch, n, tolerance):
+    """值为 0..n-1 时 q 分位数的秩就是值本身"""
+    for q in QUANTILES:
+        assert abs(sketch.quantile(q) - q * n) <= tolerance * n, q
+
+
+def test_small_input_is_exact():
+    sketch = KLLSketch()
+    for value in [5, 1, 4, 2, 3]:
+        sketch.update(value)
+    assert sketch.is_exact()
+    assert sketch.quantile(0.5) == 3
+    # 与 numpy.percentile 一样线性插值
+    assert sketch.quantile(0.1) == pytest.approx(1.4)
+    assert KLLSketch().quantile(0.5) is None
+
+
+def test_weighted_update_counts_repeats():
+    weighted, repeated = KLLSketch(), KLLSketch()
+    for value, weight in [(1, 3), (10, 5), (100, 2)]:
+        weighted.update(value, weight)
+        for _ in range(weight):
+            repeated.update(value)
+    assert weighted.count == 10
+    assert sum(weight for _, weight in weighted.weighted_items()) == 10
+    for q in QUANTILES:
+        assert weighted.quantile(q) in (1, 10, 100)
+    assert weighted.quantile(0.5) == repeated.quantile(0.5) == 10
+
+
+@pytest.mark.parametrize('n', [10000, 200000])
+def test_rank_error_within_bound(n):
+    sketch = KLLSketch()
+    for value in shuffled(n):
+        sketch.update(value)
+    assert not sketch.is_exact()
+    assert sketch.count == n
+    assert (sketch.min, sketch.max) == (0, n - 1)
+    assert sum(weight for _, weight in sketch.weighted_items()) == n
+    # k=200 的秩误差约 1.7 / k，允许约 3 倍
+    assert_rank_error(sketch, n, 0.025)
+    assert len(sketch.weighted_items()) < 4 * sketch.k
+
+
+def test_merge_matches_single_sketch():
+    n = 100000
+    values = shuffled(n)
+    parts = [KLLSketch() for _ in range(8)]
+    for i, value in enumerate(values):
+        parts[i % len(parts)].update(value)
+    
+    merged = KLLSketch()
+    for part in parts:
+        merged.merge(part)
+    assert merged.count == n
+    assert (merged.min, merged.max) == (0, n - 1)
+    assert sum(weight for _, weight in merged.weighted_items()) == n
+    assert_rank_error(merged, n, 0.025)
+
+
+def test_merge_empty_keeps_sketch():
+    sketch = KLLSketch()
+    sketch.update(1)
+    assert sketch.merge(KLLSketch()).count == 1
+    assert sketch.merge(None).quantile(0.5) == 1
+
+
+def test_json_round_trip_preserves_quantiles_and_merging():
+    sketch = KLLSketch()
+    for value in shuffled(20000):
+        sketch.update(value)
+    restored = KLLSketch.from_dict(json.loads(json.dumps(sketch.to_dict())))
+    assert restored.count == sketch.count
+    for q in QUANTILES:
+        assert restored.quantile(q) == sketch.quantile(q)
+    
+    # 还原后的草图可以继续合并
+    other = KLLSketch()
+    for value in range(20000, 40000):
+        other.update(value)
+    restored.merge(other)
+    assert restored.count == 40000
+    assert_rank_error(restored, 40000, 0.025)
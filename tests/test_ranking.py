@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+综合排名测试：log1p z-score 综合得分、单次提交截断、并列、单用户和零方差输入、bootstrap 名次置信区间，以及未安装 numpy 时的退化
+"""
+
+import math
+
+import pytest
+
+import ranking
+from ranking import RankingEngine, DEFAULT_WEIGHTS, NUMPY_AVAILABLE
+from quantile_sketch import KLLSketch
+
+
+needs_numpy = pytest.mark.skipif(not NUMPY_AVAILABLE, reason='综合排名需要 numpy')
+
+
+def make_input(users):
+    """users 为 {用户: (单次提交代码行数列表, 活跃天数, 仓库数)}"""
+    user_stats = {}
+    sketches = {}
+    for username, (sizes, days, repos) in users.items():
+        sketch = KLLSketch()
+        for size in sizes:
+            sketch.update(size)
+        sketches[username] = sketch
+        user_stats[username] = {'commits': len(sizes), 'active_days': days, 'repos_count': repos}
+    return user_stats, sketches
+
+
+def zscores(values):
+    mean = sum(values) / len(values)
+    std = math.sqrt(sum((value - mean) ** 2 for value in values) / len(values))
+    return [(value - mean) / std if std > 0 else 0.0 for value in values]
+
+
+USERS = {
+    'alice': ([10, 20, 30, 40], 4, 2),
+    'bob': ([5, 5], 2, 1),
+    'carol': ([100], 1, 3),
+    'dave': ([1, 2, 3, 4, 5, 6], 5, 1),
+}
+
+
+@needs_numpy
+def test_composite_is_weighted_sum_of_log1p_zscores():
+    user_stats, sketches = make_input(USERS)
+    result = RankingEngine(cap_percentile=100, bootstrap_rounds=0).rank(user_stats, sketches)
+    
+    names = list(USERS)
+    lines = zscores([math.log1p(sum(USERS[u][0])) for u in names])
+    commits = zscores([math.log1p(len(USERS[u][0])) for u in names])
+    days = zscores([USERS[u][1] for u in names])
+    repos = zscores([USERS[u][2] for u in names])
+    for i, username in enumerate(names):
+        expected = (DEFAULT_WEIGHTS['lines'] * lines[i] + DEFAULT_WEIGHTS['commits'] * commits[i]
+                    + DEFAULT_WEIGHTS['days'] * days[i] + DEFAULT_WEIGHTS['repos'] * repos[i])
+        assert result[username]['score'] == pytest.approx(expected, abs=1e-4)
+        assert result[username]['capped_lines'] == sum(USERS[username][0])
+    
+    by_score = sorted(names, key=lambda u: -result[u]['score'])
+    assert [result[u]['rank'] for u in by_score] == [1, 2, 3, 4]
+    # 没有 bootstrap 时置信区间就是名次本身
+    assert all(result[u]['rank_ci'] == [result[u]['rank']] * 2 for u in names)
+    assert result['carol']['median_commit_lines'] == 100.0
+
+
+@needs_numpy
+def test_cap_percentile_limits_single_commits():
+    users = dict(USERS, eve=([1, 1, 1, 50000], 1, 1))
+    user_stats, sketches = make_input(users)
+    
+    uncapped = RankingEngine(cap_percentile=100, bootstrap_rounds=0).rank(user_stats, sketches)
+    capped = RankingEngine(cap_percentile=90, bootstrap_rounds=0).rank(user_stats, sketches)
+    
+    # 全部 17 次提交的 90 分位数（与 numpy.percentile 一样线性插值）
+    sizes = sorted(size for user_sizes, _, _ in users.values() for size in user_sizes)
+    position = 0.9 * (len(sizes) - 1)
+    cap = sizes[int(position)] + (position - int(position)) * (sizes[int(position) + 1] - sizes[int(position)])
+    assert uncapped['eve']['capped_lines'] == 50003
+    assert capped['eve']['capped_lines'] == round(3 + cap)
+    assert capped['carol']['capped_lines'] == round(min(100, cap))
+    assert capped['dave']['capped_lines'] == 21
+    assert capped['eve']['score'] < uncapped['eve']['score']
+
+
+@needs_numpy
+def test_ties_share_score_and_percentile():
+    users = {'alice': ([3, 4], 2, 1), 'bob': ([3, 4], 2, 1), 'carol': ([1], 1, 1)}
+    user_stats, sketches = make_input(users)
+    result = RankingEngine(bootstrap_rounds=0).rank(user_stats, sketches)
+    
+    assert result['alice']['score'] == result['bob']['score']
+    # 并列时按输入顺序给出不同名次，百分位取平均
+    assert (result['alice']['rank'], result['bob']['rank'], result['carol']['rank']) == (1, 2, 3)
+    assert result['alice']['percentiles'] == result['bob']['percentiles']
+    assert result['alice']['percentiles']['lines'] == pytest.approx(200 / 3, abs=0.1)
+
+
+@needs_numpy
+def test_single_user_and_zero_variance():
+    user_stats, sketches = make_input({'alice': ([10, 20], 2, 1)})
+    single = RankingEngine(seed=1).rank(user_stats, sketches)
+    assert single['alice']['score'] == 0
+    assert (single['alice']['rank'], single['alice']['rank_ci']) == (1, [1, 1])
+    assert single['alice']['percentiles'] == {'lines': 50.0, 'commits': 50.0, 'days': 50.0, 'repos': 50.0}
+    
+    # 所有用户完全相同：标准差为 0，得分都是 0，不出现 NaN
+    user_stats, sketches = make_input({name: ([7, 7], 1, 1) for name in ('a', 'b', 'c')})
+    same = RankingEngine(seed=1).rank(user_stats, sketches)
+    assert [same[name]['score'] for name in ('a', 'b', 'c')] == [0, 0, 0]
+    assert sorted(same[name]['rank'] for name in same) == [1, 2, 3]
+    assert all(1 <= low <= high <= 3 for low, high in (same[name]['rank_ci'] for name in same))
+
+
+@needs_numpy
+def test_seeded_bootstrap_ci_is_reproducible_and_covers_rank():
+    users = dict(USERS, top=([200] * 40, 30, 6))
+    user_stats, sketches = make_input(users)
+    
+    first = RankingEngine(bootstrap_rounds=300, seed=42).rank(user_stats, sketches)
+    second = RankingEngine(bootstrap_rounds=300, seed=42).rank(user_stats, sketches)
+    assert {u: first[u]['rank_ci'] for u in first} == {u: second[u]['rank_ci'] for u in second}
+    
+    for data in first.values():
+        low, high = data['rank_ci']
+        assert 1 <= low <= data['rank'] <= high <= len(users)
+    # 各项指标都遥遥领先的用户在每次重采样中都排第一
+    assert first['top']['rank_ci'] == [1, 1]
+
+
+@needs_numpy
+def test_users_without_commits_or_sketches_are_skipped():
+    user_stats, sketches = make_input(USERS)
+    user_stats['ghost'] = {'commits': 0, 'active_days': 0, 'repos_count': 0}
+    del sketches['dave']
+    result = RankingEngine(bootstrap_rounds=0).rank(user_stats, sketches)
+    assert set(result) == {'alice', 'bob', 'carol'}
+    assert RankingEngine().rank({}, {}) == {}
+
+
+def test_without_numpy_ranking_is_disabled(monkeypatch):
+    monkeypatch.setattr(ranking, 'NUMPY_AVAILABLE', False)
+    engine = RankingEngine()
+    assert not engine.enabled
+    user_stats, sketches = make_input(USERS)
+    assert engine.rank(user_stats, sketches) == {}
+
+
+def test_parse_weights_ignores_unknown_and_invalid_items():
+    assert RankingEngine.parse_weights('lines:0.5, commits:x,stars:1,days:0.1') == {'lines': 0.5, 'days': 0.1}
+    assert RankingEngine.parse_weights('') == {}
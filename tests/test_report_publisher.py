@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+报告发布测试：新增、更新、内容不变时跳过，以及 sha 冲突后重新读取再提交
+"""
+
+import base64
+import hashlib
+
+import pytest
+
+from report_publisher import ReportPublisher
+
+
+class FakeGiteaAPI:
+    """内存中的文档仓库，按 Gitea 批量文件接口的规则检查 sha"""
+    
+    def __init__(self, files=None):
+        self.files = {}
+        self.calls = []
+        # 每次 change_files 时先调用，模拟其他运行的并发提交或响应丢失
+        self.before_change = []
+        for path, content in (files or {}).items():
+            self.put(path, content)
+    
+    def put(self, path, content):
+        self.files[path] = (hashlib.sha1(content).hexdigest(), content)
+    
+    def get_file(self, owner, repo_name, path, ref=None):
+        return self.files.get(path)
+    
+    def change_files(self, owner, repo_name, branch, message, files):
+        self.calls.append([dict(operation) for operation in files])
+        if self.before_change:
+            self.before_change.pop(0)(self)
+        for operation in files:
+            existing = self.files.get(operation['path'])
+            if operation['operation'] == 'create' and existing is not None:
+                return 422
+            if operation['operation'] == 'update' and (existing is None or existing[0] != operation['sha']):
+                return 409
+        for operation in files:
+            self.put(operation['path'], base64.b64decode(operation['content']))
+        return 201
+
+
+def write_reports(tmp_path, contents):
+    paths = []
+    for name, content in contents.items():
+        path = tmp_path / name
+        path.write_bytes(content)
+        paths.append(str(path))
+    return paths
+
+
+def publisher(api):
+    return ReportPublisher(api, 'doc/reports', branch='main', directory='/weekly/')
+
+
+def test_creates_all_files_in_one_commit(tmp_path):
+    api = FakeGiteaAPI()
+    files = write_reports(tmp_path, {'report.md': b'# r', 'stats.json': b'{}'})
+    
+    assert publisher(api).publish(files + [None, str(tmp_path / 'missing.md')], 'msg')
+    assert len(api.calls) == 1
+    assert [(op['operation'], op['path']) for op in api.calls[0]] == [('create', 'weekly/report.md'), ('create', 'weekly/stats.json')]
+    assert api.files['weekly/stats.json'][1] == b'{}'
+
+
+def test_updates_only_changed_files(tmp_path):
+    api = FakeGiteaAPI({'weekly/report.md': b'old', 'weekly/stats.json': b'{}'})
+    old_sha = api.files['weekly/report.md'][0]
+    files = write_reports(tmp_path, {'report.md': b'new', 'stats.json': b'{}'})
+    
+    assert publisher(api).publish(files, 'msg')
+    assert api.calls == [[{
+        'operation': 'update',
+        'path': 'weekly/report.md',
+        'sha': old_sha,
+        'content': base64.b64encode(b'new').decode('ascii')
+    }]]
+    assert api.files['weekly/report.md'][1] == b'new'
+
+
+def test_unchanged_files_are_not_committed(tmp_path):
+    api = FakeGiteaAPI({'weekly/report.md': b'same'})
+    files = write_reports(tmp_path, {'report.md': b'same'})
+    
+    assert publisher(api).publish(files, 'msg')
+    assert api.calls == []
+
+
+@pytest.mark.parametrize('path, content, expected', [
+    # 提交前另一个运行改了同一个文件（409）
+    ('weekly/report.md', b'other', {'weekly/report.md': ('update', b'other'), 'weekly/stats.json': ('create', None)}),
+    # 提交前另一个运行先创建了新文件（422）
+    ('weekly/stats.json', b'[]', {'weekly/report.md': ('update', b'old'), 'weekly/stats.json': ('update', b'[]')}),
+])
+def test_conflict_replans_and_retries(tmp_path, path, content, expected):
+    api = FakeGiteaAPI({'weekly/report.md': b'old'})
+    files = write_reports(tmp_path, {'report.md': b'new', 'stats.json': b'{}'})
+    api.before_change.append(lambda repo: repo.put(path, content))
+    
+    assert publisher(api).publish(files, 'msg')
+    assert len(api.calls) == 2
+    # 重新读取后按仓库中的最新 sha 提交，整批仍然是一次提交
+    retried = {op['path']: (op['operation'], op.get('sha')) for op in api.calls[1]}
+    assert retried == {
+        op_path: (operation, hashlib.sha1(base).hexdigest() if base is not None else None)
+        for op_path, (operation, base) in expected.items()
+    }
+    assert api.files['weekly/report.md'][1] == b'new'
+    assert api.files['weekly/stats.json'][1] == b'{}'
+
+
+def test_lost_response_is_not_committed_twice(tmp_path):
+    api = FakeGiteaAPI()
+    files = write_reports(tmp_path, {'report.md': b'new'})
+    
+    def applied_but_lost(repo):
+        repo.put('weekly/report.md', b'new')
+        raise ConnectionError('响应丢失')
+    api.before_change.append(applied_but_lost)
+    
+    assert publisher(api).publish(files, 'msg')
+    assert len(api.calls) == 1
+
+
+def test_gives_up_after_max_attempts_and_on_other_errors(tmp_path):
+    files = write_reports(tmp_path, {'report.md': b'new'})
+    
+    api = FakeGiteaAPI({'weekly/report.md': b'old'})
+    api.before_change = [lambda repo, n=n: repo.put('weekly/report.md', f"other {n}".encode()) for n in range(5)]
+    assert not publisher(api).publish(files, 'msg')
+    assert len(api.calls) == 3
+    
+    api = FakeGiteaAPI()
+    api.change_files = lambda *args: api.calls.append(args) or 500
+    assert not publisher(api).publish(files, 'msg')
+    assert len(api.calls) == 1
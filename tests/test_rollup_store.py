@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日汇总存储测试：借助日汇总拼出的统计必须与完整扫描一致
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from git_operations import GitOperations
+from repo_scanner import UserMatcher, aggregate_commits
+from rollup_store import RollupStore
+from time_utils import parse_datetime
+from hyperloglog import HyperLogLog, merge_distinct
+
+
+REPO = 'o/repo'
+SINCE = '2025-10-01T00:00:00+00:00'
+UNTIL = '2025-10-11T00:00:00+00:00'
+MATCHER = UserMatcher({'alice': {'email': 'a@x.com'}, 'bob': {'email': 'b@x.com'}}, {})
+
+
+def totals(per_user):
+    """{用户: (提交数, 新增, 删除, 活跃天)}"""
+    return {
+        username: (data['commits'], data['additions'], data['deletions'], sorted(data['days']))
+        for username, data in per_user.items()
+    }
+
+
+def full_scan(repo_path):
+    commits = GitOperations().get_commits_with_stats(repo_path, SINCE, UNTIL)
+    return totals(aggregate_commits(commits, MATCHER)['users'])
+
+
+def rollup_scan(repo_path, store, distinct_precision=None):
+    """与 StatsCollector 相同：扫描未汇总的时间段、写入汇总，再合并已汇总的天"""
+    git_ops = GitOperations()
+    plan = store.plan(REPO, parse_datetime(SINCE), parse_datetime(UNTIL))
+    commits = []
+    for start, end in plan['scan_ranges']:
+        commits.extend(git_ops.get_commits_with_stats(repo_path, start.isoformat(), end.isoformat()))
+    partial = aggregate_commits(commits, MATCHER, plan['scanned_days'], distinct_precision=distinct_precision)
+    store.save(REPO, plan['scanned_days'], partial['rollups'])
+    
+    merged = {username: dict(data) for username, data in partial['users'].items()}
+    for username, data in store.load(REPO, plan['covered_days']).items():
+        entry = merged.setdefault(username, {'commits': 0, 'additions': 0, 'deletions': 0, 'days': set()})
+        entry['commits'] += data['commits']
+        entry['additions'] += data['additions']
+        entry['deletions'] += data['deletions']
+        entry['days'] = merge_distinct(entry['days'], data['days'])
+    return merged, plan
+
+
+def make_history(git_repo):
+    git_repo.commit('a.py', 3, 'alice', 'a@x.com', '2025-10-02T10:00:00+00:00')
+    git_repo.commit('b.py', 2, 'bob', 'b@x.com', '2025-10-03T23:30:00+08:00')
+    # 作者时间在窗口之前、提交时间在窗口之内（rebase / cherry-pick）
+    git_repo.commit('a.py', 5, 'alice', 'a@x.com', '2025-09-28T10:00:00+00:00', '2025-10-05T10:00:00+00:00')
+    # 作者时间在窗口之内、提交时间在窗口之后，两种扫描都不统计
+    git_repo.commit('b.py', 7, 'bob', 'b@x.com', '2025-10-09T10:00:00+00:00', '2025-10-12T10:00:00+00:00')
+    git_repo.commit('c.py', 1, 'alice', 'a@x.com', '2025-10-10T08:00:00+00:00')
+
+
+def test_rollups_match_full_scan(git_repo, tmp_path):
+    make_history(git_repo)
+    expected = full_scan(git_repo.path)
+    assert expected['alice'][0] == 3
+    
+    store = RollupStore(str(tmp_path / 'rollup.db'))
+    first, plan = rollup_scan(git_repo.path, store)
+    assert plan['covered_days'] == []
+    assert totals(first) == expected
+    
+    second, plan = rollup_scan(git_repo.path, store)
+    assert plan['scan_ranges'] == []
+    assert totals(second) == expected
+
+
+def test_rollup_bucketed_by_committer_day(git_repo, tmp_path):
+    make_history(git_repo)
+    store = RollupStore(str(tmp_path / 'rollup.db'))
+    rollup_scan(git_repo.path, store)
+    
+    # 作者时间 09-28 的提交按提交时间记入 10-05，活跃天仍为作者日期
+    loaded = store.load(REPO, ['2025-10-05'])
+    assert loaded['alice']['commits'] == 1
+    assert loaded['alice']['additions'] == 5
+    assert loaded['alice']['days'] == {'2025-09-28'}
+
+
+def test_split_window_only_complete_days():
+    head, days, tail = RollupStore.split_window(parse_datetime('2025-10-01T12:00:00+00:00'),
+                                                parse_datetime('2025-10-04T06:00:00+00:00'))
+    assert head == (parse_datetime('2025-10-01T12:00:00+00:00'), parse_datetime('2025-10-02T00:00:00+00:00'))
+    assert [RollupStore.day_key(day) for day in days] == ['2025-10-02', '2025-10-03']
+    assert tail == (parse_datetime('2025-10-04T00:00:00+00:00'), parse_datetime('2025-10-04T06:00:00+00:00'))
+
+
+def test_split_window_keeps_recent_days_unsettled():
+    now = datetime.now(timezone.utc)
+    head, days, tail = RollupStore.split_window(now - timedelta(days=10), None, settle_days=3)
+    assert days[-1] + timedelta(days=1) <= now - timedelta(days=3)
+    assert tail[0] == days[-1] + timedelta(days=1)
+    assert now - tail[1] < timedelta(seconds=5)
+
+
+def test_attribution_change_rescans_covered_days(git_repo, tmp_path):
+    make_history(git_repo)
+    store = RollupStore(str(tmp_path / 'rollup.db'))
+    store.attribution = 'v1'
+    rollup_scan(git_repo.path, store)
+    
+    _, plan = rollup_scan(git_repo.path, store)
+    assert plan['scan_ranges'] == []
+    
+    store.attribution = 'v2'
+    result, plan = rollup_scan(git_repo.path, store)
+    assert plan['covered_days'] == []
+    assert totals(result) == full_scan(git_repo.path)
+    
+    # 重新扫描覆盖了旧汇总，之后以新版本读取
+    result, plan = rollup_scan(git_repo.path, store)
+    assert plan['scan_ranges'] == []
+    assert totals(result) == full_scan(git_repo.path)
+
+
+def test_plan_without_reuse_scans_whole_window(git_repo, tmp_path):
+    make_history(git_repo)
+    store = RollupStore(str(tmp_path / 'rollup.db'))
+    rollup_scan(git_repo.path, store)
+    
+    plan = store.plan(REPO, parse_datetime(SINCE), parse_datetime(UNTIL), reuse=False)
+    assert plan['covered_days'] == []
+    assert plan['scan_ranges'] == [(parse_datetime(SINCE), parse_datetime(UNTIL))]
+    assert len(plan['scanned_days']) == 10
+
+
+def test_logged_only_rescans_days_missing_from_commit_log(git_repo, tmp_path):
+    make_history(git_repo)
+    store = RollupStore(str(tmp_path / 'rollup.db'))
+    _, plan = rollup_scan(git_repo.path, store)
+    
+    since, until = parse_datetime(SINCE), parse_datetime(UNTIL)
+    assert store.plan(REPO, since, until, logged_only=True)['covered_days'] == []
+    
+    store.mark_logged(REPO, plan['scanned_days'])
+    logged_plan = store.plan(REPO, since, until, logged_only=True)
+    assert logged_plan['scan_ranges'] == []
+    assert len(logged_plan['covered_days']) == 10
+
+
+def test_hll_rollups_store_and_merge_day_sketches(git_repo, tmp_path):
+    make_history(git_repo)
+    expected = full_scan(git_repo.path)
+    store = RollupStore(str(tmp_path / 'rollup.db'))
+    rollup_scan(git_repo.path, store, distinct_precision=12)
+    
+    raw = store.conn.execute("SELECT active_days FROM daily_rollup WHERE day = '2025-10-05'").fetchone()[0]
+    assert '"sparse"' in raw
+    
+    # 第二次运行全部来自日汇总，活跃天由保存的草图合并得到
+    merged, plan = rollup_scan(git_repo.path, store, distinct_precision=12)
+    assert plan['scan_ranges'] == []
+    for username, (commits, additions, deletions, days) in expected.items():
+        assert isinstance(merged[username]['days'], HyperLogLog)
+        assert merged[username]['commits'] == commits
+        assert merged[username]['days'].count() == len(days)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+运行快照测试：保存两次运行后按窗口天数读取上一次快照，以及与上次运行相比的名次和指标变化
+"""
+
+from report_generator import ReportGenerator
+from snapshot_store import SnapshotStore
+
+
+def make_stats(users, rankings=None, total_repos=3):
+    """users 为 {用户: (提交数, 代码行数, 活跃天数)}"""
+    user_stats = {
+        username: {
+            'commits': commits,
+            'total_lines': lines,
+            'additions': lines,
+            'deletions': 0,
+            'active_days': days,
+            'repos_count': 1
+        }
+        for username, (commits, lines, days) in users.items()
+    }
+    return {
+        'user_stats': user_stats,
+        'rankings': rankings,
+        'total_repos': total_repos,
+        'total_commits': sum(commits for commits, _, _ in users.values()),
+        'total_lines': sum(lines for _, lines, _ in users.values())
+    }
+
+
+WEEK = ('2025-10-01T00:00:00+00:00', '2025-10-08T00:00:00+00:00')
+NEXT_WEEK = ('2025-10-08T00:00:00+00:00', '2025-10-15T00:00:00+00:00')
+MONTH = ('2025-09-08T00:00:00+00:00', '2025-10-08T00:00:00+00:00')
+
+
+def test_previous_matches_window_days(tmp_path):
+    store = SnapshotStore(str(tmp_path / 'snapshots.db'))
+    assert store.previous(7) is None
+    
+    store.save(make_stats({'alice': (3, 30, 2)}), *WEEK)
+    store.save(make_stats({'alice': (9, 90, 6), 'bob': (1, 5, 1)}), *MONTH)
+    store.close()
+    
+    # 重新打开后仍能读取，按窗口天数选择快照
+    store = SnapshotStore(str(tmp_path / 'snapshots.db'))
+    weekly = store.previous(SnapshotStore.window_days(*NEXT_WEEK))
+    assert (weekly['since'], weekly['until']) == WEEK
+    assert weekly['users']['alice']['commits'] == 3
+    assert weekly['totals'] == {'total_repos': 3, 'total_commits': 3, 'total_lines': 30, 'total_contributors': 1}
+    assert store.previous(30)['users']['bob']['total_lines'] == 5
+    assert store.previous(None) is None
+    
+    # 同一窗口再保存一次，读取最近的一次
+    store.save(make_stats({'bob': (2, 10, 1)}), *NEXT_WEEK)
+    assert set(store.previous(7)['users']) == {'bob'}
+    store.close()
+
+
+def test_deltas_round_trip(tmp_path):
+    store = SnapshotStore(str(tmp_path / 'snapshots.db'))
+    first = make_stats({'alice': (5, 100, 3), 'bob': (2, 40, 2), 'carol': (1, 10, 1), 'idle': (0, 0, 0)})
+    store.save(first, *WEEK)
+    assert store.previous(7)['users']['alice']['rank'] == 1
+    # 没有提交的用户不进入快照
+    assert 'idle' not in store.previous(7)['users']
+    
+    # 本周 bob 超过 alice，carol 离开，dave 新加入；有综合排名时按综合排名排序
+    rankings = {'bob': {'rank': 1, 'score': 1.5}, 'alice': {'rank': 2, 'score': 0.2}, 'dave': {'rank': 3, 'score': -1.7}}
+    second = make_stats({'alice': (4, 80, 3), 'bob': (6, 120, 4), 'dave': (1, 3, 1)}, rankings, total_repos=4)
+    deltas = ReportGenerator.compute_deltas(second, store.previous(SnapshotStore.window_days(*NEXT_WEEK)))
+    
+    assert deltas['previous']['since'] == WEEK[0]
+    assert deltas['users']['bob'] == {'rank_change': 1, 'total_lines': 80, 'commits': 4, 'active_days': 2}
+    assert deltas['users']['alice'] == {'rank_change': -1, 'total_lines': -20, 'commits': -1, 'active_days': 0}
+    # 新用户没有名次变化，指标为本次的值
+    assert deltas['users']['dave'] == {'rank_change': None, 'total_lines': 3, 'commits': 1, 'active_days': 1}
+    assert deltas['dropped_users'] == ['carol']
+    assert deltas['totals'] == {'total_repos': 1, 'total_commits': 3, 'total_lines': 53, 'total_contributors': 0}
+    
+    assert [ReportGenerator._rank_change_str(deltas['users'][u]) for u in ('bob', 'alice', 'dave')] == ['↑1', '↓1', '新']
+    assert ReportGenerator.compute_deltas(second, None) is None
+    
+    # 第二次运行保存后成为下次比较的基准，名次和综合得分一起保存
+    store.save(second, *NEXT_WEEK)
+    latest = store.previous(7)
+    assert {u: (data['rank'], data['score']) for u, data in latest['users'].items()} == {
+        'bob': (1, 1.5), 'alice': (2, 0.2), 'dave': (3, -1.7)
+    }
+    store.close()
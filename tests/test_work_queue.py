@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分布式任务队列测试：不同统计窗口的协调者各自发布当前运行，互不覆盖
+"""
+
+import fnmatch
+
+from work_queue import RedisWorkQueue
+
+
+class FakeClient:
+    """只实现当前运行标记用到的几个 Redis 命令"""
+    
+    def __init__(self):
+        self.data = {}
+    
+    def get(self, key):
+        return self.data.get(key)
+    
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+    
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+    
+    def hset(self, key, mapping=None):
+        self.data.setdefault(key, {}).update(mapping or {})
+    
+    def expire(self, key, seconds):
+        pass
+    
+    def scan_iter(self, match='*'):
+        return [key for key in self.data if fnmatch.fnmatch(key, match)]
+    
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.ops = []
+    
+    def __getattr__(self, name):
+        def op(*args, **kwargs):
+            self.ops.append((name, args, kwargs))
+        return op
+    
+    def execute(self):
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.ops]
+
+
+class FakeCache:
+    def __init__(self):
+        self.client = FakeClient()
+
+
+def test_runs_in_different_windows_do_not_overwrite_each_other():
+    cache = FakeCache()
+    daily = RedisWorkQueue(cache, namespace='daily')
+    monthly = RedisWorkQueue(cache, namespace='monthly')
+    daily.start({})
+    monthly.start({})
+    
+    assert daily.is_current() and monthly.is_current()
+    assert RedisWorkQueue.current(cache, namespace='daily').run_id == daily.run_id
+    assert RedisWorkQueue.current(cache, namespace='monthly').run_id == monthly.run_id
+    
+    daily.close()
+    assert RedisWorkQueue.current(cache, namespace='daily') is None
+    assert monthly.is_current()
+    
+    # 工作节点不指定窗口时加入任一进行中的运行
+    joined = RedisWorkQueue.current(cache)
+    assert (joined.run_id, joined.namespace) == (monthly.run_id, 'monthly')
+    
+    monthly.close()
+    assert RedisWorkQueue.current(cache) is None
+
+
+def test_close_keeps_newer_run_in_same_window():
+    cache = FakeCache()
+    old = RedisWorkQueue(cache, namespace='daily')
+    old.start({})
+    new = RedisWorkQueue(cache, namespace='daily')
+    new.start({})
+    
+    assert not old.is_current()
+    old.close()
+    assert RedisWorkQueue.current(cache, namespace='daily').run_id == new.run_id
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+限流模块
+负责对 Gitea 服务器的 HTTP 请求和 Git 拉取做自适应并发控制、退避和重试
+"""
+
+import time
+import random
+import threading
+
+
+class AdaptiveLimiter:
+    """自适应并发控制类（AIMD：成功时线性增加并发，被限流或延迟升高时减半）"""
+    
+    def __init__(self, name, max_limit=8, min_limit=1, initial=None, latency_factor=2.0, group=None):
+        self.name = name
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = float(initial or self.max_limit)
+        self.latency_factor = latency_factor
+        
+        self.in_flight = 0
+        self.cond = threading.Condition()
+        self.paused_until = 0.0
+        
+        self.latency_ewma = None
+        self.latency_baseline = None
+        self.success_count = 0
+        self.throttled_count = 0
+        self.slow_count = 0
+        self.retry_count = 0
+        
+        # 同一组的控制器共享退避：HTTP 被限流时 Git 拉取也一起放慢
+        self.group = group if group is not None else []
+        self.group.append(self)
+    
+    def acquire(self):
+        """等待直到有空闲并发名额"""
+        with self.cond:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait > 0:
+                    self.cond.wait(wait)
+                    continue
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                self.cond.wait(1.0)
+    
+    def release(self):
+        """归还并发名额"""
+        with self.cond:
+            self.in_flight -= 1
+            self.cond.notify_all()
+    
+    def record(self, latency, throttled=False):
+        """记录一次调用结果，调整并发上限"""
+        with self.cond:
+            if throttled:
+                self.throttled_count += 1
+            else:
+                self.success_count += 1
+                self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+                self.latency_baseline = latency if self.latency_baseline is None else min(
+                    0.98 * self.latency_baseline + 0.02 * latency, self.latency_ewma
+                )
+                if self.latency_ewma > self.latency_baseline * self.latency_factor:
+                    # 延迟明显升高，说明服务器开始吃力，小步降低并发
+                    self.slow_count += 1
+                    self.limit = max(self.min_limit, self.limit - 1)
+                else:
+                    self.limit = min(self.max_limit, self.limit + 1.0 / max(1.0, self.limit))
+            self.cond.notify_all()
+        
+        if throttled:
+            for limiter in self.group:
+                limiter.backoff()
+    
+    def backoff(self, pause_seconds=0.0):
+        """被限流时并发减半，并可暂停发起新请求一段时间"""
+        with self.cond:
+            self.limit = max(self.min_limit, self.limit / 2)
+            if pause_seconds > 0:
+                self.paused_until = max(self.paused_until, time.monotonic() + pause_seconds)
+            self.cond.notify_all()
+    
+    def pause(self, pause_seconds):
+        """暂停整组控制器发起新请求（例如服务端返回 Retry-After）"""
+        for limiter in self.group:
+            with limiter.cond:
+                limiter.paused_until = max(limiter.paused_until, time.monotonic() + pause_seconds)
+                limiter.cond.notify_all()
+    
+    def metrics(self):
+        """返回当前并发上限和统计，用于运行指标"""
+        with self.cond:
+            return {
+                'limit': int(self.limit),
+                'max_limit': self.max_limit,
+                'in_flight': self.in_flight,
+                'success': self.success_count,
+                'throttled': self.throttled_count,
+                'slow': self.slow_count,
+                'retries': self.retry_count,
+                'latency_ewma_ms': round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+                'latency_baseline_ms': round(self.latency_baseline * 1000, 1) if self.latency_baseline is not None else None
+            }
+
+
+class RetryPolicy:
+    """带抖动的指数退避重试策略"""
+    
+    def __init__(self, max_retries=4, base_delay=1.0, max_delay=60.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+    
+    def delay(self, attempt, retry_after=None):
+        """第 attempt 次重试前的等待秒数（full jitter），服务端给出 Retry-After 时以其为下限"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after:
+            delay = max(delay, min(self.max_delay, retry_after))
+        return delay
+
+
+def parse_retry_after(value):
+    """解析 Retry-After 响应头（只支持秒数格式）"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+时间工具模块
+负责解析 Gitea API 和 Git 输出中的时间字符串，以及按 UTC 天分组，供各模块共用
+"""
+
+from datetime import datetime, timezone
+
+
+def parse_datetime(dt_str):
+    """解析 datetime 字符串，返回带时区的 datetime 对象"""
+    if not dt_str:
+        return None
+    
+    if isinstance(dt_str, str):
+        dt_str = dt_str.replace('Z', '+00:00')
+        dt = datetime.fromisoformat(dt_str)
+        
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        
+        return dt
+    
+    if dt_str.tzinfo is None:
+        return dt_str.replace(tzinfo=timezone.utc)
+    
+    return dt_str
+
+
+def day_key(dt):
+    """返回 datetime 对应的 UTC 日期字符串"""
+    return dt.astimezone(timezone.utc).strftime('%Y-%m-%d')
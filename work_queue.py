@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分布式任务队列模块
+负责通过 Redis 在协调者和多个工作节点之间分发仓库扫描任务（带租约）并回收部分结果
+"""
+
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+
+
+# 原子地取出一个任务并登记租约
+CLAIM_SCRIPT = """
+local job_id = redis.call('RPOP', KEYS[1])
+if job_id then
+    redis.call('ZADD', KEYS[2], ARGV[1], job_id)
+end
+return job_id
+"""
+
+# 把租约过期且未完成的任务放回待处理队列
+REQUEUE_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], 0, ARGV[1])
+local count = 0
+for _, job_id in ipairs(expired) do
+    redis.call('ZREM', KEYS[1], job_id)
+    if redis.call('SISMEMBER', KEYS[3], job_id) == 0 then
+        redis.call('LPUSH', KEYS[2], job_id)
+        count = count + 1
+    end
+end
+return count
+"""
+
+# 提交结果：同一任务只接受第一次完成的结果，重复执行的结果直接丢弃
+COMPLETE_SCRIPT = """
+redis.call('ZREM', KEYS[1], ARGV[1])
+if redis.call('SADD', KEYS[2], ARGV[1]) == 1 then
+    redis.call('HSET', KEYS[3], ARGV[1], ARGV[2])
+    redis.call('LPUSH', KEYS[4], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+
+class RedisWorkQueue:
+    """基于 Redis 的带租约任务队列类"""
+    
+    # 当前运行按统计窗口分键，不同窗口的协调者（如 cron 与手动运行）互不覆盖
+    CURRENT_RUN_PREFIX = 'gitea:queue:current'
+    
+    def __init__(self, redis_cache, run_id=None, lease_seconds=900, key_ttl=2 * 86400, namespace='default'):
+        self.client = redis_cache.client
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.lease_seconds = lease_seconds
+        self.key_ttl = key_ttl
+        self.namespace = namespace
+        self.current_key = f"{self.CURRENT_RUN_PREFIX}:{namespace}"
+        
+        prefix = f"gitea:queue:{self.run_id}"
+        self.keys = {
+            'pending': f"{prefix}:pending",
+            'leases': f"{prefix}:leases",
+            'jobs': f"{prefix}:jobs",
+            'done': f"{prefix}:done",
+            'results': f"{prefix}:results",
+            'finished': f"{prefix}:finished",
+            'meta': f"{prefix}:meta"
+        }
+    
+    @classmethod
+    def current(cls, redis_cache, lease_seconds=900, namespace=None):
+        """连接协调者当前发布的运行，不指定 namespace 时取任一窗口进行中的运行，没有时返回 None"""
+        client = redis_cache.client
+        if namespace is not None:
+            keys = [f"{cls.CURRENT_RUN_PREFIX}:{namespace}"]
+        else:
+            keys = sorted(client.scan_iter(match=f"{cls.CURRENT_RUN_PREFIX}:*"))
+        for key in keys:
+            run_id = client.get(key)
+            if run_id:
+                return cls(redis_cache, run_id, lease_seconds, namespace=key[len(cls.CURRENT_RUN_PREFIX) + 1:])
+        return None
+    
+    def is_current(self):
+        """本运行仍是所在窗口当前发布的运行"""
+        return self.client.get(self.current_key) == self.run_id
+    
+    def start(self, context):
+        """协调者发布一次运行，context 为工作节点需要的共享数据（用户表、别名等）"""
+        pipe = self.client.pipeline()
+        pipe.hset(self.keys['meta'], mapping={
+            'context': json.dumps(context, ensure_ascii=False),
+            'discovery_done': 0,
+            'total': 0,
+            'started_at': time.time()
+        })
+        pipe.set(self.current_key, self.run_id, ex=self.key_ttl)
+        pipe.execute()
+        self._touch()
+        print(f"分布式运行已发布: {self.run_id}（窗口 {self.namespace}）")
+    
+    def context(self):
+        """读取协调者发布的共享数据"""
+        raw = self.client.hget(self.keys['meta'], 'context')
+        return json.loads(raw) if raw else {}
+    
+    def push(self, job_id, job):
+        """协调者推送一个任务"""
+        pipe = self.client.pipeline()
+        pipe.hset(self.keys['jobs'], job_id, json.dumps(job, ensure_ascii=False))
+        pipe.lpush(self.keys['pending'], job_id)
+        pipe.hincrby(self.keys['meta'], 'total', 1)
+        pipe.execute()
+    
+    def finish_discovery(self):
+        """协调者标记任务推送完毕"""
+        self.client.hset(self.keys['meta'], 'discovery_done', 1)
+        self._touch()
+    
+    def is_finished(self):
+        """任务推送完毕且全部完成"""
+        meta = self.client.hmget(self.keys['meta'], 'discovery_done', 'total')
+        if meta[0] != '1':
+            return False
+        return self.client.scard(self.keys['done']) >= int(meta[1] or 0)
+    
+    def claim(self):
+        """领取一个任务并登记租约，没有待处理任务时返回 (None, None)"""
+        job_id = self.client.eval(CLAIM_SCRIPT, 2, self.keys['pending'], self.keys['leases'],
+                                  time.time() + self.lease_seconds)
+        if not job_id:
+            return None, None
+        raw = self.client.hget(self.keys['jobs'], job_id)
+        return job_id, json.loads(raw) if raw else None
+    
+    def renew(self, job_id):
+        """延长租约（长任务在关键步骤之间调用）"""
+        self.client.zadd(self.keys['leases'], {job_id: time.time() + self.lease_seconds}, xx=True)
+    
+    @contextmanager
+    def keep_alive(self, job_id):
+        """处理任务期间在后台定期续约，节点崩溃后租约自然过期、任务被重新分发"""
+        stop = threading.Event()
+        
+        def renew_loop():
+            while not stop.wait(self.lease_seconds / 3):
+                self.renew(job_id)
+        
+        thread = threading.Thread(target=renew_loop, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+    
+    def complete(self, job_id, result):
+        """写回任务结果，返回是否被接受"""
+        return bool(self.client.eval(
+            COMPLETE_SCRIPT, 4,
+            self.keys['leases'], self.keys['done'], self.keys['results'], self.keys['finished'],
+            job_id, json.dumps(result, ensure_ascii=False)
+        ))
+    
+    def requeue_expired(self):
+        """把租约过期的任务放回队列，返回放回数量"""
+        count = self.client.eval(REQUEUE_SCRIPT, 3, self.keys['leases'], self.keys['pending'], self.keys['done'],
+                                 time.time())
+        if count:
+            print(f"  {count} 个任务租约过期，已放回队列")
+        return count
+    
+    def next_result(self, timeout=5):
+        """协调者按完成顺序取出一个结果，timeout 为 0 时不等待，没有结果返回 (None, None)"""
+        if timeout > 0:
+            item = self.client.brpop(self.keys['finished'], timeout=timeout)
+            job_id = item[1] if item else None
+        else:
+            job_id = self.client.rpop(self.keys['finished'])
+        if not job_id:
+            return None, None
+        raw = self.client.hget(self.keys['results'], job_id)
+        return job_id, json.loads(raw) if raw else None
+    
+    def progress(self):
+        """返回 (已完成, 总数, 处理中, 待处理)"""
+        pipe = self.client.pipeline()
+        pipe.scard(self.keys['done'])
+        pipe.hget(self.keys['meta'], 'total')
+        pipe.zcard(self.keys['leases'])
+        pipe.llen(self.keys['pending'])
+        done, total, leased, pending = pipe.execute()
+        return done, int(total or 0), leased, pending
+    
+    def close(self):
+        """协调者结束运行，撤下当前运行标记"""
+        if self.is_current():
+            self.client.delete(self.current_key)
+        self._touch()
+    
+    def _touch(self):
+        """给本次运行的所有键设置过期时间，避免残留"""
+        pipe = self.client.pipeline()
+        for key in self.keys.values():
+            pipe.expire(key, self.key_ttl)
+        pipe.execute()